@@ -0,0 +1,209 @@
+# admission.py
+# Admission control for the expensive pipeline stages.
+#
+# A ConcurrencyGate bounds how many requests run a stage at once (LLM calls);
+# a RateGate is a token bucket for an upstream quota (Kanoon searches). Both
+# let a bounded number of callers wait a bounded time and reject the rest, so
+# a burst is shed quickly instead of piling onto the upstream APIs.
+# SharedRateGate keeps a RateGate's quota in limits storage (Redis) so all
+# workers and replicas draw on the same one.
+import asyncio
+import collections
+import logging
+import math
+import time
+
+from limits import RateLimitItemPerSecond
+from limits.strategies import MovingWindowRateLimiter
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """Raised when a gate sheds a request; retry_after is a hint in seconds"""
+    def __init__(self, gate, reason, retry_after):
+        self.gate = gate
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        super().__init__('%s admission rejected (%s)' % (gate, reason))
+
+class ConcurrencyGate:
+    """At most limit holders; up to max_queue more wait (FIFO) for up to max_wait seconds"""
+    FIELDS = ('admitted', 'queued', 'rejected_queue_full', 'rejected_timeout')
+
+    def __init__(self, name, limit, max_queue=0, max_wait=5.0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_use = 0
+        self.waiters = collections.deque()  # futures, resolved when handed a slot
+        self.counts = collections.Counter(dict.fromkeys(self.FIELDS, 0))
+
+    def check(self):
+        """Reject now if acquire() would, so work leading up to the stage can be skipped"""
+        if self.in_use >= self.limit and len(self.waiters) >= self.max_queue:
+            self.counts['rejected_queue_full'] += 1
+            raise AdmissionRejected(self.name, 'queue full', self.max_wait)
+
+    async def acquire(self):
+        """Take a slot, returning the seconds spent queued, or raise AdmissionRejected"""
+        if self.in_use < self.limit and not self.waiters:
+            self.in_use += 1
+            self.counts['admitted'] += 1
+            return 0.0
+        if len(self.waiters) >= self.max_queue:
+            self.counts['rejected_queue_full'] += 1
+            raise AdmissionRejected(self.name, 'queue full', self.max_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.counts['queued'] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self.release()  # Handed a slot as the wait ran out
+            else:
+                self.discard(future)
+            self.counts['rejected_timeout'] += 1
+            raise AdmissionRejected(self.name, 'queue wait timed out', self.max_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Handed a slot just as the caller went away
+            else:
+                self.discard(future)
+            raise
+        self.counts['admitted'] += 1
+        return time.perf_counter() - start
+
+    def discard(self, future):
+        try:
+            self.waiters.remove(future)
+        except ValueError:
+            pass
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter, if any
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+    def as_dict(self):
+        return dict(self.counts, limit=self.limit, in_use=self.in_use, waiting=len(self.waiters))
+
+class RateGate:
+    """Token bucket: rate tokens per second, up to burst banked.
+
+    A caller that finds the bucket empty reserves the next token and sleeps
+    until it is due, unless that is more than max_wait seconds away.
+    """
+    FIELDS = ('admitted', 'queued', 'rejected_rate')
+
+    def __init__(self, name, rate, burst=1, max_wait=2.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.counts = collections.Counter(dict.fromkeys(self.FIELDS, 0))
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Take a token, returning the seconds waited for it, or raise AdmissionRejected"""
+        self.refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            self.counts['admitted'] += 1
+            return 0.0
+        delay = -self.tokens / self.rate
+        if delay > self.max_wait:
+            self.tokens += 1
+            self.counts['rejected_rate'] += 1
+            raise AdmissionRejected(self.name, 'rate limited', delay)
+
+        self.waiting += 1
+        self.counts['queued'] += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.tokens += 1
+            raise
+        finally:
+            self.waiting -= 1
+        self.counts['admitted'] += 1
+        return delay
+
+    def release(self):
+        pass
+
+    def as_dict(self):
+        self.refill()
+        return dict(self.counts, rate=self.rate, tokens=round(self.tokens, 2), waiting=self.waiting)
+
+class SharedRateGate:
+    """A RateGate whose quota is shared through limits storage (e.g. the rate limiter's Redis).
+
+    The bucket is approximated by a moving window of about burst calls per
+    burst / rate seconds. A caller that finds the window full sleeps until
+    its oldest call expires and tries again, unless that would take it past
+    max_wait seconds. If the storage is unreachable calls are let through.
+    """
+    FIELDS = ('admitted', 'queued', 'rejected_rate', 'storage_errors')
+
+    def __init__(self, name, rate, burst, max_wait, storage):
+        self.name = name
+        self.rate = rate
+        self.max_wait = max_wait
+        self.window = max(1, math.ceil(burst / rate))
+        self.item = RateLimitItemPerSecond(max(1, int(rate * self.window)), self.window)
+        self.limiter = MovingWindowRateLimiter(storage)
+        self.waiting = 0
+        self.counts = collections.Counter(dict.fromkeys(self.FIELDS, 0))
+
+    async def acquire(self):
+        """Take a call from the shared window, returning the seconds waited, or raise AdmissionRejected"""
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        queued = False
+        try:
+            while True:
+                try:
+                    if await loop.run_in_executor(None, self.limiter.hit, self.item, self.name):
+                        break
+                    reset_time, _ = await loop.run_in_executor(
+                        None, self.limiter.get_window_stats, self.item, self.name)
+                except Exception as e:
+                    self.counts['storage_errors'] += 1
+                    logger.warning('%s rate gate storage failed, admitting: %s', self.name, e)
+                    break
+                delay = max(reset_time - time.time(), 0.01)
+                waited = time.monotonic() - start
+                if waited + delay > self.max_wait:
+                    self.counts['rejected_rate'] += 1
+                    raise AdmissionRejected(self.name, 'rate limited', delay)
+                if not queued:
+                    queued = True
+                    self.waiting += 1
+                    self.counts['queued'] += 1
+                await asyncio.sleep(delay)
+        finally:
+            if queued:
+                self.waiting -= 1
+        self.counts['admitted'] += 1
+        return time.monotonic() - start
+
+    def release(self):
+        pass
+
+    def as_dict(self):
+        return dict(self.counts, rate=self.rate, limit=str(self.item), waiting=self.waiting)
@@ -0,0 +1,146 @@
+# batch_jobs.py
+# Batch chat jobs and their per-query results, kept in a SQLite file shared
+# by every API worker process, so a job started on one worker can be polled
+# or streamed through any of them. The a* methods run the corresponding
+# call on the default executor, for use from the event loop.
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    pid INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    item INTEGER NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_by_job ON results (job_id, seq);
+'''
+
+RUNNING = 'running'
+
+class JobStore:
+    """Jobs and results in a SQLite file, one connection per process (WAL mode).
+
+    Results are numbered in the order they were added (seq), which readers
+    use as a cursor, and counted in the job's row as they are added. Jobs
+    created more than ttl seconds ago are pruned, with their results, when a
+    new job is created. Calls may come from several threads; the connection
+    is used by one at a time.
+    """
+    def __init__(self, filepath, ttl=86400):
+        self.filepath = filepath
+        self.ttl = ttl
+        self.pid = None
+        self.conn = None
+        self.lock = threading.Lock()
+        if os.path.dirname(filepath):
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    def connect(self):
+        # Connections must not be shared with a forked parent process
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.filepath, timeout=5.0, isolation_level=None,
+                                        check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+            columns = [row[1] for row in self.conn.execute('PRAGMA table_info(jobs)')]
+            if 'completed' not in columns:  # Store from before the running count
+                self.conn.execute('ALTER TABLE jobs ADD COLUMN completed INTEGER NOT NULL DEFAULT 0')
+                self.conn.execute('UPDATE jobs SET completed = '
+                                  '(SELECT COUNT(*) FROM results WHERE results.job_id = jobs.id)')
+            self.pid = os.getpid()
+        return self.conn
+
+    def create(self, total):
+        """Start a job of total items and return its ID"""
+        expired = time.time() - self.ttl
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            conn = self.connect()
+            conn.execute('DELETE FROM results WHERE job_id IN (SELECT id FROM jobs WHERE created_at < ?)',
+                         (expired,))
+            conn.execute('DELETE FROM jobs WHERE created_at < ?', (expired,))
+            conn.execute('INSERT INTO jobs (id, total, status, created_at, pid) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, total, RUNNING, time.time(), os.getpid()))
+        return job_id
+
+    def add_result(self, job_id, item, result):
+        """Store the result and count it in the job's row, in one transaction"""
+        with self.lock:
+            conn = self.connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('INSERT INTO results (job_id, item, result) VALUES (?, ?, ?)',
+                             (job_id, item, json.dumps(result)))
+                conn.execute('UPDATE jobs SET completed = completed + 1 WHERE id = ?', (job_id,))
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def finish(self, job_id, status):
+        with self.lock:
+            self.connect().execute('UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?',
+                                   (status, time.time(), job_id, RUNNING))
+
+    def interrupt_running(self, status='interrupted'):
+        """Finish this process's running jobs, which stop when it does"""
+        with self.lock:
+            self.connect().execute('UPDATE jobs SET status = ?, finished_at = ? WHERE pid = ? AND status = ?',
+                                   (status, time.time(), os.getpid(), RUNNING))
+
+    def get(self, job_id):
+        """Job status and progress as a dict, or None if there is no such job"""
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT total, status, completed, created_at, finished_at FROM jobs WHERE id = ?',
+                (job_id,)).fetchone()
+        if row is None:
+            return None
+        total, status, completed, created_at, finished_at = row
+        return {'job_id': job_id, 'status': status, 'total': total, 'completed': completed,
+                'created_at': created_at, 'finished_at': finished_at}
+
+    def results(self, job_id, after=0, limit=1000):
+        """[(seq, result JSON)] of the job's results added after seq after, oldest first"""
+        with self.lock:
+            return self.connect().execute(
+                'SELECT seq, result FROM results WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?',
+                (job_id, after, limit)).fetchall()
+
+    async def acreate(self, total):
+        return await asyncio.get_running_loop().run_in_executor(None, self.create, total)
+
+    async def aadd_result(self, job_id, item, result):
+        await asyncio.get_running_loop().run_in_executor(None, self.add_result, job_id, item, result)
+
+    async def afinish(self, job_id, status):
+        await asyncio.get_running_loop().run_in_executor(None, self.finish, job_id, status)
+
+    async def aget(self, job_id):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, job_id)
+
+    async def aresults(self, job_id, after=0, limit=1000):
+        return await asyncio.get_running_loop().run_in_executor(None, self.results, job_id, after, limit)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.close()
+            self.conn = None
+            self.pid = None
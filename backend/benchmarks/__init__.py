@@ -0,0 +1,2 @@
+# Benchmarks for the backend. Run them from the backend directory, e.g.
+#   python -m benchmarks.load_chat
@@ -0,0 +1,76 @@
+# admission_burst.py
+# A burst of concurrent POST /chat requests against a stub Mistral server that
+# serves only a few calls at a time, with and without the LLM admission gate.
+# Without it every request queues on the upstream; with it the excess is shed
+# with 503 + Retry-After and the admitted requests keep a bounded latency.
+#
+#   cd backend && python -m benchmarks.admission_burst --burst 64
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.load_chat import QUERIES, percentile
+from benchmarks.stub_servers import ServerThread, make_kanoon_app, make_mistral_app
+
+async def burst(url, size):
+    async with httpx.AsyncClient(base_url=url, timeout=120,
+                                 limits=httpx.Limits(max_connections=size)) as client:
+        async def one(i):
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"query": QUERIES[i % len(QUERIES)] + f" case {i}"})
+            return response.status_code, time.perf_counter() - start
+        return await asyncio.gather(*[one(i) for i in range(size)])
+
+def report(name, results):
+    ok = [elapsed for status, elapsed in results if status == 200]
+    shed = [elapsed for status, elapsed in results if status == 503]
+    other = len(results) - len(ok) - len(shed)
+    line = f"{name:<22} {len(ok):4d} ok"
+    if ok:
+        line += f"  p50 {percentile(ok, 50):6.2f}s  p99 {percentile(ok, 99):6.2f}s"
+    line += f"  {len(shed):4d} shed"
+    if shed:
+        line += f" (p99 {percentile(shed, 99) * 1000:6.1f} ms)"
+    if other:
+        line += f"  {other} other errors"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM admission control under a request burst")
+    parser.add_argument("--burst", type=int, default=64)
+    parser.add_argument("--mistral-latency", type=float, default=0.5)
+    parser.add_argument("--mistral-capacity", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=8)
+    parser.add_argument("--max-wait", type=float, default=2.0)
+    args = parser.parse_args()
+
+    kanoon = ServerThread(make_kanoon_app(latency=0.02)).start()
+    mistral = ServerThread(make_mistral_app(latency=args.mistral_latency,
+                                            concurrency=args.mistral_capacity)).start()
+    os.environ.update(IK_BASE_URL=kanoon.url, IK_API_KEY="stub", MISTRAL_SERVER_URL=mistral.url,
+                      MISTRAL_API_KEY="stub", GEMINI_API_KEY="", RESPONSE_CACHE_ENABLED="0",
+                      SEARCH_CACHE_ENABLED="0", LOCAL_INDEX_ENABLED="0", STARTUP_MODE="eager",
+                      LLM_MAX_CONCURRENCY=str(args.max_concurrency), LLM_MAX_QUEUE=str(args.max_queue),
+                      LLM_MAX_QUEUE_WAIT=str(args.max_wait))
+    import main
+    main.limiter.enabled = False
+    gate = main.llm_gate
+
+    backend = ServerThread(main.app).start()
+    try:
+        main.llm_gate = None
+        report("no admission control", asyncio.run(burst(backend.url, args.burst)))
+        main.llm_gate = gate
+        report(f"gate {args.max_concurrency}+{args.max_queue} queued", asyncio.run(burst(backend.url, args.burst)))
+        print("gate:", gate.as_dict())
+    finally:
+        backend.stop()
+        mistral.stop()
+        kanoon.stop()
+
+if __name__ == "__main__":
+    main()
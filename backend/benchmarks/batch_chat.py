@@ -0,0 +1,90 @@
+# batch_chat.py
+# Answering a list of queries by looping over POST /chat against one
+# POST /chat/batch job, with stub Kanoon and Mistral servers. The queries
+# repeat entity sets and some repeat outright, as back-office lists do;
+# the upstream call counts show what the batch deduplicates.
+#
+#   cd backend && python -m benchmarks.batch_chat --queries 200 --distinct 50
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+from benchmarks.load_chat import QUERIES
+from benchmarks.stub_servers import ServerThread, make_kanoon_app, make_mistral_app
+
+def make_queries(count, distinct, rng):
+    pool = [f"{QUERIES[i % len(QUERIES)]} case {i}" for i in range(distinct)]
+    return [rng.choice(pool) for _ in range(count)]
+
+async def run_loop(url, queries, concurrency):
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        pending = iter(queries)
+        failed = 0
+
+        async def worker():
+            nonlocal failed
+            for query in pending:
+                response = await client.post("/chat", json={"query": query})
+                failed += response.status_code != 200
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return len(queries) - failed
+
+async def run_batch(url, queries):
+    ok = 0
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        async with client.stream("POST", "/chat/batch", params={"stream": "true"},
+                                 json={"queries": queries}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    ok += json.loads(line).get("status") == "ok"
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch chat job against looping over /chat")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=50)
+    parser.add_argument("--loop-concurrency", type=int, default=1, help="client-side /chat calls at a time")
+    parser.add_argument("--kanoon-latency", type=float, default=0.1)
+    parser.add_argument("--mistral-latency", type=float, default=0.5)
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="BATCH_LLM_CONCURRENCY")
+    args = parser.parse_args()
+
+    kanoon_app = make_kanoon_app(latency=args.kanoon_latency)
+    mistral_app = make_mistral_app(latency=args.mistral_latency)
+    kanoon = ServerThread(kanoon_app).start()
+    mistral = ServerThread(mistral_app).start()
+    os.environ.update(IK_BASE_URL=kanoon.url, IK_API_KEY="stub", MISTRAL_SERVER_URL=mistral.url,
+                      MISTRAL_API_KEY="stub", GEMINI_API_KEY="", RESPONSE_CACHE_ENABLED="0",
+                      SEARCH_CACHE_ENABLED="0", LOCAL_INDEX_ENABLED="0", STARTUP_MODE="eager",
+                      BATCH_LLM_CONCURRENCY=str(args.llm_concurrency), LLM_MAX_CONCURRENCY="0")
+    import main
+    main.limiter.enabled = False
+    queries = make_queries(args.queries, args.distinct, random.Random(3))
+
+    backend = ServerThread(main.app).start()
+    try:
+        print(f"{len(queries)} queries, {len(set(queries))} distinct")
+        print(f"{'mode':<18} {'ok':>5} {'seconds':>8} {'queries/s':>10} {'searches':>9} {'llm calls':>10}")
+        for name, run in [(f"/chat loop x{args.loop_concurrency}",
+                           lambda: run_loop(backend.url, queries, args.loop_concurrency)),
+                          ("/chat/batch", lambda: run_batch(backend.url, queries))]:
+            kanoon_app.state.calls = mistral_app.state.calls = 0
+            start = time.perf_counter()
+            ok = asyncio.run(run())
+            elapsed = time.perf_counter() - start
+            print(f"{name:<18} {ok:5d} {elapsed:8.2f} {len(queries) / elapsed:10.1f} "
+                  f"{kanoon_app.state.calls:9d} {mistral_app.state.calls:10d}")
+    finally:
+        backend.stop()
+        mistral.stop()
+        kanoon.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# crawl_throughput.py
+# Docs/sec of the ik_download bulk crawler against the fake Kanoon server for
+# a range of --workers values, plus a crash-and-resume check.
+#
+#   cd backend && python -m benchmarks.crawl_throughput
+import argparse
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+
+from benchmarks.stub_servers import ServerThread, make_kanoon_app
+from ik_download import IKApi, FileStorage, get_arg_parser
+
+QUERIES = ["bail section 437", "dowry death 304B", "cheque bounce 138"]
+
+def count_docs(datadir):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(datadir):
+        if dirpath == datadir:
+            # Saved search result pages are not docs
+            dirnames[:] = [name for name in dirnames if name != 'search']
+        total += sum(1 for name in filenames if name.endswith('.json'))
+    return total
+
+def crawl(baseurl, datadir, workers, maxpages=1):
+    args = get_arg_parser().parse_args(['-s', 'stub', '-B', baseurl, '-D', datadir,
+                                        '-N', str(workers), '-p', str(maxpages)])
+    storage = FileStorage(datadir)
+    IKApi(args, storage).execute_tasks(QUERIES)
+
+def crawl_in_group(baseurl, datadir, workers):
+    os.setpgrp()
+    crawl(baseurl, datadir, workers)
+
+def bench_workers(baseurl, workers_list, expected):
+    for workers in workers_list:
+        with tempfile.TemporaryDirectory() as datadir:
+            start = time.perf_counter()
+            crawl(baseurl, datadir, workers)
+            elapsed = time.perf_counter() - start
+            docs = count_docs(datadir)
+            status = "" if docs == expected else f"  (expected {expected})"
+            print(f"workers {workers:2d}: {docs} docs in {elapsed:6.2f} s  {docs / elapsed:7.1f} docs/sec{status}")
+
+def check_resume(baseurl, expected, kill_after):
+    with tempfile.TemporaryDirectory() as datadir:
+        child = multiprocessing.Process(target=crawl_in_group, args=(baseurl, datadir, 4))
+        child.start()
+        time.sleep(kill_after)
+        # Kill the crawler and its workers at once, like a crash
+        os.killpg(child.pid, signal.SIGKILL)
+        child.join()
+        partial = count_docs(datadir)
+        journal = os.path.exists(os.path.join(datadir, '.crawl_journal'))
+
+        crawl(baseurl, datadir, 4)
+        docs = count_docs(datadir)
+        print(f"resume: {partial} docs before the crash (journal kept: {journal}), {docs} after resuming"
+              f"{'' if docs == expected else f'  (expected {expected})'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk crawler throughput benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--results-per-query", type=int, default=60)
+    args = parser.parse_args()
+
+    kanoon = ServerThread(make_kanoon_app(latency=args.latency, max_results=args.results_per_query)).start()
+    expected = args.results_per_query * len(QUERIES)
+    try:
+        bench_workers(kanoon.url, args.workers, expected)
+        check_resume(kanoon.url, expected, kill_after=expected * args.latency / 8)
+    finally:
+        kanoon.stop()
+
+if __name__ == "__main__":
+    main()
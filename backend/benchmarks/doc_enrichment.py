@@ -0,0 +1,93 @@
+# doc_enrichment.py
+# Loading the full text of the top hits for enrichment (DocCache, as
+# enrich_results in main.py does) against a stub Kanoon server: a cold
+# cache one doc at a time and with bounded concurrency, then a stream of
+# requests whose top hits repeat, then a new process on the same storage.
+# The stub's call count shows that each doc is fetched once.
+#
+#   cd backend && python -m benchmarks.doc_enrichment --requests 200 --docs 40
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load_chat import percentile
+from benchmarks.stub_servers import ServerThread, fake_doc, make_kanoon_app
+from context_builder import extract_passages
+from enrichment import DocCache
+from ik_download import FileStorage
+from manifest import Manifest
+
+ENTITIES = ["bail", "section 437"]
+
+def make_cache(datadir, client):
+    async def fetch(docid):
+        response = await client.post(f"/doc/{docid}/")
+        return response.text
+
+    storage = FileStorage(datadir)
+    return DocCache(storage, Manifest(os.path.join(datadir, ".manifest.sqlite")), fetch)
+
+async def cold(url, datadir, hits, concurrency):
+    async with httpx.AsyncClient(base_url=url) as client:
+        cache = make_cache(datadir, client)
+        start = time.perf_counter()
+        docs = await cache.get_many(hits, concurrency, deadline=60)
+        return time.perf_counter() - start, len(docs)
+
+async def stream(url, datadir, requests, top_k, concurrency, rng, docs):
+    async with httpx.AsyncClient(base_url=url) as client:
+        cache = make_cache(datadir, client)
+        weights = [1.0 / (rank + 1) for rank in range(docs)]
+        latencies = []
+        passages = 0
+
+        async def request():
+            nonlocal passages
+            hits = [fake_doc(tid) for tid in set(rng.choices(range(docs), weights, k=top_k))]
+            start = time.perf_counter()
+            loaded = await cache.get_many(hits, concurrency, deadline=60)
+            for paragraphs in loaded.values():
+                passages += len(extract_passages(paragraphs, ENTITIES))
+            latencies.append(time.perf_counter() - start)
+
+        # Requests arrive 8 at a time, so some want a doc that is still loading
+        for i in range(0, requests, 8):
+            await asyncio.gather(*[request() for _ in range(min(8, requests - i))])
+        return latencies, passages, cache.as_dict()
+
+def main():
+    parser = argparse.ArgumentParser(description="Doc enrichment fetch and cache benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--docs", type=int, default=40, help="distinct docs among the top hits")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.1, help="stub Kanoon latency per call")
+    args = parser.parse_args()
+
+    hits = [fake_doc(tid) for tid in range(1000, 1000 + args.top_k)]
+    kanoon_app = make_kanoon_app(latency=args.latency)
+    with ServerThread(kanoon_app) as kanoon, tempfile.TemporaryDirectory() as tmpdir:
+        print(f"cold top-{args.top_k} ({args.latency * 1000:.0f} ms per fetch)")
+        for concurrency in (1, args.concurrency):
+            elapsed, loaded = asyncio.run(cold(kanoon.url, os.path.join(tmpdir, f"cold{concurrency}"),
+                                               hits, concurrency))
+            print(f"  concurrency {concurrency}: {elapsed * 1000:7.1f} ms, {loaded} docs")
+
+        datadir = os.path.join(tmpdir, "stream")
+        for name in ("stream", "restarted"):
+            kanoon_app.state.calls = 0
+            latencies, passages, stats = asyncio.run(stream(kanoon.url, datadir, args.requests, args.top_k,
+                                                            args.concurrency, random.Random(7), args.docs))
+            print(f"{name}: {args.requests} requests, mean {statistics.mean(latencies) * 1000:.1f} ms, "
+                  f"p50 {percentile(latencies, 50) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+                  f"{passages} passages")
+            print(f"  Kanoon /doc/ calls: {kanoon_app.state.calls}  cache: {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# kanoon_client.py
+# Exercise IKHttpClient against the fake Kanoon server: connection reuse,
+# retries under a flaky upstream, and fail-fast once the breaker opens.
+#
+#   cd backend && python -m benchmarks.kanoon_client
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.stub_servers import ServerThread, make_kanoon_app
+from ik_http import IKHttpClient, CircuitBreaker, CircuitOpenError, UpstreamError
+
+HEADERS = {'Authorization': 'Token stub', 'Accept': 'application/json'}
+URL = '/search/?formInput=bail&pagenum=0&maxpages=1'
+
+def bench_reuse(baseurl, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        with httpx.Client(base_url=baseurl, headers=HEADERS) as client:
+            client.post(URL)
+    fresh = (time.perf_counter() - start) / calls
+
+    http = IKHttpClient(baseurl, HEADERS)
+    start = time.perf_counter()
+    for _ in range(calls):
+        http.call(URL)
+    pooled = (time.perf_counter() - start) / calls
+    http.close()
+    print(f"new connection per call: {fresh * 1000:.2f} ms/call")
+    print(f"pooled keep-alive:       {pooled * 1000:.2f} ms/call  {http.stats.as_dict()}")
+
+async def bench_flaky(baseurl, calls, concurrency):
+    http = IKHttpClient(baseurl, HEADERS, pool_size=concurrency, deadline=5.0,
+                        backoff_base=0.05, breaker=CircuitBreaker(failure_threshold=10**6))
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            try:
+                await http.acall(URL)
+            except UpstreamError:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(calls)])
+    elapsed = time.perf_counter() - start
+    await http.aclose()
+    print(f"flaky upstream: {calls} calls in {elapsed:.2f}s, {failures} gave up  {http.stats.as_dict()}")
+
+def bench_breaker(baseurl, calls):
+    http = IKHttpClient(baseurl, HEADERS, max_retries=1, backoff_base=0.01,
+                        breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+    start = time.perf_counter()
+    for _ in range(calls):
+        try:
+            http.call(URL)
+        except (CircuitOpenError, UpstreamError):
+            pass
+    elapsed = time.perf_counter() - start
+    http.close()
+    print(f"upstream down: {calls} calls in {elapsed:.2f}s, breaker {http.breaker.state}  {http.stats.as_dict()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Kanoon transport benchmark")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    args = parser.parse_args()
+
+    with ServerThread(make_kanoon_app(latency=args.latency)) as server:
+        bench_reuse(server.url, args.calls)
+    with ServerThread(make_kanoon_app(latency=args.latency, error_rate=args.error_rate)) as server:
+        asyncio.run(bench_flaky(server.url, args.calls, 16))
+    with ServerThread(make_kanoon_app(latency=args.latency, error_rate=1.0)) as server:
+        bench_breaker(server.url, args.calls)
+
+if __name__ == "__main__":
+    main()
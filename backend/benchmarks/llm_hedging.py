@@ -0,0 +1,75 @@
+# llm_hedging.py
+# End-to-end LLM latency and error rate through llm_router with two in-process
+# stub providers: a primary with a slow tail and occasional errors, and a
+# steadier secondary. Compares the old single-provider path against failover
+# only, hedging at the observed p95, and the latency-weighted "auto" choice.
+#
+#   cd backend && python -m benchmarks.llm_hedging --requests 400
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from benchmarks.load_chat import percentile
+from benchmarks.stub_servers import make_stub_provider
+from llm_router import LLMRouter, ProviderError
+
+def make_providers(args, seed):
+    rng = random.Random(seed)
+    return [
+        make_stub_provider("mistral", latency=args.latency, tail_rate=args.tail_rate,
+                           error_rate=args.error_rate, timeout=args.timeout, rng=rng),
+        make_stub_provider("gemini", latency=args.latency * 1.5, tail_rate=args.tail_rate / 5,
+                           error_rate=args.error_rate / 5, timeout=args.timeout, rng=rng),
+    ]
+
+async def run(router, preferred, requests, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in counter:
+            start = time.perf_counter()
+            try:
+                await router.complete("prompt", preferred)
+            except ProviderError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM router hedging/failover benchmark")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1, help="primary median latency (s)")
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="fraction of 10x slow calls")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    args = parser.parse_args()
+    logging.getLogger("llm_router").setLevel(logging.ERROR)  # one line per failover otherwise
+
+    scenarios = [
+        ("single provider", lambda p: LLMRouter(p[:1], hedge=False), "mistral"),
+        ("failover", lambda p: LLMRouter(p, hedge=False), "mistral"),
+        ("hedge at p95 + failover", lambda p: LLMRouter(p, hedge_delay=args.latency * 3,
+                                                        min_hedge_delay=0.0), "mistral"),
+        ("auto (weighted) + hedge", lambda p: LLMRouter(p, hedge_delay=args.latency * 3,
+                                                        min_hedge_delay=0.0), None),
+    ]
+    print(f"{'scenario':<26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'hedges':>7} {'extra calls':>11}")
+    for name, make_router, preferred in scenarios:
+        router = make_router(make_providers(args, seed=1))
+        latencies, errors = asyncio.run(run(router, preferred, args.requests, args.concurrency))
+        stats = router.as_dict()
+        calls = sum(p.counts["calls"] for p in router.providers.values())
+        print(f"{name:<26} {percentile(latencies, 50) * 1000:8.1f} {percentile(latencies, 95) * 1000:8.1f} "
+              f"{percentile(latencies, 99) * 1000:8.1f} {errors:7d} {stats['hedges']:7d} "
+              f"{(calls - args.requests) / args.requests:10.1%}")
+
+if __name__ == "__main__":
+    main()
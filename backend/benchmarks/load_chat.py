@@ -0,0 +1,90 @@
+# load_chat.py
+# Load benchmark for POST /chat against local stub Kanoon and Mistral servers.
+#
+#   cd backend && python -m benchmarks.load_chat --concurrency 1 8 32 64
+#
+# Reports requests/sec and latency percentiles for each concurrency level.
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.stub_servers import ServerThread, make_kanoon_app, make_mistral_app
+
+QUERIES = [
+    "Bail under section 437 of the Code of Criminal Procedure in Delhi",
+    "Arvind Kejriwal defamation case before the Supreme Court of India",
+    "Property dispute between Tata Sons and Cyrus Mistry in Mumbai",
+    "Dowry harassment complaint filed in Patna under the Indian Penal Code",
+]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_level(url, concurrency, total):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                response = await client.post("/chat", json={"query": QUERIES[i % len(QUERIES)]})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for POST /chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--kanoon-latency", type=float, default=0.05)
+    parser.add_argument("--mistral-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    kanoon = ServerThread(make_kanoon_app(latency=args.kanoon_latency)).start()
+    mistral = ServerThread(make_mistral_app(latency=args.mistral_latency)).start()
+
+    # main.py reads its configuration at import time
+    os.environ["IK_BASE_URL"] = kanoon.url
+    os.environ["IK_API_KEY"] = "stub"
+    os.environ["MISTRAL_SERVER_URL"] = mistral.url
+    os.environ["MISTRAL_API_KEY"] = "stub"
+    os.environ["GEMINI_API_KEY"] = ""
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"  # Measure the full pipeline
+    import main
+    main.limiter.enabled = False
+
+    backend = ServerThread(main.app).start()
+    try:
+        print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        for concurrency in args.concurrency:
+            result = asyncio.run(run_level(backend.url, concurrency, args.requests))
+            print(f"{result['concurrency']:>5} {result['rps']:>8.1f} {result['p50_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['errors']:>6}")
+    finally:
+        backend.stop()
+        mistral.stop()
+        kanoon.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# local_retrieval.py
+# Build time, query latency and incremental update cost of the local BM25
+# index over a synthetic corpus saved through FileStorage.
+#
+#   cd backend && python -m benchmarks.local_retrieval --docs 20000 --workers 1 4
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.load_chat import percentile
+from benchmarks.stub_servers import fake_doc
+from ik_download import FileStorage
+import local_index
+
+def make_vocabulary(size, rng):
+    syllables = ["ba", "ka", "de", "li", "mo", "nu", "ra", "si", "te", "vo", "pa", "gi", "ju", "ne"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def write_docs(storage, first, count, vocabulary, rng):
+    # Zipf-like term distribution, as in real text
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    for tid in range(first, first + count):
+        doc = fake_doc(tid)
+        words = rng.choices(vocabulary, weights, k=rng.randint(300, 3000))
+        doc["doc"] = "<p>%s</p>" % " ".join(words)
+        doc["title"] = " ".join(rng.choices(vocabulary, k=6))
+        docpath = storage.get_docpath(doc["docsource"], doc["publishdate"])
+        jsonpath, origpath = storage.get_json_orig_path(docpath, tid)
+        storage.save_json(json.dumps(doc), jsonpath)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local BM25 index benchmark")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--added", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    with tempfile.TemporaryDirectory() as datadir:
+        storage = FileStorage(datadir)
+        write_docs(storage, 1, args.docs, vocabulary, rng)
+
+        for workers in sorted(set(args.workers)):
+            start = time.perf_counter()
+            index = local_index.build(storage, workers)
+            print(f"build with {workers} workers: {time.perf_counter() - start:6.2f} s  {index.as_dict()}")
+
+        latencies = []
+        for _ in range(args.queries):
+            query = " ".join(rng.choices(vocabulary[:5000], k=rng.randint(2, 4)))
+            start = time.perf_counter()
+            index.search(query, 10)
+            latencies.append(time.perf_counter() - start)
+        print(f"search: p50 {percentile(latencies, 50) * 1000:.2f} ms  p99 {percentile(latencies, 99) * 1000:.2f} ms")
+
+        # Let mtimes move past the indexed ones before adding docs
+        time.sleep(0.05)
+        write_docs(storage, args.docs + 1, args.added, vocabulary, rng)
+        start = time.perf_counter()
+        index = local_index.build(storage, 1, index)
+        print(f"incremental update of {args.added} docs: {time.perf_counter() - start:6.2f} s  {index.as_dict()}")
+
+        path = os.path.join(datadir, "local_index.pkl")
+        start = time.perf_counter()
+        local_index.save(index, path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        local_index.load(path)
+        print(f"save {saved:.2f} s, load {time.perf_counter() - start:.2f} s, {os.path.getsize(path) / 2**20:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# middleware_overhead.py
+# Per-request cost of the log_requests middleware: the previous version
+# (BaseHTTPMiddleware, four synchronous INFO lines including every header)
+# against main.RequestLogMiddleware (plain ASGI, queued JSON, sampled), on a
+# trivial endpoint served in-process.
+#
+#   cd backend && python -m benchmarks.middleware_overhead
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI, Request
+
+os.environ.setdefault("IK_API_KEY", "stub")
+os.environ.setdefault("STARTUP_MODE", "lazy")
+import main
+from logging_config import setup_logging, stop_logging
+
+legacy_logger = logging.getLogger("legacy")
+
+async def legacy_log_requests(request: Request, call_next):
+    """log_requests as it was before queued logging"""
+    request_id = str(uuid.uuid4())
+    legacy_logger.info(f"Request {request_id}: {request.method} {request.url}")
+    legacy_logger.info(f"Client IP: {request.client.host}")
+    legacy_logger.info(f"Headers: {dict(request.headers)}")
+    start_time = time.time()
+    response = await call_next(request)
+    process_time = time.time() - start_time
+    legacy_logger.info(f"Request {request_id} completed in {process_time:.2f}s with status {response.status_code}")
+    return response
+
+def make_app(middleware=None, asgi_middleware=None):
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if middleware is not None:
+        app.middleware("http")(middleware)
+    if asgi_middleware is not None:
+        app.add_middleware(asgi_middleware)
+    return app
+
+async def measure(app, requests):
+    headers = {"Authorization": "Bearer secret", "User-Agent": "bench", "Accept": "application/json",
+               "Cookie": "session=abc", "X-Forwarded-For": "10.0.0.1"}
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        for _ in range(100):
+            await client.get("/ping")
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/ping")
+        return (time.perf_counter() - start) / requests
+
+def main_():
+    parser = argparse.ArgumentParser(description="log_requests middleware overhead benchmark")
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Legacy: basicConfig-style synchronous handler on the event loop
+        legacy_stream = open(os.path.join(tmpdir, "legacy.log"), "w")
+        legacy_handler = logging.StreamHandler(legacy_stream)
+        legacy_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        legacy_logger.addHandler(legacy_handler)
+        legacy_logger.setLevel(logging.INFO)
+        legacy_logger.propagate = False
+
+        stream = open(os.path.join(tmpdir, "current.log"), "w")
+        setup_logging("INFO", "json", stream=stream)
+
+        results = {"no middleware": asyncio.run(measure(make_app(), args.requests)),
+                   "legacy": asyncio.run(measure(make_app(legacy_log_requests), args.requests))}
+        for rate in (1.0, 0.1):
+            main.LOG_SAMPLE_RATE = rate
+            app = make_app(asgi_middleware=main.RequestLogMiddleware)
+            results[f"queued json, sample {rate}"] = asyncio.run(measure(app, args.requests))
+        stop_logging()
+
+        baseline = results["no middleware"]
+        for name, seconds in results.items():
+            print(f"{name:<26} {seconds * 1e6:8.1f} us/request  (+{(seconds - baseline) * 1e6:6.1f} us)")
+        print(f"legacy log: {os.path.getsize(legacy_stream.name) // 1024} KiB, "
+              f"queued log: {os.path.getsize(stream.name) // 1024} KiB")
+        with open(stream.name) as f:
+            line = f.readline().strip()
+        print("sample line:", line)
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,94 @@
+# ner_backends.py
+# Compare the NER runtimes selectable through load_model(backend=...):
+# cold-load time, RSS after loading, per-query latency, and entity parity
+# with the fp32 model. Each backend runs in a fresh interpreter so load time
+# and memory are measured from a cold start.
+#
+#   cd backend && python -m benchmarks.ner_backends --backends fp32 int8 onnx
+#
+# Exits non-zero when a backend's entities differ from fp32. The ONNX/fp32
+# parity on PARITY_TEXTS, and int8 agreeing with fp32 to within an entity
+# F1 tolerance, are also asserted by tests/test_ner_parity.py.
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.load_chat import QUERIES
+
+PARITY_TEXTS = QUERIES + [
+    "The Supreme Court of India heard the appeal filed by Reliance Industries against SEBI in New Delhi.",
+    "Justice D. Y. Chandrachud delivered the judgment in Puttaswamy v. Union of India.",
+]
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def run_backend(backend, iterations):
+    """Runs inside the child interpreter and prints one JSON line"""
+    start = time.perf_counter()
+    from legal_ner import load_model, extract_ner_entities
+    model, tokenizer = load_model(backend=backend)
+    load_time = time.perf_counter() - start
+
+    entities = [extract_ner_entities(text, model, tokenizer) for text in PARITY_TEXTS]
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        extract_ner_entities(PARITY_TEXTS[i % len(PARITY_TEXTS)], model, tokenizer)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "backend": backend,
+        "load_s": load_time,
+        "rss_mb": rss_mb(),
+        "p50_ms": statistics.median(latencies),
+        "mean_ms": statistics.mean(latencies),
+        "entities": entities,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="NER backend benchmark and parity check")
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8", "onnx"])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(args.child, args.iterations)
+        return
+
+    results = {}
+    for backend in args.backends:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.ner_backends", "--child", backend,
+             "--iterations", str(args.iterations)],
+            capture_output=True, text=True, check=True)
+        results[backend] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    reference = results.get("fp32", {}).get("entities")
+    mismatches = 0
+    print(f"{'backend':>8} {'load s':>7} {'RSS MB':>7} {'p50 ms':>7} {'mean ms':>8} {'parity':>7}")
+    for backend, result in results.items():
+        parity = "n/a"
+        if reference is not None:
+            same = result["entities"] == reference
+            parity = "ok" if same else "DIFF"
+            mismatches += not same
+        print(f"{backend:>8} {result['load_s']:>7.2f} {result['rss_mb']:>7.0f} "
+              f"{result['p50_ms']:>7.2f} {result['mean_ms']:>8.2f} {parity:>7}")
+        if parity == "DIFF":
+            for text, got, want in zip(PARITY_TEXTS, result["entities"], reference):
+                if got != want:
+                    print(f"    {text!r}\n      fp32: {want}\n      {backend}: {got}")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# ner_batching.py
+# Compare per-call NER (one forward pass per request) with NERBatcher
+# micro-batching at several levels of concurrency.
+#
+#   cd backend && python -m benchmarks.ner_batching --concurrency 1 8 64
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from legal_ner import load_model, extract_ner_entities
+from ner_batcher import NERBatcher
+from benchmarks.load_chat import QUERIES, percentile
+
+async def drive(call, concurrency, total):
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            await call(QUERIES[i % len(QUERIES)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return total / elapsed, statistics.median(latencies) * 1000, percentile(latencies, 99) * 1000
+
+async def run_per_call(model, tokenizer, executor, concurrency, total):
+    loop = asyncio.get_running_loop()
+
+    async def call(text):
+        return await loop.run_in_executor(executor, extract_ner_entities, text, model, tokenizer)
+
+    return await drive(call, concurrency, total)
+
+async def run_batched(model, tokenizer, executor, concurrency, total, args):
+    batcher = NERBatcher(model, tokenizer, executor, max_batch_size=args.max_batch_size,
+                         max_wait_ms=args.max_wait_ms, max_inflight=args.workers)
+    batcher.start()
+    try:
+        result = await drive(batcher.submit, concurrency, total)
+    finally:
+        await batcher.stop()
+    return result + (batcher.as_dict()["mean_batch_size"],)
+
+def main():
+    parser = argparse.ArgumentParser(description="NER micro-batching benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model, tokenizer = load_model()
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    extract_ner_entities(QUERIES[0], model, tokenizer)  # warm up
+
+    print(f"{'mode':>9} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for concurrency in args.concurrency:
+        rps, p50, p99 = asyncio.run(run_per_call(model, tokenizer, executor, concurrency, args.requests))
+        print(f"{'per-call':>9} {concurrency:>5} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} {1:>6.1f}")
+        rps, p50, p99, batch = asyncio.run(
+            run_batched(model, tokenizer, executor, concurrency, args.requests, args))
+        print(f"{'batched':>9} {concurrency:>5} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} {batch:>6.1f}")
+    executor.shutdown()
+
+if __name__ == "__main__":
+    main()
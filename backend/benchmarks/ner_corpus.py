@@ -0,0 +1,56 @@
+# ner_corpus.py
+# Throughput of the bulk NER run (corpus_ner.run) against the number of worker
+# processes, over synthetic judgments of a few thousand tokens saved through
+# FileStorage, so each doc runs as several overlapping windows. Also checks
+# that a second run over the same datadir resumes with nothing to do.
+#
+#   cd backend && python -m benchmarks.ner_corpus --docs 64 --workers 1 2 4
+import argparse
+import json
+import os
+import random
+import tempfile
+
+from benchmarks.ner_decoding import make_text
+from benchmarks.stub_servers import fake_doc
+from ik_download import FileStorage
+import corpus_ner
+
+def write_docs(storage, count, words, rng):
+    for tid in range(1, count + 1):
+        doc = fake_doc(tid)
+        doc["doc"] = "<p>%s</p>" % make_text(rng, rng.randint(words // 2, words * 3 // 2))
+        docpath = storage.get_docpath(doc["docsource"], doc["publishdate"])
+        jsonpath, origpath = storage.get_json_orig_path(docpath, tid)
+        storage.save_json(json.dumps(doc), jsonpath)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk NER scaling with worker processes")
+    parser.add_argument("--docs", type=int, default=64)
+    parser.add_argument("--words", type=int, default=2000, help="mean words per doc")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backend", default="fp32")
+    args = parser.parse_args()
+
+    print(f"cores: {os.cpu_count()}")
+    print(f"{'workers':>7} {'docs':>6} {'docs/sec':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as datadir:
+        storage = FileStorage(datadir)
+        write_docs(storage, args.docs, args.words, random.Random(2))
+
+        baseline = None
+        for workers in args.workers:
+            filepath = os.path.join(datadir, f"entities_{workers}.jsonl")
+            processed, rate = corpus_ner.run(storage, filepath, workers, args.backend)
+            baseline = baseline or rate
+            print(f"{workers:7d} {processed:6d} {rate:9.2f} {rate / baseline:7.2f}x")
+
+            resumed, _ = corpus_ner.run(storage, filepath, workers, args.backend)
+            entities = sum(map(len, corpus_ner.entities_by_docid(filepath).values()))
+            assert resumed == 0, f"resumed run reprocessed {resumed} docs"
+            assert len(corpus_ner.entities_by_docid(filepath)) == args.docs
+
+        print(f"entities per doc: {entities / args.docs:.1f}")
+
+if __name__ == "__main__":
+    main()
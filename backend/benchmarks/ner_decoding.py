@@ -0,0 +1,90 @@
+# ner_decoding.py
+# Decoding cost after the NER forward pass: the per-token Python loop
+# (convert_ids_to_tokens, .item() per label, "##" joining) against the
+# vectorized offset-mapping decoder, for inputs near the 512-token limit and
+# for batches. Label predictions are synthetic, so no forward pass is run.
+#
+#   cd backend && python -m benchmarks.ner_decoding --batch-sizes 1 8 32
+import argparse
+import random
+import time
+
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoTokenizer
+
+from legal_ner import MODEL_NAME, decode_entities, decode_spans
+
+WORDS = ("the court held that appellant respondent section act bail order petition under high "
+         "judgment appeal was filed against state dismissed allowed code criminal procedure").split()
+NAMES = ["Supreme Court of India", "Delhi High Court", "Tata Sons", "Cyrus Mistry", "Mumbai",
+         "Arvind Kejriwal", "Indian Penal Code", "Patna", "Reserve Bank of India", "Bombay Dyeing"]
+
+def make_text(rng, words):
+    parts = []
+    while len(parts) < words:
+        parts.append(rng.choice(NAMES) if rng.random() < 0.08 else rng.choice(WORDS))
+    return " ".join(parts)
+
+def make_predictions(rng, shape, id2label):
+    """Label ids with entity runs: B- then a few I- of the same type, O elsewhere"""
+    by_name = {label: i for i, label in id2label.items()}
+    types = sorted({label[2:] for label in id2label.values() if label != "O"})
+    predictions = np.full(shape, by_name["O"], dtype=np.int64)
+    for row in range(shape[0]):
+        t = 1
+        while t < shape[1]:
+            if rng.random() < 0.05:
+                kind = rng.choice(types)
+                length = rng.randint(1, 5)
+                predictions[row, t] = by_name["B-" + kind]
+                predictions[row, t + 1:t + length] = by_name["I-" + kind]
+                t += length
+            t += 1
+    return predictions
+
+def legacy_decode(encoded, predictions, tokenizer, id2label):
+    """extract_ner_entities_batch's decoding before offset mappings"""
+    predictions = torch.from_numpy(predictions)
+    results = []
+    for row, input_ids in enumerate(encoded["input_ids"]):
+        tokens = tokenizer.convert_ids_to_tokens(input_ids)
+        labels = [id2label[pred.item()] for pred in predictions[row]]
+        results.append(decode_entities(tokens, labels, tokenizer))
+    return results
+
+def timed(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description="NER decoding microbenchmark")
+    parser.add_argument("--model", default=MODEL_NAME, help="tokenizer and config to load")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--words", type=int, default=400, help="words per text (~500 tokens)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    id2label = AutoConfig.from_pretrained(args.model).id2label
+    rng = random.Random(0)
+
+    print(f"{'batch':>5} {'tokens':>7} {'loop ms':>9} {'vectorized ms':>14} {'speedup':>8} {'entities':>9}")
+    for batch_size in args.batch_sizes:
+        texts = [make_text(rng, args.words) for _ in range(batch_size)]
+        encoded = tokenizer(texts, return_tensors="np", truncation=True, padding="longest",
+                            max_length=512, return_offsets_mapping=True)
+        predictions = make_predictions(rng, encoded["input_ids"].shape, id2label)
+        offsets = encoded["offset_mapping"]
+
+        loop = timed(lambda: legacy_decode(encoded, predictions, tokenizer, id2label), args.repeat)
+        vectorized = timed(lambda: decode_spans(texts, predictions, offsets, id2label), args.repeat)
+        entities = sum(map(len, decode_spans(texts, predictions, offsets, id2label)))
+        print(f"{batch_size:5d} {predictions.shape[1]:7d} {loop * 1000:9.2f} {vectorized * 1000:14.3f} "
+              f"{loop / vectorized:7.1f}x {entities:9d}")
+
+if __name__ == "__main__":
+    main()
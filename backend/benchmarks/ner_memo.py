@@ -0,0 +1,60 @@
+# ner_memo.py
+# NER cost per query for a stream of repeated queries (Zipf over a pool of
+# distinct ones, with case and whitespace variants) with no caching and with
+# the NER memo, as run_ner in main.py does. The memo keys on the exact text,
+# as the model is cased, so only whitespace variants share an entry.
+#
+#   cd backend && python -m benchmarks.ner_memo --distinct 200 --queries 2000
+import argparse
+import random
+import re
+import statistics
+import time
+
+from benchmarks.load_chat import QUERIES, percentile
+from cache import NERMemo
+from legal_ner import load_model, extract_ner_entities
+
+def make_stream(rng, distinct, total):
+    pool = ["%s %d" % (rng.choice(QUERIES), i) for i in range(distinct)]
+    weights = [1.0 / (rank + 1) for rank in range(distinct)]
+    stream = []
+    for query in rng.choices(pool, weights, k=total):
+        if rng.random() < 0.2:
+            query = query.lower()
+        if rng.random() < 0.2:
+            query = query.replace(" ", "  ", 1) + " "
+        stream.append(query)
+    return stream
+
+def run(stream, model, tokenizer, memo):
+    latencies = []
+    for query in stream:
+        start = time.perf_counter()
+        text = re.sub(r"\s+", " ", query).strip()
+        entities = memo.get(text) if memo else None
+        if entities is None:
+            entities = extract_ner_entities(text, model, tokenizer)
+            if memo:
+                memo.put(text, entities)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="NER memo benchmark")
+    parser.add_argument("--distinct", type=int, default=200, help="distinct queries in the pool")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=4096, help="memo entries")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model()
+    stream = make_stream(random.Random(4), args.distinct, args.queries)
+    print(f"{'mode':<6} {'mean ms':>8} {'p50 ms':>7} {'p99 ms':>7} {'memo hits':>10}")
+    for name, memo in (("none", None), ("memo", NERMemo(args.size))):
+        latencies = run(stream, model, tokenizer, memo)
+        memo_ratio = memo.as_dict()["hit_ratio"] if memo else 0.0
+        print(f"{name:<6} {statistics.mean(latencies) * 1000:8.2f} {percentile(latencies, 50) * 1000:7.2f} "
+              f"{percentile(latencies, 99) * 1000:7.2f} {memo_ratio:10.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# startup_profile.py
+# Import-time and startup-time profile for the backend, meant to run in CI.
+#
+#   cd backend && python -m benchmarks.startup_profile --max-import-ms 1500 --max-ready-s 60
+#
+# 1. Runs `python -X importtime -c "import main"` and reports the total import
+#    time of main.py plus the slowest imported modules.
+# 2. Starts uvicorn in a subprocess and measures the time until /healthz and
+#    /readyz first answer 200.
+# Exits non-zero when a threshold is exceeded.
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.stub_servers import free_port
+
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def profile_imports(top):
+    env = dict(os.environ, STARTUP_MODE="lazy")
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True, env=env)
+    if output.returncode != 0:
+        print(output.stderr[-2000:])
+        raise SystemExit("import main failed")
+
+    modules = []
+    total_us = 0
+    for line in output.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, name = int(match.group(2)), match.group(4)
+        modules.append((cumulative, name, len(match.group(3))))
+        if name == "main":
+            total_us = cumulative
+
+    print(f"import main: {total_us / 1000:.1f} ms")
+    # Only top-level imports (least indented), so nested modules are not double counted
+    min_indent = min((indent for _, _, indent in modules), default=0)
+    toplevel = sorted((m for m in modules if m[2] <= min_indent + 2 and m[1] != "main"), reverse=True)
+    for cumulative, name, _ in toplevel[:top]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+    return total_us / 1000
+
+def wait_for(url, proc, timeout):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise SystemExit("server exited during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    return None
+
+def profile_startup(mode, timeout):
+    port = free_port()
+    env = dict(os.environ, STARTUP_MODE=mode)
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        healthz = wait_for(f"http://127.0.0.1:{port}/healthz", proc, timeout)
+        remaining = timeout - (time.perf_counter() - start)
+        readyz = wait_for(f"http://127.0.0.1:{port}/readyz", proc, remaining) if healthz is not None else None
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    ready_total = None if readyz is None else healthz + readyz
+    fmt = lambda v: "timeout" if v is None else f"{v:.2f}s"
+    print(f"STARTUP_MODE={mode}: /healthz after {fmt(healthz)}, /readyz after {fmt(ready_total)}")
+    return healthz, ready_total
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend import and startup profile")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--mode", default="background", choices=["background", "lazy", "eager"])
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-healthz-s", type=float, default=None)
+    parser.add_argument("--max-ready-s", type=float, default=None)
+    args = parser.parse_args()
+
+    import_ms = profile_imports(args.top)
+    healthz, ready = profile_startup(args.mode, args.timeout)
+
+    failures = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import main took {import_ms:.0f} ms > {args.max_import_ms:.0f} ms")
+    if args.max_healthz_s is not None and (healthz is None or healthz > args.max_healthz_s):
+        failures.append(f"/healthz not up within {args.max_healthz_s}s")
+    if args.max_ready_s is not None and (ready is None or ready > args.max_ready_s):
+        failures.append(f"/readyz not ready within {args.max_ready_s}s")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
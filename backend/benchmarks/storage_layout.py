@@ -0,0 +1,108 @@
+# storage_layout.py
+# FileStorage (one JSON file per doc under docsource/year/date) versus
+# PackedStorage (compressed segments + offset index): write rate, random read
+# latency, full-corpus scan time and disk footprint.
+#
+#   cd backend && python -m benchmarks.storage_layout --docs 20000
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.load_chat import percentile
+from benchmarks.stub_servers import fake_doc
+from ik_download import FileStorage
+from packed_storage import PackedStorage
+
+WORDS = ("the appellant respondent court section bail custody evidence witness "
+         "judgment order petition high supreme learned counsel accused trial").split()
+
+def make_docs(count, seed=1):
+    rng = random.Random(seed)
+    docs = []
+    for tid in range(1, count + 1):
+        doc = fake_doc(tid, "bail")
+        doc["docsource"] = rng.choice(["Delhi High Court", "Supreme Court of India", "Bombay High Court"])
+        doc["publishdate"] = "%d-%02d-%02d" % (rng.randint(1950, 2024), rng.randint(1, 12), rng.randint(1, 28))
+        doc["doc"] = "<p>%s</p>" % " ".join(rng.choice(WORDS) for _ in range(rng.randint(300, 3000)))
+        docs.append(doc)
+    return docs
+
+def footprint(datadir):
+    """(bytes allocated on disk, number of inodes) under datadir"""
+    allocated, inodes = 0, 0
+    for dirpath, dirnames, filenames in os.walk(datadir):
+        for name in dirnames + filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            allocated += st.st_blocks * 512
+            inodes += 1
+    return allocated, inodes
+
+def scan_files(datadir):
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(datadir):
+        for name in filenames:
+            if name.endswith(".json"):
+                with open(os.path.join(dirpath, name), encoding="utf8") as f:
+                    json.loads(f.read())
+                count += 1
+    return count
+
+def scan_packed(storage):
+    count = 0
+    for key, content in storage.iter_docs():
+        json.loads(content)
+        count += 1
+    return count
+
+def bench(name, storage, docs, reads, scan):
+    paths = []
+    start = time.perf_counter()
+    for doc in docs:
+        docpath = storage.get_docpath(doc["docsource"], doc["publishdate"])
+        jsonpath, origpath = storage.get_json_orig_path(docpath, doc["tid"])
+        storage.save_json(json.dumps(doc), jsonpath)
+        paths.append(jsonpath)
+    write_time = time.perf_counter() - start
+
+    rng = random.Random(2)
+    latencies = []
+    for _ in range(reads):
+        path = rng.choice(paths)
+        start = time.perf_counter()
+        storage.read(path)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    scanned = scan()
+    scan_time = time.perf_counter() - start
+
+    allocated, inodes = footprint(storage.datadir)
+    print(f"{name:<7} write {len(docs) / write_time:8.0f} docs/s | "
+          f"read p50 {percentile(latencies, 50) * 1e6:6.1f} us p99 {percentile(latencies, 99) * 1e6:7.1f} us | "
+          f"scan {scanned} docs in {scan_time:5.2f} s | "
+          f"disk {allocated / 2**20:7.1f} MiB in {inodes} inodes")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-file versus packed corpus storage benchmark")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=5000)
+    args = parser.parse_args()
+
+    docs = make_docs(args.docs)
+    raw = sum(len(json.dumps(doc)) for doc in docs)
+    print(f"{len(docs)} docs, {raw / 2**20:.1f} MiB of JSON")
+
+    with tempfile.TemporaryDirectory() as datadir:
+        storage = FileStorage(datadir)
+        bench("files", storage, docs, args.reads, lambda: scan_files(datadir))
+
+    with tempfile.TemporaryDirectory() as datadir:
+        storage = PackedStorage(datadir)
+        bench("packed", storage, docs, args.reads, lambda: scan_packed(storage))
+        storage.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# stream_ttfb.py
+# Time-to-first-byte of POST /chat/stream versus POST /chat, against the stub
+# Kanoon server and a stub Mistral server that streams tokens.
+#
+#   cd backend && python -m benchmarks.stream_ttfb
+#
+# Also checks that the streamed tokens add up to the non-streamed answer.
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+from benchmarks.load_chat import QUERIES
+from benchmarks.stub_servers import ServerThread, make_kanoon_app, make_mistral_app
+
+ANSWER = " ".join(["Bail under section 437 is granted at the discretion of the court."] * 8)
+
+def parse_sse(lines):
+    """Yield (event, data) pairs from an iterator of SSE lines"""
+    event = None
+    for line in lines:
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+def measure_stream(client, query):
+    start = time.perf_counter()
+    marks = {}
+    text = []
+    with client.stream("POST", "/chat/stream", json={"query": query}) as response:
+        for event, data in parse_sse(response.iter_lines()):
+            marks.setdefault(event, time.perf_counter() - start)
+            if event == "token":
+                text.append(data["text"])
+            elif event == "error":
+                raise SystemExit(f"stream error: {data}")
+    marks["total"] = time.perf_counter() - start
+    return marks, "".join(text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming /chat time-to-first-byte benchmark")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--mistral-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    kanoon = ServerThread(make_kanoon_app(latency=0.05)).start()
+    mistral = ServerThread(make_mistral_app(latency=args.mistral_latency, answer=ANSWER,
+                                            token_latency=args.token_latency)).start()
+    os.environ.update(IK_BASE_URL=kanoon.url, IK_API_KEY="stub", MISTRAL_SERVER_URL=mistral.url,
+                      MISTRAL_API_KEY="stub", GEMINI_API_KEY="", SEARCH_CACHE_ENABLED="0",
+                      RESPONSE_CACHE_ENABLED="0")
+    import main
+    main.limiter.enabled = False
+
+    backend = ServerThread(main.app).start()
+    try:
+        with httpx.Client(base_url=backend.url, timeout=60) as client:
+            blocking = []
+            streams = []
+            for i in range(args.requests):
+                query = QUERIES[i % len(QUERIES)]
+                start = time.perf_counter()
+                answer = client.post("/chat", json={"query": query}).json()["response"]["lawyer_response"]
+                blocking.append(time.perf_counter() - start)
+                marks, streamed = measure_stream(client, query)
+                streams.append(marks)
+                if streamed.strip() != answer.strip():
+                    print("streamed text differs from /chat answer")
+                    sys.exit(1)
+    finally:
+        backend.stop()
+        mistral.stop()
+        kanoon.stop()
+
+    ms = lambda values: statistics.median(values) * 1000
+    print(f"/chat               total        p50 {ms(blocking):8.1f} ms")
+    for event in ("entities", "kanoon", "token", "done", "total"):
+        print(f"/chat/stream first {event:<9} p50 {ms([m[event] for m in streams]):8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# stub_servers.py
+# Local stand-ins for api.indiankanoon.org and the Mistral chat API, so the
+# backend can be exercised without network access or API quota.
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class ServerThread:
+    """Run an ASGI app with uvicorn on a background thread"""
+    def __init__(self, app, port=None):
+        self.port = port or free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def fake_doc(tid, query=""):
+    return {
+        "tid": tid,
+        "title": f"State v. Party {tid} on {query or 'a matter'}",
+        "docsource": "Delhi High Court",
+        "publishdate": "2021-%02d-%02d" % (tid % 12 + 1, tid % 28 + 1),
+        "headline": f"... the <b>{query}</b> was considered under section {tid % 500} ...",
+        "docsize": 1000 + tid,
+    }
+
+def make_kanoon_app(latency=0.05, error_rate=0.0, docs_per_page=10, max_results=None):
+    """Fake Kanoon API: POST /search/ and POST /doc/<id>/ with configurable latency and errors.
+
+    With max_results set, searches run out of hits after that many docs so
+    that paginated crawls terminate.
+    """
+    app = FastAPI()
+    app.state.calls = 0
+
+    async def maybe_fail():
+        app.state.calls += 1
+        await asyncio.sleep(latency)
+        if error_rate and random.random() < error_rate:
+            return PlainTextResponse("error code: 502", status_code=502)
+        return None
+
+    @app.post("/search/")
+    async def search(formInput: str = "", pagenum: int = 0, maxpages: int = 1):
+        failed = await maybe_fail()
+        if failed:
+            return failed
+        seed = sum(map(ord, formInput))
+        first = pagenum * docs_per_page
+        last = first + docs_per_page * maxpages
+        if max_results is not None:
+            last = min(last, max_results)
+        docs = [fake_doc(seed * 100 + i, formInput) for i in range(first, last)]
+        return {"found": "%d - %d of %s" % (first + 1, last, max_results or 1000), "docs": docs}
+
+    @app.post("/doc/{docid}/")
+    async def doc(docid: int):
+        failed = await maybe_fail()
+        if failed:
+            return failed
+        document = fake_doc(docid)
+        document["doc"] = "<p>" + " ".join(["Judgment text for bail under section 437."] * 50) + "</p>"
+        return document
+
+    return app
+
+def make_mistral_app(latency=0.2, answer="This is a stub legal answer.", token_latency=0.02, concurrency=None):
+    """Fake Mistral API implementing POST /v1/chat/completions, streaming or not.
+
+    Non-streaming calls answer after latency seconds. Streaming calls send the
+    first chunk after latency seconds and then one word every token_latency.
+    With concurrency set, at most that many calls are served at once and
+    the rest queue, like an upstream with limited capacity.
+    """
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.open_streams = 0  # streams still being sent (not finished or dropped)
+    slots = asyncio.Semaphore(concurrency) if concurrency else None
+
+    def chunk(body, content, finish_reason=None):
+        return {
+            "id": "stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "delta": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+        }
+
+    async def stream(body):
+        app.state.open_streams += 1
+        try:
+            await asyncio.sleep(latency)
+            for word in answer.split(" "):
+                yield f"data: {json.dumps(chunk(body, word + ' '))}\n\n"
+                await asyncio.sleep(token_latency)
+            yield f"data: {json.dumps(chunk(body, '', 'stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            app.state.open_streams -= 1
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        if body.get("stream"):
+            return StreamingResponse(stream(body), media_type="text/event-stream")
+        if slots:
+            async with slots:
+                await asyncio.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        return {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+        }
+
+    return app
+
+def make_stub_provider(name, latency=0.2, tail_rate=0.0, tail_factor=10.0, error_rate=0.0,
+                       answer="This is a stub legal answer.", token_latency=0.0, timeout=60.0, rng=None):
+    """In-process llm_router.Provider with a long-tailed latency and random errors.
+
+    A call takes latency seconds (times tail_factor for a tail_rate fraction
+    of calls); an error_rate fraction fail after that delay instead.
+    """
+    from llm_router import Provider
+    rng = rng or random.Random()
+
+    async def delay():
+        seconds = latency * (tail_factor if rng.random() < tail_rate else 1.0) * rng.uniform(0.8, 1.2)
+        await asyncio.sleep(seconds)
+        if error_rate and rng.random() < error_rate:
+            raise RuntimeError(f"{name} stub error")
+
+    async def complete(prompt):
+        await delay()
+        return answer
+
+    async def stream(prompt):
+        await delay()
+        for word in answer.split(" "):
+            yield word + " "
+            await asyncio.sleep(token_latency)
+
+    return Provider(name, complete, stream, timeout=timeout)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the stub Kanoon and Mistral servers")
+    parser.add_argument("--kanoon-port", type=int, default=8101)
+    parser.add_argument("--mistral-port", type=int, default=8102)
+    parser.add_argument("--kanoon-latency", type=float, default=0.05)
+    parser.add_argument("--mistral-latency", type=float, default=0.2)
+    args = parser.parse_args()
+    kanoon = ServerThread(make_kanoon_app(args.kanoon_latency), args.kanoon_port).start()
+    mistral = ServerThread(make_mistral_app(args.mistral_latency), args.mistral_port).start()
+    print(json.dumps({"IK_BASE_URL": kanoon.url, "MISTRAL_SERVER_URL": mistral.url}))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        kanoon.stop()
+        mistral.stop()
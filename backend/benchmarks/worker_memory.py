@@ -0,0 +1,100 @@
+# worker_memory.py
+# Total memory of the gunicorn master and its uvicorn workers for a range of
+# worker counts, with the NER model preloaded in the master (shared
+# copy-on-write) and loaded separately in each worker.
+#
+#   cd backend && python -m benchmarks.worker_memory --workers 1 2 4
+#
+# RSS counts shared pages once per process; PSS splits them between the
+# processes sharing them, so its sum is the memory actually used.
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.stub_servers import free_port
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def memory_kib(pid):
+    """(rss, pss) of a process in KiB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0]] = int(parts[1])
+    return values["Rss:"], values["Pss:"]
+
+def wait_ready(url, workers, deadline):
+    """Until /readyz has answered 200 to 5 new connections per worker in a row, or deadline"""
+    streak = 0
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(f"{url}/readyz", headers={"Connection": "close"}, timeout=5)
+            streak = streak + 1 if response.status_code == 200 else 0
+            if streak >= 5 * workers:
+                return True
+        except httpx.HTTPError:
+            streak = 0
+        time.sleep(0.05)
+    return False
+
+def settled_usage(pid, workers):
+    """Memory of the master and its workers once the total has stopped growing"""
+    previous = None
+    while True:
+        pids = [pid] + children(pid)
+        usage = [memory_kib(p) for p in pids]
+        total = sum(rss for rss, _ in usage)
+        if len(pids) > workers and previous is not None and abs(total - previous) < 0.01 * total:
+            return usage
+        previous = total
+        time.sleep(1)
+
+def measure(workers, preload, timeout):
+    port = free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PRELOAD_MODEL="1" if preload else "0",
+               PORT=str(port), STARTUP_MODE="eager", LOCAL_INDEX_ENABLED="0", LOG_LEVEL="WARNING")
+    env.setdefault("IK_API_KEY", "stub")
+    log = tempfile.TemporaryFile()
+    master = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                              env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        if not wait_ready(url, workers, time.monotonic() + timeout):
+            log.seek(0)
+            sys.stderr.write(log.read().decode(errors="replace")[-4000:])
+            raise SystemExit(f"gunicorn with {workers} workers did not become ready")
+        usage = settled_usage(master.pid, workers)
+        return sum(rss for rss, _ in usage), sum(pss for _, pss in usage)
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=60)
+        log.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory against gunicorn worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the workers")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'mode':<10} {'total RSS MiB':>14} {'total PSS MiB':>14} {'PSS/worker':>11}")
+    for workers in args.workers:
+        for preload in (False, True):
+            rss, pss = measure(workers, preload, args.timeout)
+            print(f"{workers:7d} {'preload' if preload else 'per-worker':<10} {rss / 1024:14.1f} "
+                  f"{pss / 1024:14.1f} {pss / 1024 / workers:11.1f}")
+
+if __name__ == "__main__":
+    main()
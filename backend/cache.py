@@ -0,0 +1,294 @@
+# cache.py
+# In-process caches used by the chat pipeline.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+class CacheStats:
+    """Thread-safe hit/miss/eviction counters"""
+    FIELDS = ('hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self, fields=None):
+        self.fields = fields or self.FIELDS
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(self.fields, 0)
+
+    def incr(self, field, n=1):
+        with self.lock:
+            self.counts[field] += n
+
+    def as_dict(self):
+        with self.lock:
+            return dict(self.counts)
+
+class TTLCache:
+    """Size-bounded LRU mapping whose entries expire after ttl seconds"""
+    def __init__(self, maxsize=1024, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                self.stats.incr('misses')
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self.data[key]
+                self.stats.incr('expirations')
+                self.stats.incr('misses')
+                return default
+            self.data.move_to_end(key)
+            self.stats.incr('hits')
+            return value
+
+    def put(self, key, value, ttl=None):
+        with self.lock:
+            self.data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.stats.incr('evictions')
+
+    def pop(self, key, default=None):
+        with self.lock:
+            item = self.data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def as_dict(self):
+        stats = self.stats.as_dict()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'] = len(self.data)
+        return stats
+
+class SingleFlight:
+    """Run call() once per key; concurrent and later callers share its result.
+
+    With keep, results are kept for the life of the object, which is then
+    meant to live for one unit of work (a batch); without it only calls in
+    flight are shared. A call that fails or is cancelled is forgotten, so
+    the next caller with its key runs it again.
+    """
+    def __init__(self, keep=True):
+        self.keep = keep
+        self.futures = {}
+        self.stats = CacheStats(('calls', 'shared'))
+
+    async def do(self, key, call):
+        future = self.futures.get(key)
+        if future is None:
+            self.stats.incr('calls')
+            future = self.futures[key] = asyncio.ensure_future(call())
+            future.add_done_callback(lambda f: self.forget(key, f))
+        else:
+            self.stats.incr('shared')
+        # One caller going away must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    def forget(self, key, future):
+        if not self.keep or future.cancelled() or future.exception() is not None:
+            self.futures.pop(key, None)
+
+def normalize_query(q):
+    return re.sub(r'\s+', ' ', q).strip().lower()
+
+class NERMemo:
+    """LRU/TTL memo of NER results, so a repeated query skips tokenization and inference.
+
+    Texts are expected to be normalized already (sanitized, whitespace
+    collapsed) and are matched exactly: the model is cased, so "Delhi High
+    Court" and "delhi high court" can get different entities.
+    """
+    def __init__(self, maxsize=4096, ttl=86400.0):
+        self.entries = TTLCache(maxsize, ttl)
+
+    def get(self, text):
+        """Return the entities for text, or None"""
+        return self.entries.get(text)
+
+    def put(self, text, entities):
+        self.entries.put(text, entities)
+
+    def as_dict(self):
+        return self.entries.as_dict()
+
+class SearchCache:
+    """Two-tier cache for Indian Kanoon search responses.
+
+    Tier one is a TTLCache in memory; tier two is one JSON entry per search in
+    <datadir>/search_cache, written through a FileStorage and bounded by
+    max_disk_entries (oldest entries are evicted first). Entries are
+    overwritten and evicted all the time, so not through a PackedStorage,
+    which never reclaims the space of old records until compacted offline. Entries are keyed on
+    the normalized query, pagenum and maxpages.
+
+    The disk tier is shared by every worker process: a memory miss reads the
+    entry's path rather than this process's disk_index, and the bound is
+    enforced by prune(), which rescans the directory (so it counts the other
+    workers' entries too) every prune_every writes. aget() and aput() keep
+    the disk work off the event loop.
+    """
+    STATS_FIELDS = ('memory_hits', 'disk_hits', 'misses', 'evictions', 'expirations', 'writes')
+
+    def __init__(self, storage, ttl=86400.0, max_memory_entries=1024, max_disk_entries=50000):
+        self.storage = storage
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = max(1, max_disk_entries // 100)
+        self.memory = TTLCache(max_memory_entries, ttl)
+        self.stats = CacheStats(self.STATS_FIELDS)
+        self.lock = threading.Lock()
+        self.cachedir = os.path.join(storage.datadir, 'search_cache')
+        storage.make_dir(self.cachedir)
+        self.disk_index = self.load_disk_index()  # keyhash -> created, oldest first
+        self.writes_since_prune = 0
+
+    def load_disk_index(self):
+        entries = []
+        for name, mtime in self.storage.listdir(self.cachedir):
+            if name.endswith('.json'):
+                entries.append((mtime, name[:-5]))
+        entries.sort()
+        return OrderedDict((keyhash, created) for created, keyhash in entries)
+
+    def make_key(self, q, pagenum, maxpages):
+        return '%s|%d|%d' % (normalize_query(q), pagenum, maxpages)
+
+    def get_path(self, keyhash):
+        return os.path.join(self.cachedir, '%s.json' % keyhash)
+
+    def get_memory(self, key):
+        results = self.memory.get(key)
+        if results is not None:
+            self.stats.incr('memory_hits')
+        return results
+
+    def get_disk(self, key):
+        """The response saved on disk for key, by this or any other worker, or None"""
+        keyhash = hashlib.sha1(key.encode('utf8')).hexdigest()
+        try:
+            entry = json.loads(self.storage.read(self.get_path(keyhash)))
+        except FileNotFoundError:
+            with self.lock:
+                self.disk_index.pop(keyhash, None)
+            self.stats.incr('misses')
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning('Unreadable search cache entry %s: %s', keyhash, e)
+            self.remove_disk_entry(keyhash)
+            self.stats.incr('misses')
+            return None
+
+        with self.lock:
+            # Entries written before 'created' was stored fall back to their mtime
+            created = entry.get('created', self.disk_index.get(keyhash))
+            if created is not None and keyhash not in self.disk_index:
+                self.disk_index[keyhash] = created
+        if created is None or created + self.ttl < time.time():
+            self.remove_disk_entry(keyhash)
+            self.stats.incr('expirations')
+            self.stats.incr('misses')
+            return None
+
+        results = entry['results']
+        self.memory.put(key, results, ttl=max(created + self.ttl - time.time(), 1))
+        self.stats.incr('disk_hits')
+        return results
+
+    def get(self, q, pagenum, maxpages):
+        """Return the cached response string, or None"""
+        key = self.make_key(q, pagenum, maxpages)
+        results = self.get_memory(key)
+        if results is None:
+            results = self.get_disk(key)
+        return results
+
+    async def aget(self, q, pagenum, maxpages):
+        """get(), reading the disk tier on the default executor"""
+        key = self.make_key(q, pagenum, maxpages)
+        results = self.get_memory(key)
+        if results is None:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.get_disk, key)
+        return results
+
+    def put_disk(self, key, results):
+        keyhash = hashlib.sha1(key.encode('utf8')).hexdigest()
+        created = time.time()
+        entry = json.dumps({'key': key, 'created': created, 'results': results})
+        try:
+            self.storage.save_json(entry, self.get_path(keyhash))
+        except OSError as e:
+            logger.warning('Failed to write search cache entry %s: %s', keyhash, e)
+            return
+        self.stats.incr('writes')
+
+        with self.lock:
+            self.disk_index[keyhash] = created
+            self.disk_index.move_to_end(keyhash)
+            self.writes_since_prune += 1
+            due = len(self.disk_index) > self.max_disk_entries or self.writes_since_prune >= self.prune_every
+            if due:
+                self.writes_since_prune = 0
+        if due:
+            self.prune()
+
+    def put(self, q, pagenum, maxpages, results):
+        key = self.make_key(q, pagenum, maxpages)
+        self.memory.put(key, results)
+        self.put_disk(key, results)
+
+    async def aput(self, q, pagenum, maxpages, results):
+        """put(), writing the disk tier on the default executor"""
+        key = self.make_key(q, pagenum, maxpages)
+        self.memory.put(key, results)
+        await asyncio.get_running_loop().run_in_executor(None, self.put_disk, key, results)
+
+    def prune(self):
+        """Rescan the cache directory, written to by every worker, and if it
+        holds more than max_disk_entries evict the oldest entries, down to
+        prune_every below the bound so the next rescan is writes away"""
+        index = self.load_disk_index()
+        evicted = []
+        if len(index) > self.max_disk_entries:
+            evicted = list(index)[:len(index) - self.max_disk_entries + self.prune_every]
+        with self.lock:
+            self.disk_index = index
+        for keyhash in evicted:
+            self.remove_disk_entry(keyhash)
+            self.stats.incr('evictions')
+
+    def remove_disk_entry(self, keyhash):
+        with self.lock:
+            self.disk_index.pop(keyhash, None)
+        try:
+            self.storage.remove(self.get_path(keyhash))
+        except OSError:
+            pass
+
+    def as_dict(self):
+        stats = self.stats.as_dict()
+        stats['memory_evictions'] = self.memory.stats.as_dict()['evictions']
+        stats['memory_entries'] = len(self.memory)
+        stats['disk_entries'] = len(self.disk_index)
+        return stats
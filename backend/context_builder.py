@@ -0,0 +1,161 @@
+# context_builder.py
+# Turns raw Indian Kanoon search responses into a compact, ranked prompt
+# context that fits a token budget.
+import html
+import json
+import re
+import threading
+
+TAG_RE = re.compile(r'<[^>]+>')
+WORD_RE = re.compile(r'\w+')
+BLOCK_TAG_RE = re.compile(r'(?i)</?(?:p|br|div|blockquote|pre|h\d|li|tr)\b[^>]*>')
+
+def strip_markup(text):
+    text = html.unescape(TAG_RE.sub(' ', text or ''))
+    return re.sub(r'\s+', ' ', text).strip()
+
+def split_paragraphs(doc_html, min_chars=40):
+    """Plain-text paragraphs of a Kanoon doc's HTML, skipping very short ones (headings, page numbers)"""
+    paragraphs = (strip_markup(block) for block in BLOCK_TAG_RE.split(doc_html or ''))
+    return [p for p in paragraphs if len(p) >= min_chars]
+
+def extract_passages(paragraphs, entities, max_passages=2, max_chars=600):
+    """The paragraphs that best match the entities, in document order.
+
+    A paragraph scores one per distinct entity word it contains and two
+    more per entity it contains as a phrase. Long paragraphs are cut to
+    max_chars around their first entity word.
+    """
+    entity_words = {w for e in entities for w in WORD_RE.findall(e.lower())}
+    phrases = [e.lower() for e in entities if ' ' in e.strip()]
+    if not entity_words:
+        return []
+
+    scored = []
+    for i, paragraph in enumerate(paragraphs):
+        lowered = paragraph.lower()
+        score = len(entity_words & set(WORD_RE.findall(lowered)))
+        if score:
+            scored.append((score + 2 * sum(phrase in lowered for phrase in phrases), i))
+    top = sorted(scored, key=lambda item: (-item[0], item[1]))[:max_passages]
+
+    passages = []
+    for _, i in sorted(top, key=lambda item: item[1]):
+        paragraph = paragraphs[i]
+        if len(paragraph) > max_chars:
+            first = min(m.start() for m in WORD_RE.finditer(paragraph.lower()) if m.group() in entity_words)
+            start = max(0, min(first - max_chars // 3, len(paragraph) - max_chars))
+            excerpt = paragraph[start:start + max_chars]
+            if start:
+                excerpt = '... ' + excerpt.split(' ', 1)[-1]
+            if start + max_chars < len(paragraph):
+                excerpt = excerpt.rsplit(' ', 1)[0] + ' ...'
+            paragraph = excerpt
+        passages.append(paragraph)
+    return passages
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English)"""
+    return (len(text) + 3) // 4
+
+def compact_docs(indian_kanoon_results):
+    """Keep only tid, title, docsource, the headline snippet and any passages (see enrichment.py) of each search hit"""
+    docs = []
+    for doc in indian_kanoon_results.get('docs', []):
+        docs.append({
+            'tid': doc.get('tid'),
+            'title': strip_markup(doc.get('title')),
+            'docsource': strip_markup(doc.get('docsource')),
+            'headline': strip_markup(doc.get('headline')),
+            'passages': doc.get('passages') or [],
+        })
+    return docs
+
+def rank_docs(docs, entities):
+    """Order docs by how many entity words appear in their title and headline.
+
+    Ties keep Kanoon's own ranking.
+    """
+    entity_words = {w for e in entities for w in WORD_RE.findall(e.lower())}
+
+    def overlap(doc):
+        words = set(WORD_RE.findall(('%s %s' % (doc['title'], doc['headline'])).lower()))
+        return len(entity_words & words)
+
+    return sorted(docs, key=overlap, reverse=True)
+
+def format_doc(position, doc, headline, passages=()):
+    line = '[%d] %s (%s, tid %s)' % (position, doc['title'], doc['docsource'], doc['tid'])
+    if headline:
+        line += '\n    ' + headline
+    for passage in passages:
+        line += '\n    > ' + passage
+    return line
+
+def build_context(indian_kanoon_results, entities, token_budget=1500):
+    """Return (context, stats) for the prompt.
+
+    stats holds the estimated token counts of the raw json.dumps(indent=2)
+    form and of the compact context, plus how many docs and full-text
+    passages were kept. A doc's passages are dropped, last first, before
+    its headline is cut.
+    """
+    raw_tokens = estimate_tokens(json.dumps(indian_kanoon_results, indent=2))
+
+    if 'docs' not in indian_kanoon_results:
+        # Error or "no entities" messages are passed through as-is
+        context = json.dumps(indian_kanoon_results)
+        return context, {'raw_tokens': raw_tokens, 'context_tokens': estimate_tokens(context),
+                         'docs_in': 0, 'docs_used': 0, 'passages_used': 0}
+
+    docs = rank_docs(compact_docs(indian_kanoon_results), entities)
+    lines = []
+    used_tokens = 0
+    passages_used = 0
+    for doc in docs:
+        remaining = token_budget - used_tokens
+        passages = doc['passages']
+        line = format_doc(len(lines) + 1, doc, doc['headline'], passages)
+        cost = estimate_tokens(line) + 1
+        while cost > remaining and passages:
+            passages = passages[:-1]
+            line = format_doc(len(lines) + 1, doc, doc['headline'], passages)
+            cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            # Try the doc without most of its snippet before giving up
+            header = format_doc(len(lines) + 1, doc, '')
+            room = (remaining - estimate_tokens(header) - 2) * 4
+            if room < 40:
+                break
+            line = format_doc(len(lines) + 1, doc, doc['headline'][:room].rsplit(' ', 1)[0] + ' ...')
+            cost = estimate_tokens(line) + 1
+        lines.append(line)
+        used_tokens += cost
+        passages_used += len(passages)
+
+    context = '\n'.join(lines) if lines else 'No matching documents.'
+    return context, {'raw_tokens': raw_tokens, 'context_tokens': estimate_tokens(context),
+                     'docs_in': len(docs), 'docs_used': len(lines), 'passages_used': passages_used}
+
+class PromptStats:
+    """Running totals of prompt-context token savings, exposed through /stats"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.raw_tokens = 0
+        self.context_tokens = 0
+        self.passages_used = 0
+
+    def record(self, stats):
+        with self.lock:
+            self.requests += 1
+            self.raw_tokens += stats['raw_tokens']
+            self.context_tokens += stats['context_tokens']
+            self.passages_used += stats.get('passages_used', 0)
+
+    def as_dict(self):
+        with self.lock:
+            reduction = 1 - self.context_tokens / self.raw_tokens if self.raw_tokens else 0.0
+            return {'requests': self.requests, 'raw_tokens': self.raw_tokens,
+                    'context_tokens': self.context_tokens, 'passages_used': self.passages_used,
+                    'reduction': round(reduction, 4)}
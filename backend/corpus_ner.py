@@ -0,0 +1,177 @@
+# corpus_ner.py
+# Named entities of every document mirrored into the storage datadir by
+# ik_download, written to an entity index (docid -> entities).
+#
+#   python corpus_ner.py -D ./indian_kanoon_cache -N 4
+#
+# appends to <datadir>/entity_index.jsonl, one line per doc. A run skips the
+# docs already in the index at their current mtime, so an interrupted run
+# picks up where it stopped and a later one only processes new or updated docs.
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from context_builder import strip_markup
+
+logger = logging.getLogger('ikapi.corpus_ner')
+
+INDEX_NAME = 'entity_index.jsonl'
+
+# Set before the pool forks, so the workers share the weights copy-on-write
+_storage = None
+_model = None
+_tokenizer = None
+
+def load_index(filepath):
+    """{path: (tid, mtime, entities)} of the latest entry for each doc in the index file.
+
+    A line cut short by an interrupted run is dropped and truncated away, so
+    appending resumes on a line boundary.
+    """
+    entries = {}
+    if not os.path.exists(filepath):
+        return entries
+    good = 0
+    with open(filepath, 'rb') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning('Dropping a partial entry at byte %d of %s', good, filepath)
+                break
+            entries[entry['path']] = (entry['tid'], entry['mtime'], entry['entities'])
+            good += len(line)
+    if good < os.path.getsize(filepath):
+        with open(filepath, 'r+b') as f:
+            f.truncate(good)
+    return entries
+
+def entities_by_docid(filepath):
+    """docid -> [(entity, label, start, end)], offsets into the doc's plain text"""
+    return {tid: [tuple(e) for e in entities] for tid, _, entities in load_index(filepath).values()}
+
+def init_worker(backend, threads):
+    global _model, _tokenizer
+    import torch
+    torch.set_num_threads(threads)
+    if _model is None:
+        from legal_ner import load_model
+        _model, _tokenizer = load_model(backend=backend)
+
+def process_files(paths):
+    """[(path, tid, mtime, entities)] for a chunk of doc files, extracted in one batch.
+
+    Docs whose inference failed are left out, so they are not marked done
+    in the index and the next run retries them.
+    """
+    from legal_ner import extract_ner_entities_batch
+
+    docs = []
+    for path, mtime in paths:
+        try:
+            d = json.loads(_storage.read(path))
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            logger.warning('Could not read %s: %s', path, e)
+            continue
+        if not isinstance(d, dict) or 'tid' not in d or 'doc' not in d:
+            continue
+        docs.append((path, d['tid'], mtime, strip_markup(d['doc'])))
+    if not docs:
+        return []
+
+    entities = extract_ner_entities_batch([text for _, _, _, text in docs], _model, _tokenizer)
+    results = []
+    for (path, tid, mtime, _), doc_entities in zip(docs, entities):
+        if doc_entities is None:
+            logger.warning('NER failed on %s, will retry on the next run', path)
+            continue
+        results.append((path, tid, mtime, doc_entities))
+    return results
+
+def run(storage, filepath, workers=None, backend='fp32', chunk_size=4):
+    """Add the entities of the docs in storage that are not yet in the index file.
+
+    Docs are split into chunks of chunk_size, each run as one NER batch
+    (its windows in forward passes of WINDOW_BATCH), on a pool of worker
+    processes, each with an equal share of the cores for torch. Every chunk
+    is appended to the index file as soon as it is done. Returns the number
+    of docs processed and docs/sec.
+    """
+    global _storage, _model, _tokenizer
+
+    done = load_index(filepath)
+    files = [(path, mtime) for path, mtime in storage.iter_doc_files()
+             if done.get(path, (None, None))[1] != mtime]
+    logger.info('%d docs indexed, %d to process', len(done), len(files))
+    if not files:
+        return 0, 0.0
+
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    _storage = storage
+    # onnxruntime sessions are not fork-safe, so those load in each worker
+    if backend != 'onnx' and _model is None:
+        from legal_ner import load_model
+        _model, _tokenizer = load_model(backend=backend)
+
+    start = time.perf_counter()
+    processed = 0
+    batches = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    with open(filepath, 'a', encoding='utf-8') as out:
+        def write(results):
+            nonlocal processed
+            for path, tid, mtime, entities in results:
+                out.write(json.dumps({'path': path, 'tid': tid, 'mtime': mtime,
+                                      'entities': entities}, ensure_ascii=False) + '\n')
+            out.flush()
+            processed += len(results)
+            if processed and processed % 100 < len(results):
+                logger.info('%d/%d docs, %.2f docs/sec', processed, len(files),
+                            processed / (time.perf_counter() - start))
+
+        if workers > 1:
+            with multiprocessing.get_context('fork').Pool(workers, init_worker, (backend, threads)) as pool:
+                for results in pool.imap_unordered(process_files, batches):
+                    write(results)
+        else:
+            init_worker(backend, threads)
+            for batch in batches:
+                write(process_files(batch))
+
+    rate = processed / (time.perf_counter() - start)
+    logger.info('Extracted entities from %d docs with %d workers: %.2f docs/sec', processed, workers, rate)
+    return processed, rate
+
+if __name__ == '__main__':
+    from ik_download import FileStorage, setup_logging
+
+    parser = argparse.ArgumentParser(description='Run NER over the docs in a datadir into an entity index')
+    parser.add_argument('-D', '--datadir', dest='datadir', required=True, help='storage datadir')
+    parser.add_argument('-N', '--workers', dest='workers', type=int, default=None,
+                        help='NER processes (default: all cores)')
+    parser.add_argument('--packed', dest='packed', action='store_true', default=False,
+                        help='datadir uses PackedStorage')
+    parser.add_argument('--backend', dest='backend', default=os.environ.get('NER_BACKEND', 'fp32'),
+                        help='NER runtime: fp32, int8 or onnx')
+    parser.add_argument('-o', '--output', dest='output', default=None,
+                        help='index file (default: <datadir>/%s)' % INDEX_NAME)
+    parser.add_argument('--restart', dest='restart', action='store_true', default=False,
+                        help='discard the existing index')
+    parser.add_argument('-l', '--loglevel', dest='loglevel', default='info')
+    args = parser.parse_args()
+    setup_logging(args.loglevel)
+
+    if args.packed:
+        from packed_storage import PackedStorage
+        storage = PackedStorage(args.datadir)
+    else:
+        storage = FileStorage(args.datadir)
+
+    filepath = args.output or os.path.join(args.datadir, INDEX_NAME)
+    if args.restart and os.path.exists(filepath):
+        os.remove(filepath)
+    processed, rate = run(storage, filepath, args.workers, args.backend)
+    logger.warning('Saved %s: %d docs added (%.2f docs/sec)', filepath, processed, rate)
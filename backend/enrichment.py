@@ -0,0 +1,150 @@
+# enrichment.py
+# Full text of the top Kanoon hits for the prompt. Search results only carry
+# a headline snippet; DocCache fetches the judgments themselves (fetch_doc)
+# and keeps them, so a doc is fetched from Kanoon once and every later hit
+# on it is answered locally.
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import CacheStats, SingleFlight, TTLCache
+from context_builder import split_paragraphs
+
+logger = logging.getLogger(__name__)
+
+class DocCache:
+    """Kanoon docs by docid, saved through the storage backend (FileStorage or PackedStorage).
+
+    Docs are stored where ik_download saves them (<docsource>/<year>/<date>/
+    <docid>.json) and recorded in its manifest, so docs already mirrored by
+    a crawl are read instead of fetched and docs fetched here are not
+    downloaded again by the next crawl. The split paragraphs of recently
+    used docs are also kept in memory. Concurrent requests for a doc share
+    one fetch.
+
+    fetch(docid) is a coroutine returning the /doc/ response string.
+    Nothing blocking runs on the event loop. Storage reads and writes use
+    the default executor. Manifest lookups and writes (the first one loads
+    the whole manifest) and doc directory creation run on a thread of
+    their own, because the manifest's SQLite connection may only be used
+    by the thread that opened it.
+    """
+    STATS_FIELDS = ('memory_hits', 'storage_hits', 'fetches', 'shared_fetches', 'errors', 'timeouts')
+
+    def __init__(self, storage, manifest, fetch, memory_entries=256, ttl=86400.0):
+        self.storage = storage
+        self.manifest = manifest
+        self.fetch = fetch
+        self.memory = TTLCache(memory_entries, ttl)
+        self.inflight = SingleFlight(keep=False)
+        self.stats = CacheStats(self.STATS_FIELDS)
+        self.manifest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='doc-manifest')
+
+    def doc_path(self, hit):
+        """Where the doc of a search hit is (or would be) saved (on manifest_executor)"""
+        entry = self.manifest.get(hit['tid'])
+        if entry is not None:
+            return entry['path']
+        if hit.get('publishdate'):
+            docpath = self.storage.get_docpath(hit.get('docsource') or 'unknown', hit['publishdate'])
+        else:
+            docpath = self.storage.datadir
+        return self.storage.get_json_orig_path(docpath, hit['tid'])[0]
+
+    def read_saved(self, path, docsize):
+        """The saved doc at path, or None if there is none or its docsize has changed"""
+        if not self.storage.exists(path):
+            return None
+        try:
+            d = json.loads(self.storage.read(path))
+        except (OSError, ValueError) as e:
+            logger.warning('Unreadable saved doc %s: %s', path, e)
+            return None
+        if docsize is not None and d.get('docsize') not in (None, docsize):
+            return None
+        return d
+
+    async def get(self, hit):
+        """Paragraphs of the full text of a search hit (a dict with tid and, ideally,
+        docsource, publishdate and docsize), or None if the doc could not be had"""
+        tid = hit['tid']
+        paragraphs = self.memory.get(tid)
+        if paragraphs is not None:
+            self.stats.incr('memory_hits')
+            return paragraphs
+        if tid in self.inflight.futures:
+            self.stats.incr('shared_fetches')
+        return await self.inflight.do(tid, lambda: self.load(hit))
+
+    async def load(self, hit):
+        tid = hit['tid']
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(self.manifest_executor, self.doc_path, hit)
+        d = await loop.run_in_executor(None, self.read_saved, path, hit.get('docsize'))
+        if d is not None:
+            self.stats.incr('storage_hits')
+        else:
+            self.stats.incr('fetches')
+            jsonstr = await self.fetch(tid)
+            try:
+                d = json.loads(jsonstr)
+            except ValueError:
+                d = {'errmsg': 'undecodable response'}
+            if 'errmsg' in d or 'doc' not in d:
+                self.stats.incr('errors')
+                logger.warning('Could not fetch doc %s: %s', tid, d.get('errmsg', 'no doc in response'))
+                return None
+            await loop.run_in_executor(None, self.storage.save_json, jsonstr, path)
+            await loop.run_in_executor(self.manifest_executor, self.manifest.record, tid, jsonstr, path,
+                                       d.get('docsize'), hit.get('docsource'), hit.get('publishdate'))
+
+        paragraphs = await loop.run_in_executor(None, split_paragraphs, d.get('doc'))
+        self.memory.put(tid, paragraphs)
+        return paragraphs
+
+    async def get_many(self, hits, concurrency=3, deadline=3.0):
+        """{tid: paragraphs} for the hits, at most concurrency loading at once.
+
+        Hits not loaded within deadline seconds are left out; fetches that
+        have started carry on in the background and fill the cache for the
+        next request.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(hit):
+            async with semaphore:
+                return hit['tid'], await self.get(hit)
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(run(hit)) for hit in hits]
+        done, pending = await asyncio.wait(tasks, timeout=deadline) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.stats.incr('timeouts', len(pending))
+            logger.info('Doc enrichment deadline (%.1fs) hit with %d of %d docs loaded',
+                        deadline, len(done), len(tasks))
+
+        docs = {}
+        for task in done:
+            try:
+                tid, paragraphs = task.result()
+            except Exception as e:
+                self.stats.incr('errors')
+                logger.warning('Doc enrichment failed: %s', e)
+                continue
+            if paragraphs:
+                docs[tid] = paragraphs
+        logger.debug('Loaded %d docs for enrichment in %.3fs', len(docs), time.perf_counter() - start)
+        return docs
+
+    def as_dict(self):
+        stats = self.stats.as_dict()
+        stats['memory_entries'] = len(self.memory)
+        stats['inflight'] = len(self.inflight.futures)
+        return stats
+
+    def close(self):
+        self.manifest_executor.shutdown(wait=False)
@@ -0,0 +1,44 @@
+# gunicorn.conf.py
+# Multi-process serving: uvicorn workers under a gunicorn master.
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# With PRELOAD_MODEL=1 (the default) main.py is imported and the NER weights
+# are loaded once in the master; the forked workers share them copy-on-write
+# instead of each holding its own copy. Workers are only forked once the
+# model has loaded.
+import multiprocessing
+import os
+import sys
+import tempfile
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+os.environ["WEB_CONCURRENCY"] = str(workers)  # main.py splits per-process quotas between the workers
+# Each worker writes metric snapshots here and /metrics sums them, so a
+# scrape covers every worker; stale snapshots from a previous run are cleared
+metrics_dir = os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "legalist-metrics"))
+os.makedirs(metrics_dir, exist_ok=True)
+for name in os.listdir(metrics_dir):
+    if name.endswith((".json", ".tmp")):
+        os.remove(os.path.join(metrics_dir, name))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ.get("PRELOAD_MODEL", "1") == "1"
+# Model loading and warmup happen before a worker first answers
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None  # RequestLogMiddleware writes one line per request
+
+def when_ready(server):
+    # Runs in the master after the app import and before the first fork
+    if preload_app:
+        import main
+        main.preload_for_fork()
+
+def post_fork(server, worker):
+    # Split the cores between the workers' torch intra-op thread pools
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        threads = int(os.environ.get("NER_TORCH_THREADS", "0")) or max(1, multiprocessing.cpu_count() // workers)
+        torch.set_num_threads(threads)
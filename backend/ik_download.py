@@ -5,7 +5,6 @@ import os
 import re
 import codecs
 import json
-import http.client
 import urllib.request, urllib.parse, urllib.error
 import base64
 import glob
@@ -14,6 +13,9 @@ import datetime
 import time
 import multiprocessing
 
+from manifest import Manifest
+from ik_http import IKHttpClient, CircuitBreaker, CircuitOpenError, UpstreamError, error_json
+
 def print_usage(progname):
     print('''python %s -t token -o offset -n limit -d datadir''' % progname)
 
@@ -26,55 +28,61 @@ class IKApi:
             'Accept': 'application/json'
         }
 
-        self.basehost = 'api.indiankanoon.org'
+        self.baseurl = getattr(args, 'baseurl', None) or 'https://api.indiankanoon.org'
+        self.http = IKHttpClient(
+            self.baseurl, self.headers,
+            pool_size=getattr(args, 'poolsize', 10),
+            timeout=getattr(args, 'timeout', 10.0),
+            deadline=getattr(args, 'deadline', 30.0),
+            breaker=CircuitBreaker(
+                failure_threshold=getattr(args, 'breaker_failures', 5),
+                reset_timeout=getattr(args, 'breaker_reset', 30.0)))
         self.storage = storage
         self.maxcites = args.maxcites
         self.maxcitedby = args.maxcitedby
         self.orig = args.orig
         self.maxpages = args.maxpages
         self.pathbysrc = args.pathbysrc
-        self.queue = multiprocessing.Queue(20)
-        self.num_workers = args.numworkers
+        self.queue = multiprocessing.JoinableQueue()
+        self.num_workers = max(1, args.numworkers)
+        self.failures = multiprocessing.Value('i', 0)
+        self.journal = CrawlJournal(os.path.join(storage.datadir, '.crawl_journal'))
+        self.manifest = Manifest(os.path.join(storage.datadir, '.manifest.sqlite'))
         self.addedtoday = args.addedtoday
         self.fromdate = args.fromdate
         self.todate = args.todate
         self.sortby = args.sortby
+        self.sync = getattr(args, 'sync', False)
+
+        if self.sync and not self.sortby:
+            # Newest first, so paging can stop at the first page with nothing new
+            self.sortby = 'mostrecent'
 
         if self.maxpages > 100:
             self.maxpages = 100
 
-    def call_api_direct(self, url):
-        connection = http.client.HTTPSConnection(self.basehost)
-        connection.request('POST', url, headers=self.headers)
-        response = connection.getresponse()
-        results = response.read()
+    def call_api(self, url):
+        try:
+            return self.http.call(url)
+        except (CircuitOpenError, UpstreamError) as e:
+            self.logger.error('Error in call_api %s %s', url, e)
+            return error_json(e)
 
-        if isinstance(results, bytes):
-            results = results.decode('utf8')
-        return results
+    async def call_api_async(self, url):
+        """Non-blocking variant of call_api for use inside the event loop"""
+        try:
+            return await self.http.acall(url)
+        except (CircuitOpenError, UpstreamError) as e:
+            self.logger.error('Error in call_api_async %s %s', url, e)
+            return error_json(e)
 
-    def call_api(self, url):
-        count = 0
+    def close(self):
+        self.http.close()
 
-        while count < 10:
-            try:
-                results = self.call_api_direct(url)
-                if results is None or (isinstance(results, str) and re.match('error code:', results)):
-                    self.logger.warning('Error in call_api %s %s', url, results)
-                    count += 1
-                    time.sleep(count * 5)  # Reduced sleep time for debugging
-                else:
-                    return results
-            except Exception as e:
-                self.logger.warning('Error in call_api %s %s', url, e)
-                count += 1
-                time.sleep(count * 5)  # Reduced sleep time for debugging
-        
-        # If we get here, all attempts failed
-        self.logger.error('Failed after 10 attempts: %s', url)
-        return json.dumps({"errmsg": "Failed to connect to Indian Kanoon API after multiple attempts"})
+    async def aclose(self):
+        await self.http.aclose()
 
-    def fetch_doc(self, docid):
+    def doc_url(self, docid):
         url = '/doc/%d/' % docid
 
         args = []
@@ -87,23 +95,241 @@ class IKApi:
         if args:
             url = url + '?' + '&'.join(args)
 
-        return self.call_api(url)
+        return url
+
+    def fetch_doc(self, docid):
+        return self.call_api(self.doc_url(docid))
 
-    # Keep other methods from the original file...
-    # Abbreviated for clarity, make sure to include all methods in your actual file
+    async def fetch_doc_async(self, docid):
+        return await self.call_api_async(self.doc_url(docid))
+
+    def fetch_orig_doc(self, docid):
+        return self.call_api('/origdoc/%d/' % docid)
+
+    def fetch_doc_fragment(self, docid, q):
+        q = urllib.parse.quote_plus(q.encode('utf8'))
+        return self.call_api('/docfragment/%d/?formInput=%s' % (docid, q))
+
+    def load_json(self, jsonstr, what):
+        try:
+            d = json.loads(jsonstr)
+        except ValueError:
+            self.logger.error('Error decoding json for %s', what)
+            return None
+
+        if 'errmsg' in d:
+            self.logger.error('Error for %s: %s', what, d['errmsg'])
+            return None
+        return d
+
+    def save_doc_fragment(self, docid, q):
+        jsonstr = self.fetch_doc_fragment(docid, q)
+        if self.load_json(jsonstr, 'docfragment %d' % docid) is None:
+            return False
+
+        filepath = os.path.join(self.storage.datadir, 'docfragment_%d.json' % docid)
+        return self.storage.save_json(jsonstr, filepath)
+
+    def download_orig_doc(self, docid, origpath):
+        d = self.load_json(self.fetch_orig_doc(docid), 'origdoc %d' % docid)
+        if d is None or 'doc' not in d:
+            return False
+
+        ctype = d.get('Content-Type', 'application/octet-stream')
+        filepath = '%s.%s' % (origpath, ctype.split('/')[-1])
+        self.storage.save_binary(base64.b64decode(d['doc']), filepath)
+        self.manifest.record_original(docid, origpath)
+        return True
+
+    def download_doc(self, docid, docpath, docsize=None, docsource=None, publishdate=None):
+        """Save a doc as <docpath>/<docid>.json unless the manifest already has it.
+
+        A doc whose docsize differs from the one in the manifest is fetched
+        again.
+        """
+        jsonpath, origpath = self.storage.get_json_orig_path(docpath, docid)
+
+        if not self.manifest.is_current(docid, docsize):
+            jsonstr = self.fetch_doc(docid)
+            d = self.load_json(jsonstr, 'doc %d' % docid)
+            if d is None:
+                return False
+            self.storage.save_json(jsonstr, jsonpath)
+            previous = self.manifest.get(docid)
+            changed = self.manifest.record(docid, jsonstr, jsonpath, d.get('docsize', docsize),
+                                           docsource, publishdate)
+            if previous is None:
+                self.logger.info('Saved doc %d', docid)
+            elif changed:
+                self.logger.info('Updated doc %d', docid)
+        else:
+            self.logger.debug('Skipping doc %d, already in the manifest', docid)
+
+        if self.orig and not self.manifest.get(docid)['origpath']:
+            return self.download_orig_doc(docid, origpath)
+        return True
+
+    def needs_fetch(self, docid, docsize=None):
+        if not self.manifest.is_current(docid, docsize):
+            return True
+        return self.orig and not self.manifest.get(docid)['origpath']
+
+    def save_search_page(self, q, pagenum):
+        """Save one search results page and return its docs, or None on error"""
+        jsonstr = self.search(q, pagenum, self.maxpages)
+        d = self.load_json(jsonstr, 'search %s page %d' % (q, pagenum))
+        if d is None:
+            return None
+
+        docs = d.get('docs', [])
+        if docs:
+            searchpath = self.storage.get_search_path(q)
+            self.storage.save_json(jsonstr, os.path.join(searchpath, 'page_%d.json' % pagenum))
+        return docs
+
+    # --- Bulk crawling ---
+    # Tasks on self.queue are ('search', q, pagenum) or
+    # ('doc', docid, docsource, publishdate, docsize). A search task queues a
+    # doc task for every new or changed hit and then the next page, so pages
+    # of one query are fetched in order while docs are downloaded by all the
+    # workers in parallel.
+
+    def run_task(self, task):
+        if task[0] == 'search':
+            q, pagenum = task[1:]
+            docs = self.save_search_page(q, pagenum)
+            if docs is None:
+                # Not journaled, so a resumed crawl retries this page
+                return False
+
+            fresh = 0
+            for doc in docs:
+                doctask = ('doc', doc['tid'], doc.get('docsource', 'unknown'),
+                           doc.get('publishdate'), doc.get('docsize'))
+                if not self.needs_fetch(doctask[1], doctask[4]):
+                    continue
+                fresh += 1
+                self.journal.record(doctask)
+                self.queue.put(doctask)
+
+            if docs and (fresh or not self.sync):
+                self.queue.put(('search', q, pagenum + self.maxpages))
+            elif docs:
+                self.logger.info('Nothing new on page %d of %s, stopping', pagenum, q)
+                docs = []
+            self.journal.record(('page', q, pagenum, len(docs)))
+            return True
+        elif task[0] == 'doc':
+            docid, docsource, publishdate, docsize = task[1:]
+            if publishdate:
+                docpath = self.storage.get_docpath(docsource, publishdate)
+            else:
+                docpath = self.storage.datadir
+            if not self.download_doc(docid, docpath, docsize, docsource, publishdate):
+                return False
+            self.journal.record(('done', docid))
+            return True
+        return False
+
+    def worker(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                break
+
+            try:
+                ok = self.run_task(task)
+            except Exception as e:
+                self.logger.exception('Error in task %s: %s', task, e)
+                ok = False
+            if not ok:
+                with self.failures.get_lock():
+                    self.failures.value += 1
+            # Only after any follow-up tasks are queued, so join() cannot return early
+            self.queue.task_done()
+        self.close()
+
+    def execute_tasks(self, queries):
+        """Crawl all result pages of the queries and download every hit with num_workers processes.
+
+        Progress is journaled under the datadir; if a previous crawl of the
+        same datadir did not finish, it is resumed instead of restarted.
+        """
+        queries = [self.window_query(q) for q in queries]
+        tasks = self.journal.pending_tasks(queries, self.maxpages)
+        if self.journal.exists():
+            self.logger.warning('Resuming crawl: %d pending tasks', len(tasks))
+
+        # Load the index before forking so every worker inherits it
+        self.manifest.load()
+        started = time.time()
+
+        workers = []
+        for i in range(self.num_workers):
+            w = multiprocessing.Process(target=self.worker, name='ikworker-%d' % i)
+            w.start()
+            workers.append(w)
+
+        for task in tasks:
+            self.queue.put(task)
+        self.queue.join()
+
+        for w in workers:
+            self.queue.put(None)
+        for w in workers:
+            w.join()
+
+        if self.failures.value:
+            self.logger.warning('%d tasks failed; run again to resume from %s',
+                                self.failures.value, self.journal.filepath)
+        else:
+            self.journal.clear()
+
+        # Workers wrote to the database, not to this process's copy of the index
+        self.manifest.index = None
+        self.logger.warning('Crawl done: %d docs fetched, %d in the manifest',
+                            self.manifest.fetched_since(started), len(self.manifest))
+
+    def window_query(self, q):
+        """Restrict q to the --fromdate/--todate/--addedtoday window and --sortby order"""
+        if self.fromdate:
+            q += ' fromdate: %s' % self.fromdate
+        if self.todate:
+            q += ' todate: %s' % self.todate
+        if self.addedtoday:
+            q += ' added:today'
+        if self.sortby:
+            q += ' sortby: %s' % self.sortby
+        return q
+
+    def save_search_results(self, q):
+        self.execute_tasks([q])
+
+    def download_doctype(self, doctype):
+        q = 'doctypes: %s' % doctype
+        self.logger.warning('Doctype q: %s', self.window_query(q))
+        self.execute_tasks([q])
+
+    def search_url(self, q, pagenum, maxpages):
+        q = urllib.parse.quote_plus(q.encode('utf8'))
+        return '/search/?formInput=%s&pagenum=%d&maxpages=%d' % (q, pagenum, maxpages)
 
     def search(self, q, pagenum, maxpages):
         """Search the Indian Kanoon API"""
         try:
-            q = urllib.parse.quote_plus(q.encode('utf8'))
-            url = '/search/?formInput=%s&pagenum=%d&maxpages=%d' % (q, pagenum, maxpages)
-            return self.call_api(url)
+            return self.call_api(self.search_url(q, pagenum, maxpages))
         except Exception as e:
             self.logger.error('Error in search method: %s', e)
             return json.dumps({"errmsg": str(e)})
 
-# Include other classes from the original file (FileStorage, etc.)
-# Abbreviated for clarity
+    async def search_async(self, q, pagenum, maxpages):
+        """Search the Indian Kanoon API without blocking the event loop"""
+        try:
+            return await self.call_api_async(self.search_url(q, pagenum, maxpages))
+        except Exception as e:
+            self.logger.error('Error in search_async method: %s', e)
+            return json.dumps({"errmsg": str(e)})
 
 def get_dateobj(datestr):
     ds = re.findall('\\d+', datestr)
@@ -111,7 +337,17 @@ def get_dateobj(datestr):
 
 def mk_dir(datadir):
     if not os.path.exists(datadir):
-        os.mkdir(datadir)
+        try:
+            os.mkdir(datadir)
+        except FileExistsError:
+            # Another worker created it first
+            pass
+
+# Top-level datadir entries that hold search results rather than docs
+NON_DOC_DIRS = ('search', 'search_cache', 'segments')
+
+def search_dirname(q):
+    return re.sub(r'[^\w-]+', '_', q).strip('_')[:80] or 'query'
 
 class FileStorage:
     def __init__(self, datadir):
@@ -120,12 +356,55 @@ class FileStorage:
         mk_dir(datadir)
 
     def save_json(self, results, filepath):
-        json_doc = results
-        json_file = codecs.open(filepath, mode='w', encoding='utf-8')
-        json_file.write(json_doc)
+        # Write to a temp file and rename, so a crash never leaves a partial
+        # doc behind that a resumed crawl would then skip
+        tmppath = '%s.%d.tmp' % (filepath, os.getpid())
+        json_file = codecs.open(tmppath, mode='w', encoding='utf-8')
+        json_file.write(results)
         json_file.close()
+        os.replace(tmppath, filepath)
+        return True
+
+    def save_binary(self, content, filepath):
+        tmppath = '%s.%d.tmp' % (filepath, os.getpid())
+        with open(tmppath, 'wb') as f:
+            f.write(content)
+        os.replace(tmppath, filepath)
         return True
 
+    def read(self, filepath):
+        with codecs.open(filepath, mode='r', encoding='utf-8') as f:
+            return f.read()
+
+    def read_binary(self, filepath):
+        with open(filepath, 'rb') as f:
+            return f.read()
+
+    def remove(self, filepath):
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+
+    def make_dir(self, dirpath):
+        mk_dir(dirpath)
+
+    def listdir(self, dirpath):
+        """[(name, mtime)] of the files directly under dirpath"""
+        return [(entry.name, entry.stat().st_mtime) for entry in os.scandir(dirpath) if entry.is_file()]
+
+    def iter_doc_files(self, since=0.0):
+        """Yield (path, mtime) of saved doc JSON files modified at or after since"""
+        for dirpath, dirnames, filenames in os.walk(self.datadir):
+            if dirpath == self.datadir:
+                dirnames[:] = [name for name in dirnames if name not in NON_DOC_DIRS]
+            for name in filenames:
+                if name.endswith('.json') and not name.startswith('docfragment_'):
+                    path = os.path.join(dirpath, name)
+                    mtime = os.path.getmtime(path)
+                    if mtime >= since:
+                        yield path, mtime
+
     def exists(self, filepath):
         return os.path.exists(filepath)
 
@@ -145,8 +424,81 @@ class FileStorage:
 
         return docpath
 
-    # Include other methods from the original FileStorage class
-    # Abbreviated for clarity
+    def get_json_orig_path(self, docpath, docid):
+        jsonpath = os.path.join(docpath, '%d.json' % docid)
+        origpath = os.path.join(docpath, '%d_original' % docid)
+        return jsonpath, origpath
+
+    def get_search_path(self, q):
+        searchdir = os.path.join(self.datadir, 'search')
+        mk_dir(searchdir)
+
+        searchpath = os.path.join(searchdir, search_dirname(q))
+        mk_dir(searchpath)
+        return searchpath
+
+class CrawlJournal:
+    """Append-only log of crawl progress, shared by the worker processes.
+
+    Each line is one JSON record: ["page", q, pagenum, ndocs] once a search
+    page is saved, ["doc", docid, docsource, publishdate] for every hit it
+    queued and ["done", docid] once that doc is on disk. Lines are short
+    enough for O_APPEND writes from several processes not to interleave.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.pid = None
+        self.fileobj = None
+
+    def exists(self):
+        return os.path.exists(self.filepath)
+
+    def record(self, entry):
+        if self.pid != os.getpid():
+            # Each forked worker opens its own append handle
+            self.fileobj = open(self.filepath, 'a', encoding='utf8')
+            self.pid = os.getpid()
+        self.fileobj.write(json.dumps(list(entry)) + '\n')
+        self.fileobj.flush()
+
+    def pending_tasks(self, queries, maxpages=1):
+        """Tasks still to run for queries, taking an unfinished crawl into account"""
+        nextpage = {}
+        finished = set()
+        docs = {}
+        done = set()
+
+        if self.exists():
+            with open(self.filepath, encoding='utf8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash
+                        continue
+                    if entry[0] == 'page':
+                        q, pagenum, ndocs = entry[1:]
+                        if ndocs == 0:
+                            finished.add(q)
+                        nextpage[q] = max(nextpage.get(q, 0), pagenum + maxpages)
+                    elif entry[0] == 'doc':
+                        docs[entry[1]] = tuple(entry)
+                    elif entry[0] == 'done':
+                        done.add(entry[1])
+
+        tasks = [task for docid, task in docs.items() if docid not in done]
+        for q in queries:
+            if q not in finished:
+                tasks.append(('search', q, nextpage.get(q, 0)))
+        return tasks
+
+    def clear(self):
+        if self.fileobj is not None:
+            self.fileobj.close()
+            self.fileobj = None
+            self.pid = None
+        if self.exists():
+            os.remove(self.filepath)
 
 def get_arg_parser():
     parser = argparse.ArgumentParser(description='For downloading from the api.indiankanoon.org endpoint', add_help=True)
@@ -168,6 +520,9 @@ def get_arg_parser():
 
     parser.add_argument('-D', '--datadir', dest='datadir', action='store',
                         required=False, help='directory to store files')
+    parser.add_argument('-B', '--baseurl', dest='baseurl', action='store',
+                        required=False, default=None,
+                        help='api base url (default https://api.indiankanoon.org)')
     parser.add_argument('-s', '--sharedtoken', dest='token', action='store',
                         required=False, help='api.ik shared token')
 
@@ -196,6 +551,24 @@ def get_arg_parser():
     parser.add_argument('-a', '--addedtoday', dest='addedtoday',
                         action='store_true', required=False, default=False,
                         help='Search only for documents that were added today')
+    parser.add_argument('--poolsize', type=int, dest='poolsize',
+                        action='store', default=10, required=False,
+                        help='max keep-alive connections to the api')
+    parser.add_argument('--timeout', type=float, dest='timeout',
+                        action='store', default=10.0, required=False,
+                        help='per-call timeout in seconds')
+    parser.add_argument('--deadline', type=float, dest='deadline',
+                        action='store', default=30.0, required=False,
+                        help='total time budget for a call including retries')
+    parser.add_argument('--packed', dest='packed', action='store_true',
+                        required=False, default=False,
+                        help='store files in compressed segment files instead of one file per doc')
+    parser.add_argument('--sync', dest='sync', action='store_true',
+                        required=False, default=False,
+                        help='incremental sync: stop paging once results are already in the manifest')
+    parser.add_argument('--rebuild-manifest', dest='rebuild_manifest', action='store_true',
+                        required=False, default=False,
+                        help='index docs already in datadir before crawling')
     parser.add_argument('-N', '--workers', type=int, dest='numworkers',
                         action='store', default=5, required=False,
                         help='num workers for parallel downloads')
@@ -241,9 +614,16 @@ if __name__ == '__main__':
 
     logger = logging.getLogger('ikapi')
 
-    filestorage = FileStorage(args.datadir)
+    if args.packed:
+        from packed_storage import PackedStorage
+        filestorage = PackedStorage(args.datadir)
+    else:
+        filestorage = FileStorage(args.datadir)
     ikapi = IKApi(args, filestorage)
 
+    if args.rebuild_manifest:
+        ikapi.manifest.rebuild(args.datadir, filestorage)
+
     has_more = True
 
     if args.docid is not None and args.q:
@@ -252,11 +632,8 @@ if __name__ == '__main__':
     elif args.docid is not None:
         ikapi.download_doc(args.docid, args.datadir)
     elif args.q:
-        q = args.q
-        if args.addedtoday:
-            q += ' added:today'
-        logger.warning('Search q: %s', q)
-        ikapi.save_search_results(q)
+        logger.warning('Search q: %s', ikapi.window_query(args.q))
+        ikapi.save_search_results(args.q)
     elif args.doctype:
         ikapi.download_doctype(args.doctype)
     elif args.qfile:
@@ -0,0 +1,266 @@
+# ik_http.py
+# Pooled keep-alive HTTP transport for the Indian Kanoon API, shared by the
+# synchronous downloader and the async chat path.
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import asyncio
+
+import httpx
+
+logger = logging.getLogger('ikapi')
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call without trying upstream"""
+
+class UpstreamError(Exception):
+    """Raised when retries or the deadline are exhausted"""
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After failure_threshold consecutive failures the breaker opens and rejects
+    calls for reset_timeout seconds. It then lets a single probe through
+    (half-open); a success closes it again, a failure re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self):
+        """End a call that was abandoned (cancelled) before it had an outcome.
+
+        A half-open probe that never finished says nothing about upstream,
+        so the next call may probe again.
+        """
+        with self.lock:
+            self.probing = False
+
+class IKHttpStats:
+    """Counters for the Kanoon transport, exposed through /stats"""
+    FIELDS = ('requests', 'pool_hits', 'new_connections', 'retries',
+              'failures', 'breaker_rejections')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def incr(self, field, n=1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class IKHttpClient:
+    """Keep-alive connection pool with retries, a total deadline and a circuit breaker.
+
+    call() and acall() return the response body as a string, or raise
+    CircuitOpenError / UpstreamError once retries or the deadline run out.
+    The sync and async clients share the breaker and the counters.
+    """
+    def __init__(self, baseurl, headers, pool_size=10, timeout=10.0,
+                 max_retries=4, deadline=30.0, backoff_base=0.5, backoff_cap=8.0,
+                 breaker=None):
+        self.baseurl = baseurl
+        self.headers = headers
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = IKHttpStats()
+        self.client = None
+        self.async_client = None
+        self.pid = None
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.pool_size,
+                            max_keepalive_connections=self.pool_size)
+
+    def _get_client(self):
+        # Connections must not be shared with a forked parent process
+        if self.client is None or self.pid != os.getpid():
+            self.client = httpx.Client(base_url=self.baseurl, headers=self.headers,
+                                       limits=self._limits(), timeout=self.timeout)
+            self.pid = os.getpid()
+        return self.client
+
+    def _get_async_client(self):
+        if self.async_client is None:
+            self.async_client = httpx.AsyncClient(base_url=self.baseurl, headers=self.headers,
+                                                  limits=self._limits(), timeout=self.timeout)
+        return self.async_client
+
+    def _trace(self, new_connection):
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.started':
+                new_connection.append(True)
+        return trace
+
+    def _atrace(self, new_connection):
+        async def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.started':
+                new_connection.append(True)
+        return trace
+
+    def _check_response(self, response, new_connection):
+        self.stats.incr('new_connections' if new_connection else 'pool_hits')
+        text = response.text
+        if response.status_code >= 500 or response.status_code == 429 \
+                or re.match('error code:', text):
+            raise UpstreamError('HTTP %d: %s' % (response.status_code, text[:200]))
+        return text
+
+    def _remaining(self, started):
+        return self.deadline - (time.monotonic() - started)
+
+    def _next_delay(self, attempt, started):
+        """Delay before the next attempt, or None if retries or the deadline are exhausted"""
+        if attempt >= self.max_retries:
+            return None
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        if self._remaining(started) - delay <= 0:
+            return None
+        return delay
+
+    def _attempt_timeout(self, url, attempt, started):
+        """Timeout for the next attempt: the per-request one, cut to what is left of the deadline"""
+        remaining = self._remaining(started)
+        if remaining <= 0:
+            raise UpstreamError('Giving up on %s after %d attempts: deadline exceeded' % (url, attempt))
+        return min(self.timeout, remaining)
+
+    def _before_attempt(self):
+        if not self.breaker.allow():
+            self.stats.incr('breaker_rejections')
+            raise CircuitOpenError('Indian Kanoon circuit breaker is open')
+        self.stats.incr('requests')
+
+    def call(self, url):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(url, attempt, started)
+            self._before_attempt()
+            new_connection = []
+            try:
+                response = self._get_client().post(
+                    url, timeout=timeout, extensions={'trace': self._trace(new_connection)})
+                text = self._check_response(response, new_connection)
+                self.breaker.record_success()
+                return text
+            except (httpx.HTTPError, UpstreamError) as e:
+                self.breaker.record_failure()
+                self.stats.incr('failures')
+                logger.warning('Error in call %s %s', url, e)
+                delay = self._next_delay(attempt, started)
+                if delay is None:
+                    raise UpstreamError('Giving up on %s after %d attempts: %s' % (url, attempt + 1, e))
+                self.stats.incr('retries')
+                attempt += 1
+                time.sleep(delay)
+            except Exception:
+                self.breaker.record_failure()
+                self.stats.incr('failures')
+                raise
+            except BaseException:
+                # Cancelled (a retrieval or enrichment deadline) or interrupted
+                self.breaker.release()
+                raise
+
+    async def acall(self, url):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(url, attempt, started)
+            self._before_attempt()
+            new_connection = []
+            try:
+                response = await self._get_async_client().post(
+                    url, timeout=timeout, extensions={'trace': self._atrace(new_connection)})
+                text = self._check_response(response, new_connection)
+                self.breaker.record_success()
+                return text
+            except (httpx.HTTPError, UpstreamError) as e:
+                self.breaker.record_failure()
+                self.stats.incr('failures')
+                logger.warning('Error in acall %s %s', url, e)
+                delay = self._next_delay(attempt, started)
+                if delay is None:
+                    raise UpstreamError('Giving up on %s after %d attempts: %s' % (url, attempt + 1, e))
+                self.stats.incr('retries')
+                attempt += 1
+                await asyncio.sleep(delay)
+            except Exception:
+                self.breaker.record_failure()
+                self.stats.incr('failures')
+                raise
+            except BaseException:
+                # Cancelled (a retrieval or enrichment deadline) or interrupted
+                self.breaker.release()
+                raise
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+        self.close()
+
+def error_json(e):
+    return json.dumps({"errmsg": "Failed to connect to Indian Kanoon API: %s" % e})
@@ -1,18 +1,97 @@
 # legal_ner.py
 from transformers import AutoTokenizer, AutoModelForTokenClassification
 import torch
+import numpy as np
+import functools
 import logging
+import os
+import threading
 
 logger = logging.getLogger(__name__)
 
-def load_model():
-    """Load the NER model and tokenizer"""
+# Fast (Rust) tokenizers are not safe to call from several threads at once
+_tokenizer_lock = threading.Lock()
+
+MODEL_NAME = "dslim/bert-base-NER"  # General NER model
+BACKENDS = ("fp32", "int8", "onnx")
+MAX_LENGTH = 512  # BERT models typically have a max length of 512
+# Longer texts are split into MAX_LENGTH windows sharing WINDOW_STRIDE tokens
+WINDOW_STRIDE = 128
+WINDOW_BATCH = 16  # windows per forward pass
+
+class OnnxOutput:
+    def __init__(self, logits):
+        self.logits = logits
+
+class OnnxTokenClassifier:
+    """onnxruntime session that can stand in for the torch model.
+
+    Calling it with the tokenizer output returns an object with .logits, and
+    .config is the original model config, so extract_ner_entities works
+    unchanged.
+    """
+    def __init__(self, session, config):
+        self.session = session
+        self.config = config
+        self.input_names = [i.name for i in session.get_inputs()]
+
+    def __call__(self, **inputs):
+        feed = {name: inputs[name].numpy() for name in self.input_names}
+        logits = self.session.run(["logits"], feed)[0]
+        return OnnxOutput(torch.from_numpy(logits))
+
+def export_onnx(model, tokenizer, onnx_path):
+    """Export the token classifier to onnx_path with dynamic batch and sequence axes"""
+    os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
+    sample = tokenizer(["Export sample text"], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dict(sample),),
+            onnx_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    logger.info(f"Exported NER model to {onnx_path}")
+
+def load_onnx_model(model, tokenizer, onnx_path):
     try:
-        model_name = "dslim/bert-base-NER"  # General NER model
-        logger.info(f"Loading NER model: {model_name}")
+        import onnxruntime
+    except ImportError:
+        raise ImportError("NER backend 'onnx' requires the onnxruntime package")
+
+    if not os.path.exists(onnx_path):
+        export_onnx(model, tokenizer, onnx_path)
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    return OnnxTokenClassifier(session, model.config)
+
+def load_model(backend="fp32", onnx_path=None):
+    """Load the NER model and tokenizer.
+
+    backend selects the CPU runtime: "fp32" (eager torch), "int8" (dynamic
+    quantization of the Linear layers) or "onnx" (onnxruntime, exporting the
+    graph to onnx_path on first use).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown NER backend {backend!r}, expected one of {BACKENDS}")
+    try:
+        logger.info(f"Loading NER model: {MODEL_NAME} ({backend})")
         
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForTokenClassification.from_pretrained(model_name)
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        model = AutoModelForTokenClassification.from_pretrained(MODEL_NAME)
+        model.eval()
+
+        if backend == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "onnx":
+            model = load_onnx_model(model, tokenizer, onnx_path or os.path.join("onnx_cache", "bert-base-NER.onnx"))
         
         logger.info("NER model loaded successfully")
         return model, tokenizer
@@ -20,63 +99,173 @@ def load_model():
         logger.error(f"Failed to load NER model: {str(e)}")
         raise
 
-def extract_ner_entities(text, model, tokenizer):
-    """Extract named entities from text using the NER model"""
+@functools.lru_cache(maxsize=8)
+def label_tables(id2label_items):
+    """Lookup arrays over label ids: entity type index (-1 for O), is a B- tag, type names"""
+    types = sorted({label[2:] for _, label in id2label_items if label[:2] in ("B-", "I-")})
+    size = max(i for i, _ in id2label_items) + 1
+    type_of = np.full(size, -1, dtype=np.int64)
+    is_begin = np.zeros(size, dtype=bool)
+    for i, label in id2label_items:
+        if label[:2] in ("B-", "I-"):
+            type_of[i] = types.index(label[2:])
+            is_begin[i] = label.startswith("B-")
+    return type_of, is_begin, types
+
+def decode_spans(texts, predictions, offsets, id2label):
+    """Group BIO label ids into (entity, label, start, end) tuples for a whole batch.
+
+    predictions is a [batch, seq] array of label ids and offsets the fast
+    tokenizer's [batch, seq, 2] character offsets, (0, 0) for special and
+    padding tokens. The batch is decoded as one flat sequence with array
+    operations; entity text is sliced from the input with its offsets. An
+    I- tag that does not continue an entity of its type starts a new one.
+    """
+    type_of, is_begin, types = label_tables(tuple(sorted(id2label.items())))
+    seq = predictions.shape[1]
+    labels = predictions.reshape(-1)
+    char_start = offsets[..., 0].reshape(-1)
+    char_end = offsets[..., 1].reshape(-1)
+
+    # Special and padding tokens separate the rows, so they never join up
+    entity_type = np.where(char_end > char_start, type_of[labels], -1)
+    inside = entity_type >= 0
+    previous = np.empty_like(entity_type)
+    previous[0] = -1
+    previous[1:] = entity_type[:-1]
+    begins = inside & (is_begin[labels] | (previous != entity_type))
+    continued = np.zeros_like(inside)
+    continued[:-1] = inside[1:] & ~begins[1:]
+    first = np.flatnonzero(begins)
+    last = np.flatnonzero(inside & ~continued)
+
+    results = [[] for _ in texts]
+    for row, start, end, t in zip((first // seq).tolist(), char_start[first].tolist(),
+                                  char_end[last].tolist(), entity_type[first].tolist()):
+        results[row].append((texts[row][start:end], types[t], start, end))
+    return results
+
+def decode_entities(tokens, labels, tokenizer):
+    """Group BIO-labelled wordpiece tokens into (entity, label) tuples.
+
+    Used with slow tokenizers, which have no offset mapping; see decode_spans.
+    """
+    entities = []
+    current_entity = ""
+    current_label = "O"
+    
+    for token, label in zip(tokens, labels):
+        # Skip special tokens
+        if token in [tokenizer.cls_token, tokenizer.sep_token, tokenizer.pad_token]:
+            continue
+            
+        if label.startswith("B-"):
+            # Start of a new entity
+            if current_entity:
+                entities.append((current_entity.strip(), current_label))
+            current_entity = token.replace("##", "")
+            current_label = label[2:]  # Remove "B-" prefix
+        elif label.startswith("I-") and current_label == label[2:]:
+            # Inside an entity
+            if token.startswith("##"):
+                current_entity += token[2:]  # Append without space for subwords
+            else:
+                current_entity += " " + token
+        else:
+            # Outside an entity
+            if current_entity:
+                entities.append((current_entity.strip(), current_label))
+            current_entity = ""
+            current_label = "O"
+    
+    # Add the last entity if there is one
+    if current_entity:
+        entities.append((current_entity.strip(), current_label))
+        
+    return entities
+
+def window_bounds(sample_of, offsets, stride):
+    """Character range [own_from, own_to) whose entities each window keeps.
+
+    Consecutive windows of a text share stride tokens; the boundary between
+    them is the middle of that overlap, so an entity near a window edge is
+    taken from the window that sees the most context around it.
+    """
+    content = offsets[..., 1] > offsets[..., 0]
+    first = content.argmax(axis=1)
+    rows = np.arange(len(sample_of))
+    boundary = offsets[rows, np.minimum(first + stride // 2, offsets.shape[1] - 1), 0]
+    continues = np.zeros(len(sample_of), dtype=bool)
+    continues[1:] = sample_of[1:] == sample_of[:-1]
+    own_from = np.where(continues, boundary, 0)
+    own_to = np.full(len(sample_of), np.iinfo(np.int64).max)
+    own_to[:-1] = np.where(continues[1:], own_from[1:], own_to[:-1])
+    return own_from.tolist(), own_to.tolist()
+
+def extract_ner_entities_batch(texts, model, tokenizer, stride=WINDOW_STRIDE, window_batch=WINDOW_BATCH):
+    """Extract named entities from several texts with a single forward pass.
+
+    The batch is padded to its longest sequence, not to max_length. Each
+    text gets a list of (entity, label, start, end) tuples, with character
+    offsets into the text (just (entity, label) with a slow tokenizer).
+
+    Texts longer than MAX_LENGTH tokens are split into windows overlapping
+    by stride tokens and the windows' entities merged, with forward passes of
+    up to window_batch windows (or the whole batch, if larger). stride=None
+    truncates instead, as slow tokenizers always do.
+
+    If inference fails every text gets None instead, so callers can tell
+    a failure from a text without entities (and not cache it).
+    """
     try:
-        # Tokenize input with proper handling of longer texts
-        encoded_input = tokenizer(
-            text, 
-            return_tensors="pt", 
-            truncation=True, 
-            padding=True,
-            max_length=512  # BERT models typically have a max length of 512
-        )
+        windowed = tokenizer.is_fast and stride is not None
+        with _tokenizer_lock:
+            encoded_input = tokenizer(
+                texts,
+                return_tensors="pt",
+                truncation=True,
+                padding="longest",
+                max_length=MAX_LENGTH,
+                return_offsets_mapping=tokenizer.is_fast,
+                return_overflowing_tokens=windowed,
+                stride=stride if windowed else 0,
+            )
+        offsets = encoded_input.pop("offset_mapping", None)
+        sample_of = encoded_input.pop("overflow_to_sample_mapping", None)
         
         # Get predictions
+        windows = len(encoded_input["input_ids"])
+        step = max(window_batch, len(texts))
+        predictions = []
         with torch.no_grad():
-            outputs = model(**encoded_input)
+            for i in range(0, windows, step):
+                outputs = model(**{name: value[i:i + step] for name, value in encoded_input.items()})
+                predictions.append(torch.argmax(outputs.logits, dim=2).numpy())
+        predictions = np.concatenate(predictions)
             
         # Process predictions
-        predictions = torch.argmax(outputs.logits, dim=2)
-        tokens = tokenizer.convert_ids_to_tokens(encoded_input["input_ids"][0])
-        labels = [model.config.id2label[pred.item()] for pred in predictions[0]]
-        
-        # Extract entities
-        entities = []
-        current_entity = ""
-        current_label = "O"
+        id2label = model.config.id2label
+        if sample_of is not None:
+            offsets = offsets.numpy()
+            sample_of = sample_of.numpy()
+            spans = decode_spans([texts[s] for s in sample_of], predictions, offsets, id2label)
+            results = [[] for _ in texts]
+            for sample, window, own_from, own_to in zip(sample_of.tolist(), spans,
+                                                        *window_bounds(sample_of, offsets, stride)):
+                results[sample].extend(span for span in window if own_from <= span[2] < own_to)
+        elif offsets is not None:
+            results = decode_spans(texts, predictions, offsets.numpy(), id2label)
+        else:
+            results = [decode_entities(tokenizer.convert_ids_to_tokens(input_ids), [id2label[i] for i in row], tokenizer)
+                       for input_ids, row in zip(encoded_input["input_ids"], predictions.tolist())]
         
-        for token, label in zip(tokens, labels):
-            # Skip special tokens
-            if token in [tokenizer.cls_token, tokenizer.sep_token, tokenizer.pad_token]:
-                continue
-                
-            if label.startswith("B-"):
-                # Start of a new entity
-                if current_entity:
-                    entities.append((current_entity.strip(), current_label))
-                current_entity = token.replace("##", "")
-                current_label = label[2:]  # Remove "B-" prefix
-            elif label.startswith("I-") and current_label == label[2:]:
-                # Inside an entity
-                if token.startswith("##"):
-                    current_entity += token[2:]  # Append without space for subwords
-                else:
-                    current_entity += " " + token
-            else:
-                # Outside an entity
-                if current_entity:
-                    entities.append((current_entity.strip(), current_label))
-                current_entity = ""
-                current_label = "O"
-        
-        # Add the last entity if there is one
-        if current_entity:
-            entities.append((current_entity.strip(), current_label))
-            
-        logger.info(f"Extracted {len(entities)} entities from text")
-        return entities
+        logger.info(f"Extracted {sum(map(len, results))} entities from {len(texts)} texts ({windows} windows)")
+        return results
         
     except Exception as e:
         logger.error(f"Error extracting entities: {str(e)}")
-        return []  # Return empty list on error
\ No newline at end of file
+        return [None for _ in texts]
+
+def extract_ner_entities(text, model, tokenizer, stride=WINDOW_STRIDE):
+    """Extract named entities from text using the NER model (None if inference failed)"""
+    return extract_ner_entities_batch([text], model, tokenizer, stride)[0]
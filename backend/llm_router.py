@@ -0,0 +1,304 @@
+# llm_router.py
+# Routes LLM calls across the configured providers (Mistral, Gemini).
+#
+# Each provider has its own timeout and a moving window of recent latencies.
+# A call goes to a primary chosen by preference or latency-weighted draw; if
+# it has not answered within its observed p95 a hedge is started on the next
+# provider and the first good answer wins. A provider that errors or times
+# out fails over to the next one straight away.
+import asyncio
+import collections
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ProviderError(Exception):
+    """Raised when a provider call fails, times out or returns no text"""
+
+class NoProviderError(Exception):
+    """Raised when no provider is configured"""
+
+class AllProvidersFailed(ProviderError):
+    """Raised when every provider tried for a call failed"""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join('%s: %s' % (name, error) for name, error in errors))
+
+class LatencyWindow:
+    """The last size outcomes of one kind of call: latencies of the successes
+    (and lower bounds from slow cancelled calls), error rate of all"""
+    def __init__(self, size=100):
+        self.latencies = collections.deque(maxlen=size)
+        self.outcomes = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, elapsed, ok):
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(elapsed)
+
+    def record_cancelled(self, elapsed):
+        """A call cancelled after elapsed seconds (it lost a hedge race) would
+        have taken longer. Counting only successes would drop exactly the slow
+        tail and pull the p95 (the hedge delay) down, so elapsed is kept as a
+        latency when it is above the median; shorter ones say nothing the
+        window does not already know. No outcome is recorded."""
+        with self.lock:
+            ordered = sorted(self.latencies)
+            if not ordered or elapsed > ordered[len(ordered) // 2]:
+                self.latencies.append(elapsed)
+
+    def samples(self):
+        return len(self.latencies)
+
+    def percentile(self, pct):
+        with self.lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+    def mean(self):
+        with self.lock:
+            return sum(self.latencies) / len(self.latencies) if self.latencies else None
+
+    def error_rate(self):
+        with self.lock:
+            return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+class Provider:
+    """An LLM backend.
+
+    complete(prompt) returns the answer text; stream(prompt) is an async
+    generator of text chunks. Both should raise on errors; the router
+    applies timeout to a whole completion and to a stream's first chunk.
+    """
+    KINDS = ('complete', 'stream')
+
+    def __init__(self, name, complete, stream=None, timeout=60.0, window=100):
+        self.name = name
+        self.complete = complete
+        self.stream = stream
+        self.timeout = timeout
+        self.windows = {kind: LatencyWindow(window) for kind in self.KINDS}
+        self.counts = collections.Counter()
+
+    def as_dict(self):
+        window = self.windows['complete']
+        p95 = window.percentile(95)
+        mean = window.mean()
+        first_token_p95 = self.windows['stream'].percentile(95)
+        return {
+            'calls': self.counts['calls'],
+            'errors': self.counts['errors'],
+            'timeouts': self.counts['timeouts'],
+            'cancelled': self.counts['cancelled'],
+            'wins': self.counts['wins'],
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            'mean_ms': round(mean * 1000, 1) if mean is not None else None,
+            'first_token_p95_ms': round(first_token_p95 * 1000, 1) if first_token_p95 is not None else None,
+            'error_rate': round(window.error_rate(), 4),
+        }
+
+class LLMRouter:
+    """Hedged, failing-over calls across providers.
+
+    hedge_delay is used for a provider until its window holds min_samples
+    latencies; after that its observed p95 (never less than min_hedge_delay).
+    With hedge False a second provider is only tried after the first fails.
+    """
+    def __init__(self, providers, hedge=True, hedge_delay=10.0, min_hedge_delay=0.5,
+                 min_samples=20, rng=None):
+        self.providers = {provider.name: provider for provider in providers}
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.rng = rng or random.Random()
+        self.counts = collections.Counter()
+
+    def __bool__(self):
+        return bool(self.providers)
+
+    def weight(self, provider, kind):
+        """Success rate over mean latency: expected good answers per second"""
+        window = provider.windows[kind]
+        mean = window.mean()
+        if mean is None:
+            return None
+        # Keep a failing provider in rotation so its window can recover
+        return max(0.05, 1.0 - window.error_rate()) / max(mean, 1e-3)
+
+    def order(self, preferred=None, kind='complete'):
+        """Providers in the order to try them.
+
+        preferred (if configured) goes first; the rest are drawn without
+        replacement with probability proportional to their weight. Providers
+        without latency samples get the best known weight, so they are tried.
+        """
+        candidates = [p for name, p in self.providers.items()
+                      if name != preferred and (kind != 'stream' or p.stream is not None)]
+        weights = [self.weight(p, kind) for p in candidates]
+        known = [w for w in weights if w is not None]
+        default = max(known) if known else 1.0
+        weights = [default if w is None else w for w in weights]
+
+        ordered = []
+        if preferred in self.providers and (kind != 'stream' or self.providers[preferred].stream is not None):
+            ordered.append(self.providers[preferred])
+        while candidates:
+            index = self.rng.choices(range(len(candidates)), weights)[0]
+            ordered.append(candidates.pop(index))
+            weights.pop(index)
+        return ordered
+
+    def hedge_after(self, provider, kind):
+        window = provider.windows[kind]
+        if window.samples() < self.min_samples:
+            return self.hedge_delay
+        return max(self.min_hedge_delay, window.percentile(95))
+
+    async def attempt(self, provider, kind, call):
+        """Run call(provider) under the provider's timeout, recording the outcome"""
+        provider.counts['calls'] += 1
+        window = provider.windows[kind]
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call(provider), provider.timeout)
+        except asyncio.TimeoutError:
+            provider.counts['timeouts'] += 1
+            window.record(time.perf_counter() - start, False)
+            raise ProviderError('timed out after %.1fs' % provider.timeout)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the provider's health,
+            # only that its latency exceeds the time it had
+            provider.counts['cancelled'] += 1
+            window.record_cancelled(time.perf_counter() - start)
+            raise
+        except Exception as e:
+            provider.counts['errors'] += 1
+            window.record(time.perf_counter() - start, False)
+            raise ProviderError(str(e) or type(e).__name__) from e
+        window.record(time.perf_counter() - start, True)
+        return result
+
+    async def race(self, preferred, kind, call, discard=None):
+        """(provider name, result) of the first provider whose call succeeds.
+
+        Raises NoProviderError or AllProvidersFailed. discard(result) cleans
+        up a success that finished alongside the winner.
+        """
+        queue = self.order(preferred, kind)
+        if not queue:
+            raise NoProviderError('no LLM provider is configured')
+        self.counts['calls'] += 1
+        running = {}  # task -> provider
+        errors = []
+        last_started = None
+
+        def launch():
+            nonlocal last_started
+            provider = queue.pop(0)
+            running[asyncio.ensure_future(self.attempt(provider, kind, call))] = provider
+            last_started = (provider, time.perf_counter())
+
+        first = queue[0]
+        launch()
+        try:
+            while running:
+                timeout = None
+                if self.hedge and queue:
+                    provider, started = last_started
+                    timeout = max(0.0, self.hedge_after(provider, kind) - (time.perf_counter() - started))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.counts['hedges'] += 1
+                    logger.info('LLM provider %s slower than %.2fs, hedging with %s',
+                                last_started[0].name, self.hedge_after(last_started[0], kind), queue[0].name)
+                    launch()
+                    continue
+
+                winner = None
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is not None:
+                        errors.append((provider.name, task.exception()))
+                        logger.warning('LLM provider %s failed: %s', provider.name, task.exception())
+                    elif winner is None:
+                        winner = (provider, task.result())
+                    elif discard is not None:
+                        await discard(task.result())
+                if winner is not None:
+                    provider, result = winner
+                    provider.counts['wins'] += 1
+                    if provider is not first:
+                        self.counts['hedge_wins' if not errors else 'failover_wins'] += 1
+                    return provider.name, result
+                if queue:
+                    self.counts['failovers'] += 1
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+                if discard is not None:
+                    for task in running:
+                        if not task.cancelled() and task.exception() is None:
+                            await discard(task.result())
+        self.counts['exhausted'] += 1
+        raise AllProvidersFailed(errors)
+
+    async def complete(self, prompt, preferred=None):
+        """(provider name, answer text) from the first provider to answer"""
+        async def call(provider):
+            text = await provider.complete(prompt)
+            if not text or not text.strip():
+                raise ProviderError('empty response')
+            return text
+        return await self.race(preferred, 'complete', call)
+
+    async def open_stream(self, prompt, preferred=None):
+        """(provider name, async generator of text chunks).
+
+        Hedging and failover apply until a provider yields its first chunk;
+        an error after that propagates from the generator, since the chunks
+        already sent cannot be taken back.
+        """
+        async def call(provider):
+            chunks = provider.stream(prompt)
+            try:
+                async for text in chunks:
+                    if text:
+                        return text, chunks
+            except BaseException:
+                await chunks.aclose()
+                raise
+            raise ProviderError('empty response')
+
+        async def discard(result):
+            await result[1].aclose()
+
+        name, (first, chunks) = await self.race(preferred, 'stream', call, discard)
+
+        async def tokens():
+            try:
+                yield first
+                async for text in chunks:
+                    yield text
+            finally:
+                await chunks.aclose()
+        return name, tokens()
+
+    def as_dict(self):
+        """Flat counters for /stats: router totals and <provider>_<field> per provider"""
+        stats = {key: self.counts[key] for key in
+                 ('calls', 'hedges', 'hedge_wins', 'failovers', 'failover_wins', 'exhausted')}
+        for name, provider in self.providers.items():
+            for key, value in provider.as_dict().items():
+                stats['%s_%s' % (name, key)] = value
+        return stats
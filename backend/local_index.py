@@ -0,0 +1,337 @@
+# local_index.py
+# BM25 inverted index over the documents mirrored into the storage datadir by
+# ik_download, used as a first-tier retriever before the live Kanoon search.
+#
+#   python local_index.py -D ./indian_kanoon_cache -N 8
+#
+# builds (or incrementally updates) <datadir>/local_index.pkl.
+import argparse
+import fcntl
+import json
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from context_builder import strip_markup
+
+logger = logging.getLogger('ikapi.local_index')
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset('''a an and are as at be by for from has have in is it its of on or that the
+this to was were which with under section sec vs v'''.split())
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+def parse_doc(content):
+    """(metadata, term counts, length) for a saved Kanoon doc, or None if it is not one"""
+    try:
+        d = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(d, dict) or 'tid' not in d or 'doc' not in d:
+        return None
+
+    title = strip_markup(d.get('title'))
+    text = strip_markup(d.get('doc'))
+    terms = tokenize(title) * 3 + tokenize(text)  # title matches weigh more
+    meta = {
+        'tid': d['tid'],
+        'title': title,
+        'docsource': d.get('docsource', ''),
+        'publishdate': d.get('publishdate', ''),
+        'docsize': d.get('docsize', len(text)),
+        'headline': text[:400],
+    }
+    return meta, Counter(terms), len(terms)
+
+# Set before the build pool forks so workers read through the same storage
+_storage = None
+
+def index_files(paths):
+    """Parse a chunk of doc files into a partial index with chunk-local doc numbers"""
+    files, metas, lens = [], [], []
+    postings = {}
+    for path, mtime in paths:
+        try:
+            parsed = parse_doc(_storage.read(path))
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning('Could not read %s: %s', path, e)
+            continue
+        if parsed is None:
+            continue
+        meta, counts, length = parsed
+        docno = len(files)
+        files.append((path, mtime))
+        metas.append(meta)
+        lens.append(length)
+        for term, tf in counts.items():
+            entry = postings.get(term)
+            if entry is None:
+                postings[term] = entry = ([], [])
+            entry[0].append(docno)
+            entry[1].append(tf)
+
+    postings = {term: (np.array(docnos, dtype=np.int32), np.array(tfs, dtype=np.float32))
+                for term, (docnos, tfs) in postings.items()}
+    return {'files': files, 'metas': metas, 'lens': lens, 'postings': postings}
+
+class BM25Index:
+    """Okapi BM25 over Kanoon docs.
+
+    Postings are per-term numpy arrays of doc numbers (ascending) and term frequencies,
+    so a query is a handful of vectorized scatter-adds. Updated docs get a
+    new doc number and their old one is masked out until the next rebuild.
+    """
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = []                                  # doc number -> metadata
+        self.doc_lens = np.zeros(0, dtype=np.float32)
+        self.live = np.zeros(0, dtype=bool)
+        self.paths = {}                                 # path -> (doc number, mtime)
+        self.postings = {}                              # term -> (doc numbers, term frequencies)
+        self.total_len = 0.0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add_chunks(self, chunks):
+        """Merge partial indexes from index_files, concatenating each posting list once"""
+        chunks = [chunk for chunk in chunks if chunk['files']]
+        if not chunks:
+            return
+        with self.lock:
+            superseded = []
+            pieces = {}
+            base = len(self.docs)
+            for chunk in chunks:
+                for i, (path, mtime) in enumerate(chunk['files']):
+                    previous = self.paths.get(path)
+                    if previous is not None:
+                        superseded.append(previous[0])
+                    self.paths[path] = (base + i, mtime)
+                for term, (docnos, tfs) in chunk['postings'].items():
+                    pieces.setdefault(term, []).append((docnos + base, tfs))
+                self.docs.extend(chunk['metas'])
+                base += len(chunk['files'])
+
+            for term, parts in pieces.items():
+                old = self.postings.get(term)
+                if old is not None:
+                    parts.insert(0, old)
+                if len(parts) == 1:
+                    self.postings[term] = parts[0]
+                else:
+                    self.postings[term] = (np.concatenate([p[0] for p in parts]),
+                                           np.concatenate([p[1] for p in parts]))
+
+            lens = np.array([n for chunk in chunks for n in chunk['lens']], dtype=np.float32)
+            self.doc_lens = np.concatenate([self.doc_lens, lens])
+            self.live = np.concatenate([self.live, np.ones(len(lens), dtype=bool)])
+            self.total_len += float(lens.sum())
+            for docno in superseded:
+                self.live[docno] = False
+                self.total_len -= float(self.doc_lens[docno])
+
+    def garbage_ratio(self):
+        return 1 - len(self.paths) / len(self.docs) if self.docs else 0.0
+
+    def search(self, query, k=10):
+        """Return [(score, coverage, meta)] for the top k docs.
+
+        coverage is the fraction of distinct query terms the doc contains.
+        """
+        terms = set(tokenize(query))
+        with self.lock:
+            n = len(self.paths)
+            if not terms or not n:
+                return []
+            avgdl = self.total_len / n
+            scores = np.zeros(len(self.docs), dtype=np.float32)
+            matched = np.zeros(len(self.docs), dtype=np.int16)
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                docnos, tfs = posting
+                df = len(docnos)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[docnos] / avgdl)
+                scores[docnos] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+                matched[docnos] += 1
+            scores[~self.live] = 0
+
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), matched[i] / len(terms), self.docs[i]) for i in top if scores[i] > 0]
+
+    def as_dict(self):
+        return {'docs': len(self.paths), 'terms': len(self.postings),
+                'garbage_ratio': round(self.garbage_ratio(), 4)}
+
+def build(storage, workers=None, index=None, chunk_size=200, merge_every=50):
+    """Index the docs in storage that are new or changed since index was built.
+
+    With index None (or one that is mostly superseded entries) the index is
+    rebuilt from scratch. Parsing runs on a pool of worker processes.
+
+    Every doc file is checked against the mtime it was indexed at, not
+    against the newest mtime indexed: crawler workers save through a temp
+    file and os.replace, which keeps the temp file's earlier mtime, so a
+    doc can appear with an mtime older than docs indexed before it.
+    """
+    global _storage
+
+    if index is None or index.garbage_ratio() > 0.2:
+        index = BM25Index()
+    files = [(path, mtime) for path, mtime in storage.iter_doc_files()
+             if index.paths.get(path, (None, None))[1] != mtime]
+    if not files:
+        return index
+
+    start = time.perf_counter()
+    batches = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    _storage = storage
+    # Merge every merge_every chunks to bound the memory held by partial indexes
+    pending = []
+    if workers > 1 and len(batches) > 1:
+        with multiprocessing.get_context('fork').Pool(min(workers, len(batches))) as pool:
+            for chunk in pool.imap_unordered(index_files, batches):
+                pending.append(chunk)
+                if len(pending) >= merge_every:
+                    index.add_chunks(pending)
+                    pending = []
+    else:
+        for batch in batches:
+            pending.append(index_files(batch))
+            if len(pending) >= merge_every:
+                index.add_chunks(pending)
+                pending = []
+    index.add_chunks(pending)
+    logger.info('Indexed %d files in %.2fs (%d docs, %d terms)', len(files),
+                time.perf_counter() - start, len(index), len(index.postings))
+    return index
+
+def load(filepath):
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, 'rb') as f:
+        return pickle.load(f)
+
+def save(index, filepath):
+    tmppath = '%s.%d.tmp' % (filepath, os.getpid())
+    with index.lock, open(tmppath, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmppath, filepath)
+
+class SharedIndex:
+    """The index file shared by the API workers on one datadir.
+
+    The first worker to take an exclusive flock on <filepath>.lock keeps it
+    until it exits and is the only one that scans the storage and rewrites
+    the file (atomically, through save()). The others call reload(), which
+    only unpickles the file when its inode or mtime has changed.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lockpath = filepath + '.lock'
+        self.lock_file = None
+        self.pid = None
+        self.index = None
+        self.version = None
+
+    def is_refresher(self):
+        """True if this process holds (or has just taken) the refresher lock"""
+        if self.pid != os.getpid():
+            # A lock inherited through fork belongs to the parent
+            self.lock_file = None
+            self.pid = os.getpid()
+        if self.lock_file is None:
+            lock_file = open(self.lockpath, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self.lock_file = lock_file
+            logger.info('Process %d is the local index refresher', os.getpid())
+        return True
+
+    def stat_version(self):
+        try:
+            st = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def reload(self):
+        """The index, loaded again only if the file has been replaced since the last load"""
+        version = self.stat_version()
+        if version is not None and version != self.version:
+            self.index = load(self.filepath)
+            self.version = version
+        return self.index
+
+    def update(self, storage, workers=None):
+        """Index docs in storage that are new or changed, and save the index if anything was"""
+        index = self.reload()
+        docs = len(index.docs) if index is not None else 0
+        updated = build(storage, workers, index)
+        if updated is not index or len(updated.docs) != docs:
+            save(updated, self.filepath)
+            self.version = self.stat_version()
+            logger.info('Saved local index %s: %s', self.filepath, updated.as_dict())
+        self.index = updated
+        return updated
+
+    def close(self):
+        if self.lock_file is not None and self.pid == os.getpid():
+            self.lock_file.close()
+        self.lock_file = None
+
+if __name__ == '__main__':
+    from ik_download import FileStorage, setup_logging
+
+    parser = argparse.ArgumentParser(description='Build or update the local BM25 index over a datadir')
+    parser.add_argument('-D', '--datadir', dest='datadir', required=True, help='storage datadir')
+    parser.add_argument('-N', '--workers', dest='workers', type=int, default=None,
+                        help='parser processes (default: all cores)')
+    parser.add_argument('--packed', dest='packed', action='store_true', default=False,
+                        help='datadir uses PackedStorage')
+    parser.add_argument('--rebuild', dest='rebuild', action='store_true', default=False,
+                        help='ignore the existing index')
+    parser.add_argument('-l', '--loglevel', dest='loglevel', default='info')
+    args = parser.parse_args()
+    setup_logging(args.loglevel)
+
+    if args.packed:
+        from packed_storage import PackedStorage
+        storage = PackedStorage(args.datadir)
+    else:
+        storage = FileStorage(args.datadir)
+
+    filepath = os.path.join(args.datadir, 'local_index.pkl')
+    index = build(storage, args.workers, None if args.rebuild else load(filepath))
+    save(index, filepath)
+    logger.warning('Saved %s: %s', filepath, index.as_dict())
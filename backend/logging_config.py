@@ -0,0 +1,128 @@
+# logging_config.py
+# Non-blocking, structured logging for the API server.
+#
+# Records are handed to a QueueHandler and written by a QueueListener thread,
+# so JSON encoding and stream I/O happen off the event loop. Sampling is
+# decided once per request: an unsampled request drops its DEBUG/INFO records,
+# while warnings and errors are always written.
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+# None outside a request (startup, background tasks): always logged
+request_sampled_var = contextvars.ContextVar("request_sampled", default=None)
+
+REDACTED_HEADERS = frozenset(("authorization", "proxy-authorization", "cookie", "set-cookie",
+                              "x-api-key", "x-ik-token", "x-session-id"))
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+listener = None
+queue_handler = None
+
+def redact_headers(headers):
+    """Header dict with credentials replaced, safe to log"""
+    return {k: "[redacted]" if k.lower() in REDACTED_HEADERS else v for k, v in headers.items()}
+
+def start_request(request_id, sample_rate):
+    """Set the request ID and sampling decision for the current request's context"""
+    request_id_var.set(request_id)
+    request_sampled_var.set(sample_rate >= 1.0 or random.random() < sample_rate)
+
+class RequestContextFilter(logging.Filter):
+    """Drop low-severity records of unsampled requests and tag the rest with the request ID.
+
+    Runs on the QueueHandler, i.e. in the thread that logged the record,
+    where the request's context variables are still visible.
+    """
+    def filter(self, record):
+        if record.levelno < logging.WARNING and request_sampled_var.get() is False:
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats every record in the caller; here only the
+    message arguments are merged (so later mutation of them cannot change
+    the log line) and the formatter runs on the listener.
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging(level="INFO", fmt="text", stream=None):
+    """Route the root logger through a queue to a single stream handler"""
+    global listener, queue_handler
+    if listener is not None:
+        listener.stop()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+def restart_after_fork():
+    """Give a forked child (e.g. a gunicorn worker) its own queue and listener thread.
+
+    Threads do not survive fork(), so without this a pre-forked worker
+    would queue records that nothing ever writes.
+    """
+    global listener
+    if listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    queue_handler.queue = log_queue
+    listener = logging.handlers.QueueListener(log_queue, *listener.handlers, respect_handler_level=True)
+    listener.start()
+
+def stop_logging():
+    """Flush queued records; registered with atexit"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=restart_after_fork)
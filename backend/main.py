@@ -1,35 +1,107 @@
 # main.py
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from legal_ner import load_model, extract_ner_entities
+from typing import List
 import json
 import os
 import logging
-import google.generativeai as genai
-from mistralai import Mistral
 from dotenv import load_dotenv
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from limits.storage import storage_from_string
 import re
 from pydantic import validator
 import uuid
 import time
+import asyncio
+import contextvars
+import gc
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 # Import the IKApi and FileStorage from the module
 # Make sure your file is named ik_download.py and accessible in the path
 from ik_download import IKApi, FileStorage, get_arg_parser
+from packed_storage import PackedStorage
+from cache import CacheStats, NERMemo, SearchCache, SingleFlight
+from response_cache import ResponseCache
+from context_builder import build_context, extract_passages, PromptStats
+from enrichment import DocCache
+import retrieval
+import local_index
+from ner_batcher import NERBatcher
+from llm_router import LLMRouter, Provider, NoProviderError, ProviderError
+import preferences
+from batch_jobs import JobStore
+from admission import AdmissionRejected, ConcurrencyGate, RateGate, SharedRateGate
+from metrics import REGISTRY, CONTENT_TYPE, Gauge, Histogram, MultiprocessStore
+from logging_config import setup_logging, start_request, request_id_var, redact_headers
 
-app = FastAPI()
-limiter = Limiter(key_func=get_remote_address)
+@asynccontextmanager
+async def lifespan(app):
+    global metrics_task
+    if metrics_store:
+        metrics_task = asyncio.create_task(metrics_store.run())
+    # torch/transformers and the LLM SDKs are imported here, not at module
+    # import time, so uvicorn binds quickly and /healthz answers while they load.
+    if STARTUP_MODE == "eager":
+        await ensure_loaded()
+    elif STARTUP_MODE == "background":
+        start_loading()
+    yield
+    await shutdown_resources()
+
+app = FastAPI(lifespan=lifespan)
+
+# --- Rate limiting ---
+# Per-client limit on /chat. With a shared RATE_LIMIT_STORAGE (redis://...)
+# all workers and replicas count against the same windows; memory:// counts
+# per process.
+RATE_LIMIT = os.environ.get("RATE_LIMIT", "20/minute")
+RATE_LIMIT_STORAGE = os.environ.get("RATE_LIMIT_STORAGE", "memory://")
+
+# Issued API keys (comma-separated). Only these get a limit of their own;
+# any other X-API-Key is ignored, or a client could dodge the limit by
+# sending a new key with every request.
+API_KEYS = frozenset(key.strip() for key in os.environ.get("API_KEYS", "").split(",") if key.strip())
+
+def rate_limit_key(request: Request):
+    """The client's API key (hashed) if it is one of API_KEYS, else its address.
+
+    Behind a load balancer the address is the forwarded client, as uvicorn
+    and gunicorn resolve X-Forwarded-For from the proxies in
+    FORWARDED_ALLOW_IPS.
+    """
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in API_KEYS:
+        return preferences.client_key(api_key=api_key)
+    return get_remote_address(request)
+
+limiter = Limiter(key_func=rate_limit_key, storage_uri=RATE_LIMIT_STORAGE, strategy="moving-window",
+                  in_memory_fallback_enabled=RATE_LIMIT_STORAGE != "memory://")
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(status_code=503, headers={"Retry-After": str(exc.retry_after)},
+                        content={"detail": f"Server busy: {exc.reason}, retry in {exc.retry_after}s"})
+
+# Set up logging: queued (written off the event loop), "text" or "json"
+setup_logging(os.environ.get("LOG_LEVEL", "INFO").upper(), os.environ.get("LOG_FORMAT", "text"))
 logger = logging.getLogger(__name__)
+# httpx logs every upstream call at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Fraction of requests whose INFO logs are kept; warnings and errors always are
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+# Log (redacted) request headers at DEBUG
+LOG_HEADERS = os.environ.get("LOG_HEADERS", "0") == "1"
 
 # CORS Configuration - Add your production domains to the origins list
 origins = [
@@ -43,34 +115,169 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["POST", "GET", "OPTIONS"],  # Explicitly specify allowed methods
-    allow_headers=["Content-Type", "Authorization"],  # Explicitly specify allowed headers
-    expose_headers=[],  # Explicitly specify which headers to expose
+    allow_headers=["Content-Type", "Authorization", "X-API-Key", "X-Session-ID",
+                   "X-Model-Preference"],  # Explicitly specify allowed headers
+    expose_headers=["X-Request-ID"],  # Explicitly specify which headers to expose
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
 # Load environment variables
 load_dotenv()
 
-# --- Initialize Google Gemini API ---
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    logger.info("Successfully initialized Google Gemini API")
-else:
-    logger.warning("GEMINI_API_KEY not found. Gemini features will be disabled.")
+# --- Metrics and tracing ---
+# Per-stage latency histograms and in-flight gauges, served by /metrics.
+# The request ID from log_requests is kept in a context variable so stage
+# timings can be logged against it, and is returned as X-Request-ID.
+TRACE_IDS = os.environ.get("TRACE_IDS", "1") == "1"
+stage_spans_var = contextvars.ContextVar("stage_spans", default=None)
+
+STAGE_SECONDS = Histogram("legalist_stage_duration_seconds",
+                          "Time spent in each chat pipeline stage", ("stage",))
+HTTP_SECONDS = Histogram("legalist_http_request_duration_seconds",
+                         "HTTP request latency (until response headers for streams)",
+                         ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("legalist_http_requests_in_flight", "HTTP requests being processed")
+CHAT_IN_FLIGHT = Gauge("legalist_chat_requests_in_flight", "Chat requests being answered", ("endpoint",))
+
+# With several workers (gunicorn.conf.py sets this) /metrics sums every
+# worker's snapshot in this directory instead of showing the one it hit
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL", "5"))
+metrics_store = (MultiprocessStore(REGISTRY, METRICS_MULTIPROC_DIR, METRICS_SNAPSHOT_INTERVAL)
+                 if METRICS_MULTIPROC_DIR else None)
+metrics_task = None
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into STAGE_SECONDS and the current request's spans"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def record_stage(name, elapsed):
+    STAGE_SECONDS.observe(elapsed, name)
+    spans = stage_spans_var.get()
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + elapsed
+
+def record_validation(request):
+    """Body parsing and ChatQuery validation happen before the handler runs"""
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        record_stage("validation", time.perf_counter() - received_at)
+
+# --- Admission control (see admission.py) ---
+# Per process: concurrent LLM calls, with a bounded queue and wait (0 disables)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "16"))
+LLM_MAX_QUEUE_WAIT = float(os.environ.get("LLM_MAX_QUEUE_WAIT", "5"))
+# Kanoon searches per second (0 disables), burst and longest wait. With a
+# shared RATE_LIMIT_STORAGE the quota is shared by all workers and replicas;
+# with memory:// each of the WEB_CONCURRENCY workers gets an equal share of
+# it (and each replica the whole of it).
+KANOON_RATE = float(os.environ.get("KANOON_RATE", "0"))
+KANOON_BURST = int(os.environ.get("KANOON_BURST", "10"))
+KANOON_MAX_WAIT = float(os.environ.get("KANOON_MAX_WAIT", "2"))
+
+llm_gate = (ConcurrencyGate("llm", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_MAX_QUEUE_WAIT)
+            if LLM_MAX_CONCURRENCY > 0 else None)
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+def make_kanoon_gate():
+    if KANOON_RATE <= 0:
+        return None
+    if RATE_LIMIT_STORAGE != "memory://":
+        return SharedRateGate("kanoon", KANOON_RATE, KANOON_BURST, KANOON_MAX_WAIT,
+                              storage_from_string(RATE_LIMIT_STORAGE))
+    workers = max(1, WEB_CONCURRENCY)
+    return RateGate("kanoon", KANOON_RATE / workers, max(1, KANOON_BURST // workers), KANOON_MAX_WAIT)
+
+kanoon_gate = make_kanoon_gate()
+
+@asynccontextmanager
+async def admitted(gate, name):
+    """Hold a place in gate (None: no admission control) for the block, timing the wait as stage name"""
+    if gate is None:
+        yield
+        return
+    record_stage(name, await gate.acquire())
+    try:
+        yield
+    finally:
+        gate.release()
+
+def log_stage_timings():
+    spans = stage_spans_var.get()
+    if spans:
+        timings = {name: round(elapsed * 1000, 1) for name, elapsed in spans.items()}
+        logger.info(f"Request {request_id_var.get()} stage timings (ms): {json.dumps(timings)}")
+
+# How heavy resources are loaded: "background" (start at startup, serve
+# /healthz meanwhile), "lazy" (on the first /chat) or "eager" (before
+# accepting connections)
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
 
-# --- Initialize Mistral AI API ---
+# --- Google Gemini and Mistral AI clients (set up by init_llm_clients) ---
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY", "")
+MISTRAL_SERVER_URL = os.environ.get("MISTRAL_SERVER_URL") or None  # Override for local stubs
+genai = None
 mistral_client = None
-if MISTRAL_API_KEY:
-    mistral_client = Mistral(api_key=MISTRAL_API_KEY)
-    logger.info("Successfully initialized Mistral AI API")
-else:
-    logger.warning("MISTRAL_API_KEY not found. Mistral AI features will be disabled.")
+
+# --- LLM routing (see llm_router.py) ---
+MISTRAL_TIMEOUT = float(os.environ.get("MISTRAL_TIMEOUT", "60"))
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "60"))
+# Start the next provider when the first has not answered within its p95
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "1") == "1"
+# Hedge delay until a provider has LLM_HEDGE_MIN_SAMPLES latencies on record
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", "10"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = int(os.environ.get("LLM_LATENCY_WINDOW", "100"))
+llm_router = LLMRouter([])
+
+def init_llm_clients():
+    """Import and configure the LLM SDKs for the providers that have keys"""
+    global genai, mistral_client
+
+    if GEMINI_API_KEY:
+        import google.generativeai
+        genai = google.generativeai
+        genai.configure(api_key=GEMINI_API_KEY)
+        logger.info("Successfully initialized Google Gemini API")
+    else:
+        logger.warning("GEMINI_API_KEY not found. Gemini features will be disabled.")
+
+    if MISTRAL_API_KEY:
+        from mistralai import Mistral
+        mistral_client = Mistral(api_key=MISTRAL_API_KEY, server_url=MISTRAL_SERVER_URL)
+        logger.info("Successfully initialized Mistral AI API")
+    else:
+        logger.warning("MISTRAL_API_KEY not found. Mistral AI features will be disabled.")
+
+    init_llm_router()
+
+def init_llm_router():
+    """Route LLM calls across whichever providers init_llm_clients configured"""
+    global llm_router
+    providers = []
+    if mistral_client:
+        providers.append(Provider("mistral", mistral_complete, mistral_stream,
+                                  timeout=MISTRAL_TIMEOUT, window=LLM_LATENCY_WINDOW))
+    if genai:
+        providers.append(Provider("gemini", gemini_complete, gemini_stream,
+                                  timeout=GEMINI_TIMEOUT, window=LLM_LATENCY_WINDOW))
+    llm_router = LLMRouter(providers, hedge=LLM_HEDGE, hedge_delay=LLM_HEDGE_DELAY,
+                           min_samples=LLM_HEDGE_MIN_SAMPLES)
 
 # --- Initialize IK API when FastAPI starts ---
 IK_API_KEY = os.environ.get("IK_API_KEY", "") # Get from environment variables
+IK_BASE_URL = os.environ.get("IK_BASE_URL", "https://api.indiankanoon.org")
 STORAGE_DIR = "./indian_kanoon_cache"
+# Doc corpus storage: "files" (one JSON file per entry) or "packed"
+# (compressed segment files, for the write-once corpus only)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "files")
 
 # Create storage directory if it doesn't exist
 os.makedirs(STORAGE_DIR, exist_ok=True)
@@ -78,6 +285,7 @@ os.makedirs(STORAGE_DIR, exist_ok=True)
 # Default args for uvicorn run
 class DummyArgs:
     token = IK_API_KEY
+    baseurl = IK_BASE_URL
     datadir = STORAGE_DIR
     maxpages = 1
     maxcites = 0
@@ -89,9 +297,19 @@ class DummyArgs:
     fromdate = None
     todate = None
     sortby = None
+    poolsize = int(os.environ.get("IK_POOL_SIZE", "20"))
+    timeout = float(os.environ.get("IK_TIMEOUT", "10"))
+    deadline = float(os.environ.get("IK_DEADLINE", "15"))  # Total budget per search, retries included
+    breaker_failures = int(os.environ.get("IK_BREAKER_FAILURES", "5"))
+    breaker_reset = float(os.environ.get("IK_BREAKER_RESET", "30"))
+
+def make_storage(datadir):
+    if STORAGE_BACKEND == "packed":
+        return PackedStorage(datadir)
+    return FileStorage(datadir)
 
 try:
-    file_storage = FileStorage(STORAGE_DIR)
+    file_storage = make_storage(STORAGE_DIR)
     # Use DummyArgs by default
     ik_api = IKApi(DummyArgs(), file_storage)
     logger.info("Successfully initialized Indian Kanoon API")
@@ -99,16 +317,374 @@ except Exception as e:
     logger.error(f"Failed to initialize Indian Kanoon API: {str(e)}")
     raise
 
-# --- Load NER model when FastAPI starts ---
-try:
-    model, tokenizer = load_model()
-    logger.info("Successfully loaded NER model")
-except Exception as e:
-    logger.error(f"Failed to load NER model: {str(e)}")
-    raise
+# --- Search result cache (memory LRU in front of files under STORAGE_DIR) ---
+# Always plain files, even with STORAGE_BACKEND=packed: the cache overwrites
+# and evicts entries continuously, and packed segments only grow until they
+# are compacted offline.
+SEARCH_CACHE_ENABLED = os.environ.get("SEARCH_CACHE_ENABLED", "1") == "1"
+search_cache = None
+if SEARCH_CACHE_ENABLED:
+    search_cache = SearchCache(
+        file_storage if isinstance(file_storage, FileStorage) else FileStorage(STORAGE_DIR),
+        ttl=float(os.environ.get("SEARCH_CACHE_TTL", "86400")),
+        max_memory_entries=int(os.environ.get("SEARCH_CACHE_MEMORY_ENTRIES", "1024")),
+        max_disk_entries=int(os.environ.get("SEARCH_CACHE_DISK_ENTRIES", "50000")),
+    )
+    logger.info(f"Search cache enabled with {len(search_cache.disk_index)} entries on disk")
+
+def is_cacheable(results_str):
+    try:
+        return "errmsg" not in json.loads(results_str)
+    except ValueError:
+        return False
+
+async def search_kanoon(query, pagenum=0, maxpages=1):
+    """Search Indian Kanoon, answering repeat queries from the search cache"""
+    if search_cache:
+        cached = await search_cache.aget(query, pagenum, maxpages)
+        if cached is not None:
+            return cached
+    # Only upstream calls count against the quota; a rejection drops this search
+    async with admitted(kanoon_gate, "kanoon_queue"):
+        results_str = await ik_api.search_async(query, pagenum=pagenum, maxpages=maxpages)
+    if search_cache and is_cacheable(results_str):
+        await search_cache.aput(query, pagenum, maxpages, results_str)
+    return results_str
+
+# --- LLM answer cache (query + entity set + Kanoon results fingerprint) ---
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+response_cache = None
+if RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(
+        maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", "2048")),
+        ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "86400")),
+        # Cosine similarity for paraphrase matches (0, the default, disables them).
+        # The embedding is character trigrams, which cannot tell "bail granted"
+        # from "bail not granted" apart; only enable with a threshold near 1.
+        similarity_threshold=float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0")),
+    )
+
+def lookup_cached_response(user_query, extracted_entities, indian_kanoon_results):
+    """Return (answer, provenance) from the response cache, or None"""
+    if not response_cache:
+        return None
+    with stage("response_cache"):
+        cached = response_cache.get(user_query, extracted_entities, indian_kanoon_results)
+    if cached:
+        logger.info(f"Response cache {cached[1]['match']} hit")
+    return cached
+
+def store_response(user_query, extracted_entities, indian_kanoon_results, lawyer_response, model_used):
+    # Only answers generated from a successful search are reused
+    if (not response_cache or model_used == "none" or "error" in indian_kanoon_results
+            or lawyer_response.startswith("Error generating response")):
+        return
+    response_cache.put(user_query, extracted_entities, indian_kanoon_results, lawyer_response, model_used)
+
+# --- Local BM25 index over the mirrored corpus (first-tier retrieval) ---
+LOCAL_INDEX_ENABLED = os.environ.get("LOCAL_INDEX_ENABLED", "1") == "1"
+LOCAL_INDEX_PATH = os.path.join(STORAGE_DIR, "local_index.pkl")
+LOCAL_INDEX_TOP_K = int(os.environ.get("LOCAL_INDEX_TOP_K", "10"))
+# Local results are used only if at least MIN_HITS docs contain at least
+# MIN_COVERAGE of the query terms; otherwise the live Kanoon search runs
+LOCAL_INDEX_MIN_HITS = int(os.environ.get("LOCAL_INDEX_MIN_HITS", "3"))
+LOCAL_INDEX_MIN_COVERAGE = float(os.environ.get("LOCAL_INDEX_MIN_COVERAGE", "0.5"))
+LOCAL_INDEX_REFRESH = float(os.environ.get("LOCAL_INDEX_REFRESH", "300"))  # Seconds between incremental updates
+# Incremental updates are small, so the server parses in-process by default;
+# full builds of a large corpus are better done with `python local_index.py`
+LOCAL_INDEX_WORKERS = int(os.environ.get("LOCAL_INDEX_WORKERS", "1"))
+bm25_index = None
+local_index_stats = CacheStats(("local_hits", "fallbacks"))
+local_index_task = None
+
+# One worker (whichever takes the file lock first) scans the datadir and
+# rewrites the index file; the others reload it when it has changed
+local_index_file = local_index.SharedIndex(LOCAL_INDEX_PATH)
+
+def update_local_index():
+    """Index docs added to the datadir since the last update, or pick up the refresher's update"""
+    global bm25_index
+    if local_index_file.is_refresher():
+        bm25_index = local_index_file.update(file_storage, LOCAL_INDEX_WORKERS)
+    else:
+        bm25_index = local_index_file.reload()
+
+async def refresh_local_index():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, update_local_index)
+        except Exception as e:
+            logger.error(f"Local index update failed: {str(e)}")
+        await asyncio.sleep(LOCAL_INDEX_REFRESH)
+
+def search_local_index(extracted_entities):
+    """Kanoon-shaped results from the local index, or None if local recall is too low"""
+    if bm25_index is None or not len(bm25_index):
+        return None
+    hits = bm25_index.search(" ".join(extracted_entities), LOCAL_INDEX_TOP_K)
+    covered = [h for h in hits if h[1] >= LOCAL_INDEX_MIN_COVERAGE]
+    if len(covered) < LOCAL_INDEX_MIN_HITS:
+        local_index_stats.incr("fallbacks")
+        return None
+    local_index_stats.incr("local_hits")
+    docs = [dict(meta, bm25_score=round(score, 4)) for score, coverage, meta in covered]
+    return {"docs": docs, "found": "%d documents from the local index" % len(docs), "source": "local_index"}
+
+# --- Document enrichment (full text of the top hits, see enrichment.py) ---
+# Off by default: each doc costs a Kanoon API call the first time it is hit
+ENRICH_DOCS = os.environ.get("ENRICH_DOCS", "0") == "1"
+ENRICH_TOP_K = int(os.environ.get("ENRICH_TOP_K", "3"))
+ENRICH_CONCURRENCY = int(os.environ.get("ENRICH_CONCURRENCY", "3"))
+ENRICH_DEADLINE = float(os.environ.get("ENRICH_DEADLINE", "3"))
+ENRICH_PASSAGES = int(os.environ.get("ENRICH_PASSAGES", "2"))  # per doc
+ENRICH_PASSAGE_CHARS = int(os.environ.get("ENRICH_PASSAGE_CHARS", "600"))
 
-# Default model preference (can be "mistral" or "gemini")
-MODEL_PREFERENCE = "mistral"
+async def fetch_kanoon_doc(docid):
+    # Doc fetches count against the same quota as searches
+    async with admitted(kanoon_gate, "kanoon_queue"):
+        return await ik_api.fetch_doc_async(docid)
+
+doc_cache = None
+if ENRICH_DOCS:
+    doc_cache = DocCache(file_storage, ik_api.manifest, fetch_kanoon_doc,
+                         memory_entries=int(os.environ.get("ENRICH_MEMORY_DOCS", "256")))
+
+async def enrich_results(extracted_entities, indian_kanoon_results):
+    """Pipeline stage 3a: the results with the passages of the top hits' full text
+    that match the entities attached to their docs (as "passages")"""
+    if not doc_cache or not extracted_entities or not indian_kanoon_results.get("docs"):
+        return indian_kanoon_results
+    hits = [doc for doc in indian_kanoon_results["docs"] if doc.get("tid") is not None][:ENRICH_TOP_K]
+    with stage("enrich"):
+        texts = await doc_cache.get_many(hits, ENRICH_CONCURRENCY, ENRICH_DEADLINE)
+    docs = []
+    for doc in indian_kanoon_results["docs"]:
+        paragraphs = texts.get(doc.get("tid"))
+        if paragraphs:
+            passages = extract_passages(paragraphs, extracted_entities, ENRICH_PASSAGES, ENRICH_PASSAGE_CHARS)
+            doc = dict(doc, passages=passages)
+        docs.append(doc)
+    return dict(indian_kanoon_results, docs=docs)
+
+# --- NER model (loaded by load_resources) ---
+NER_BACKEND = os.environ.get("NER_BACKEND", "fp32")
+NER_ONNX_PATH = os.environ.get("NER_ONNX_PATH") or None
+NER_WARMUP_RUNS = int(os.environ.get("NER_WARMUP_RUNS", "1"))
+NER_WARMUP_TEXT = os.environ.get("NER_WARMUP_TEXT", "The Supreme Court of India heard the appeal in New Delhi.")
+model = None
+tokenizer = None
+
+# NER is a synchronous torch forward pass, so it runs on a small bounded pool
+# instead of the event loop. Torch already parallelises each pass internally.
+NER_WORKERS = int(os.environ.get("NER_WORKERS", "2"))
+ner_executor = ThreadPoolExecutor(max_workers=NER_WORKERS, thread_name_prefix="ner")
+
+# Repeated queries are answered from a memo of NER results, keyed on the
+# sanitized query (case kept, as the model is cased), without tokenizing or
+# running the model.
+NER_CACHE_ENABLED = os.environ.get("NER_CACHE_ENABLED", "1") == "1"
+NER_CACHE_TTL = float(os.environ.get("NER_CACHE_TTL", "86400"))
+ner_memo = None
+if NER_CACHE_ENABLED:
+    ner_memo = NERMemo(maxsize=int(os.environ.get("NER_CACHE_SIZE", "4096")), ttl=NER_CACHE_TTL)
+
+# Concurrent queries are grouped into micro-batches (one forward pass each)
+NER_BATCHING = os.environ.get("NER_BATCHING", "1") == "1"
+ner_batcher = None
+
+load_task = None
+
+def load_ner(warmup=True):
+    """Import the transformers stack, load the NER model and run the warmup inference.
+
+    The model is only loaded if preload_for_fork has not already done so.
+    """
+    global model, tokenizer
+    from legal_ner import load_model, extract_ner_entities
+
+    if model is None:
+        start = time.perf_counter()
+        model, tokenizer = load_model(backend=NER_BACKEND, onnx_path=NER_ONNX_PATH)
+        logger.info(f"Successfully loaded NER model in {time.perf_counter() - start:.2f}s")
+    if not warmup:
+        return
+
+    start = time.perf_counter()
+    for _ in range(NER_WARMUP_RUNS):
+        extract_ner_entities(NER_WARMUP_TEXT, model, tokenizer)
+    if NER_WARMUP_RUNS:
+        logger.info(f"NER warmup ({NER_WARMUP_RUNS} runs) took {time.perf_counter() - start:.2f}s")
+
+def preload_for_fork():
+    """Load the NER weights in the gunicorn master, before it forks the workers.
+
+    Called from gunicorn.conf.py. The workers share the weight pages
+    copy-on-write: nothing writes to them after loading, and gc.freeze()
+    keeps the collector from touching (and so copying) the objects created
+    so far. Warmup still runs in each worker because torch's thread pools
+    do not survive fork(). onnxruntime sessions are not fork-safe, so the
+    onnx backend keeps loading in each worker.
+    """
+    if NER_BACKEND == "onnx":
+        logger.warning("NER_BACKEND=onnx cannot be shared across forked workers; loading per worker")
+        return
+    load_ner(warmup=False)
+    gc.collect()
+    gc.freeze()
+    logger.info("NER model preloaded for forked workers")
+
+async def load_resources():
+    global ner_batcher, local_index_task
+    loop = asyncio.get_running_loop()
+    if LOCAL_INDEX_ENABLED and local_index_task is None:
+        local_index_task = asyncio.create_task(refresh_local_index())
+    try:
+        await loop.run_in_executor(ner_executor, init_llm_clients)
+        await loop.run_in_executor(ner_executor, load_ner)
+    except Exception as e:
+        logger.error(f"Failed to load models: {str(e)}")
+        raise
+
+    if NER_BATCHING:
+        ner_batcher = NERBatcher(
+            model, tokenizer, ner_executor,
+            max_batch_size=int(os.environ.get("NER_MAX_BATCH_SIZE", "16")),
+            max_wait_ms=float(os.environ.get("NER_MAX_WAIT_MS", "5")),
+            max_inflight=NER_WORKERS,
+        )
+        ner_batcher.start()
+    logger.info("Backend is ready")
+
+def start_loading():
+    global load_task
+    if load_task is None:
+        load_task = asyncio.create_task(load_resources())
+    return load_task
+
+async def ensure_loaded():
+    """Wait until models and clients are loaded, starting the load on first use"""
+    await asyncio.shield(start_loading())
+
+def is_ready():
+    return (load_task is not None and load_task.done()
+            and not load_task.cancelled() and load_task.exception() is None)
+
+async def shutdown_resources():
+    if load_task is not None and not load_task.done():
+        load_task.cancel()
+    if local_index_task is not None:
+        local_index_task.cancel()
+    local_index_file.close()  # Hands the refresher role to another worker
+    if ner_batcher:
+        await ner_batcher.stop()
+    for task in list(batch_tasks.values()):
+        task.cancel()
+    await asyncio.gather(*batch_tasks.values(), return_exceptions=True)
+    job_store.interrupt_running()
+    job_store.close()
+    await ik_api.aclose()
+    preference_store.close()
+    if doc_cache:
+        doc_cache.close()
+    if metrics_task is not None:
+        metrics_task.cancel()
+        metrics_store.write(metrics_store.snapshot())  # Keep this worker's counts once it has gone
+    ner_executor.shutdown(wait=False)
+
+def sanitize_query(text):
+    """Drop characters other than word characters, whitespace and basic punctuation"""
+    return re.sub(r'[^\w\s\-.,?!]', '', text)
+
+def ner_text(text):
+    """The text NER runs on: sanitized, with whitespace collapsed. Entity
+    offsets refer to it and the memo is keyed on it."""
+    return re.sub(r'\s+', ' ', sanitize_query(text)).strip()
+
+async def run_ner(text):
+    """Run NER off the event loop, batched with concurrent requests when enabled.
+
+    A failed inference gives no entities and is not memoized, so the next
+    request for the text tries again.
+    """
+    text = ner_text(text)
+    if ner_memo:
+        entities = ner_memo.get(text)
+        if entities is not None:
+            return entities
+    if ner_batcher:
+        entities = await ner_batcher.submit(text)
+    else:
+        from legal_ner import extract_ner_entities
+        loop = asyncio.get_running_loop()
+        entities = await loop.run_in_executor(ner_executor, extract_ner_entities, text, model, tokenizer)
+    if entities is None:
+        return []
+    if ner_memo:
+        ner_memo.put(text, entities)
+    return entities
+
+async def run_ner_batch(texts, batch_size=64):
+    """Entities for many texts at once: memo hits, then the distinct rest in
+    forward passes of batch_size (sorted by length, to limit padding) on one
+    executor thread. Texts whose inference failed get no entities and are
+    not memoized."""
+    from legal_ner import extract_ner_entities_batch
+    texts = [ner_text(text) for text in texts]
+    found = {}
+    if ner_memo:
+        for text in texts:
+            entities = ner_memo.get(text)
+            if entities is not None:
+                found[text] = entities
+    missing = sorted({text for text in texts if text not in found}, key=len)
+
+    def infer():
+        for i in range(0, len(missing), batch_size):
+            chunk = missing[i:i + batch_size]
+            found.update(zip(chunk, extract_ner_entities_batch(chunk, model, tokenizer)))
+
+    if missing:
+        await asyncio.get_running_loop().run_in_executor(ner_executor, infer)
+        if ner_memo:
+            for text in missing:
+                if found[text] is not None:
+                    ner_memo.put(text, found[text])
+    return [found[text] or [] for text in texts]
+
+# --- Model preference ---
+# Kept per client (API key, or a session cookie / X-Session-ID header) in a
+# store shared by all worker processes, so any worker serves the same choice.
+# "auto" lets the router pick the fastest observed provider; the others are
+# still used for hedging and failover.
+MODEL_CHOICES = ("mistral", "gemini", "auto")
+# Default for clients that have not set one
+MODEL_PREFERENCE = os.environ.get("MODEL_PREFERENCE", "mistral")
+PREFERENCE_STORE = os.environ.get("PREFERENCE_STORE", os.path.join(STORAGE_DIR, "preferences.sqlite"))
+PREFERENCE_TTL_DAYS = float(os.environ.get("PREFERENCE_TTL_DAYS", "365"))
+preference_store = preferences.open_store(PREFERENCE_STORE, PREFERENCE_TTL_DAYS * 86400)
+
+def request_client_key(request):
+    return preferences.client_key(
+        request.headers.get("x-api-key"),
+        request.headers.get("x-session-id") or request.cookies.get(preferences.SESSION_COOKIE))
+
+async def client_model_preference(request):
+    """X-Model-Preference header, else the client's stored preference, else the default"""
+    model = request.headers.get("x-model-preference")
+    if model in MODEL_CHOICES:
+        return model
+    client = request_client_key(request)
+    if client:
+        try:
+            # SQLite or Redis round trip, so off the event loop
+            model = await asyncio.get_running_loop().run_in_executor(None, preference_store.get, client, "model")
+        except Exception as e:
+            logger.warning(f"Could not read model preference: {str(e)}")
+            model = None
+        if model in MODEL_CHOICES:
+            return model
+    return MODEL_PREFERENCE
 
 class ChatQuery(BaseModel):
     query: str
@@ -119,43 +695,72 @@ class ChatQuery(BaseModel):
 
     @validator('query')
     def validate_query(cls, v):
-        # Remove any potentially harmful characters
-        v = re.sub(r'[^\w\s\-.,?!]', '', v)
-        if len(v.strip()) < 3:
-            raise ValueError('Query must be at least 3 characters long')
-        if len(v) > 1000:
-            raise ValueError('Query must not exceed 1000 characters')
-        return v.strip()
+        return clean_query(v)
+
+def clean_query(v):
+    # Remove any potentially harmful characters
+    v = sanitize_query(v)
+    if len(v.strip()) < 3:
+        raise ValueError('Query must be at least 3 characters long')
+    if len(v) > 1000:
+        raise ValueError('Query must not exceed 1000 characters')
+    return v.strip()
 
 class ModelPreference(BaseModel):
-    model: str  # "mistral" or "gemini"
+    model: str  # "mistral", "gemini" or "auto"
 
 @app.post("/set-model-preference")
-async def set_model_preference(preference: ModelPreference):
-    """Set the preferred AI model to use for responses."""
-    global MODEL_PREFERENCE
-    
-    if preference.model not in ["mistral", "gemini"]:
-        raise HTTPException(status_code=400, detail="Invalid model preference. Must be 'mistral' or 'gemini'")
+async def set_model_preference(preference: ModelPreference, request: Request, response: Response):
+    """Set the calling client's preferred AI model.
+
+    Clients without an API key or session get a new session cookie (its ID
+    is also returned, for use as X-Session-ID by non-browser clients).
+    """
+    if preference.model not in MODEL_CHOICES:
+        raise HTTPException(status_code=400, detail="Invalid model preference. Must be 'mistral', 'gemini' or 'auto'")
     
-    MODEL_PREFERENCE = preference.model
-    logger.info(f"Model preference set to: {MODEL_PREFERENCE}")
+    client = request_client_key(request)
+    session_id = None
+    if client is None:
+        session_id = preferences.new_session_id()
+        client = preferences.client_key(session_id=session_id)
+    elif client.startswith("session:"):
+        session_id = client[len("session:"):]
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, preference_store.set, client, "model", preference.model)
+    except Exception as e:
+        logger.error(f"Could not store model preference: {str(e)}")
+        raise HTTPException(status_code=503, detail="Preference store unavailable")
+    if session_id:
+        response.set_cookie(preferences.SESSION_COOKIE, session_id, max_age=int(PREFERENCE_TTL_DAYS * 86400),
+                            httponly=True, samesite="lax")
+    logger.debug("Model preference set to %s", preference.model)
     
-    return {"message": f"Model preference set to {MODEL_PREFERENCE}"}
+    return {"message": f"Model preference set to {preference.model}", "model": preference.model,
+            "session_id": session_id}
 
 @app.get("/get-model-preference")
-async def get_model_preference():
-    """Get the current preferred AI model."""
-    return {"model": MODEL_PREFERENCE}
+async def get_model_preference(request: Request):
+    """Get the calling client's preferred AI model."""
+    return {"model": await client_model_preference(request)}
 
-# Function to get Gemini response using legal context
-async def get_gemini_response(user_query, legal_entities, indian_kanoon_results):
-    try:
-        if not GEMINI_API_KEY:
-            return {"gemini_response": "Gemini API key not configured. Please set the GEMINI_API_KEY environment variable."}
-        
-        # Create a prompt for Gemini with legal context
-        prompt = f"""
+# Token budget for the Kanoon context in the prompt
+PROMPT_CONTEXT_TOKENS = int(os.environ.get("PROMPT_CONTEXT_TOKENS", "1500"))
+prompt_stats = PromptStats()
+
+def prepare_context(extracted_entities, indian_kanoon_results):
+    """Pipeline stage 3: compact, ranked Kanoon context for the prompt"""
+    with stage("prompt"):
+        context, stats = build_context(indian_kanoon_results, extracted_entities, PROMPT_CONTEXT_TOKENS)
+    prompt_stats.record(stats)
+    logger.info(f"Prompt context: ~{stats['raw_tokens']} -> ~{stats['context_tokens']} tokens "
+                f"({stats['docs_used']}/{stats['docs_in']} docs, {stats['passages_used']} passages)")
+    return context, stats
+
+def build_prompt(user_query, legal_entities, context):
+    """Prompt shared by all providers"""
+    return f"""
         You are an experienced lawyer specializing in Indian law. Your task is to provide a clear, helpful response to a legal question.
 
         USER QUERY: {user_query}
@@ -163,7 +768,7 @@ async def get_gemini_response(user_query, legal_entities, indian_kanoon_results)
         LEGAL ENTITIES IDENTIFIED: {', '.join(legal_entities) if legal_entities else "None"}
 
         INDIAN KANOON (LEGAL DATABASE) SEARCH RESULTS: 
-        {json.dumps(indian_kanoon_results, indent=2)}
+        {context}
 
         RESPONSE REQUIREMENTS:
         1. Be concise and to the point
@@ -175,166 +780,611 @@ async def get_gemini_response(user_query, legal_entities, indian_kanoon_results)
         7. Do not include disclaimers or introductions like "Based on..." or "According to..."
         8. Use numbered lists or bullet points when listing multiple items
         """
-        
-        # Call Gemini API
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        
-        return {"gemini_response": response.text}
-    except Exception as e:
-        logger.error(f"Error calling Gemini API: {str(e)}")
-        return {"gemini_response": f"Error generating response: {str(e)}"}
 
-# Function to get Mistral AI response using legal context
-async def get_mistral_response(user_query, legal_entities, indian_kanoon_results):
-    try:
-        if not mistral_client:
-            return {"response": "Mistral API key not configured. Please set the MISTRAL_API_KEY environment variable."}
-        
-        # Create a prompt for Mistral with legal context
-        prompt = f"""
-        You are an experienced lawyer specializing in Indian law. Your task is to provide a clear, helpful response to a legal question.
+# --- LLM providers (raise on errors so the router can fail over) ---
+async def gemini_complete(prompt):
+    model = genai.GenerativeModel('gemini-1.5-pro')
+    response = await model.generate_content_async(prompt)
+    return response.text
 
-        USER QUERY: {user_query}
+async def mistral_complete(prompt):
+    chat_response = await mistral_client.chat.complete_async(
+        model="mistral-large-latest",
+        messages=[
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    )
+    return chat_response.choices[0].message.content
 
-        LEGAL ENTITIES IDENTIFIED: {', '.join(legal_entities) if legal_entities else "None"}
+async def gemini_stream(prompt):
+    """Yield Gemini response text chunks as they are generated"""
+    model = genai.GenerativeModel('gemini-1.5-pro')
+    response = await model.generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        if chunk.text:
+            yield chunk.text
 
-        INDIAN KANOON (LEGAL DATABASE) SEARCH RESULTS: 
-        {json.dumps(indian_kanoon_results, indent=2)}
+async def mistral_stream(prompt):
+    """Yield Mistral response text chunks as they are generated"""
+    response = await mistral_client.chat.stream_async(
+        model="mistral-large-latest",
+        messages=[
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    )
+    async for event in response:
+        content = event.data.choices[0].delta.content
+        if content:
+            yield content
 
-        RESPONSE REQUIREMENTS:
-        1. Be concise and to the point
-        2. Use short, clear paragraphs with proper spacing
-        3. Focus on the most relevant legal information
-        4. Avoid unnecessary legal jargon
-        5. Format your response with clear headings if appropriate
-        6. Provide a brief summary at the beginning
-        7. Do not include disclaimers or introductions like "Based on..." or "According to..."
-        8. Use numbered lists or bullet points when listing multiple items
-        """
-        
-        # Call Mistral AI API
-        chat_response = mistral_client.chat.complete(
-            model="mistral-large-latest",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        )
-        
-        return {"response": chat_response.choices[0].message.content}
+async def extract_legal_entities(user_query):
+    """Pipeline stage 1: named entities from the query"""
+    with stage("ner"):
+        entities = await run_ner(user_query)
+    extracted_entities = [ent[0] for ent in entities if ent[1] != 'O']
+    logger.debug("Extracted entities: %s", extracted_entities)
+    return extracted_entities
+
+# Multi-query retrieval: per-entity, entity-pair and full-string searches run
+# concurrently and are merged by tid
+RETRIEVAL_FANOUT = os.environ.get("RETRIEVAL_FANOUT", "1") == "1"
+RETRIEVAL_MAX_SUBQUERIES = int(os.environ.get("RETRIEVAL_MAX_SUBQUERIES", "6"))
+# All sub-queries at once by default; the Kanoon gate bounds the total rate
+RETRIEVAL_CONCURRENCY = int(os.environ.get("RETRIEVAL_CONCURRENCY", str(RETRIEVAL_MAX_SUBQUERIES)))
+RETRIEVAL_DEADLINE = float(os.environ.get("RETRIEVAL_DEADLINE", "8"))
+
+async def retrieve_kanoon_results(extracted_entities, search=None):
+    """Pipeline stage 2: Indian Kanoon search on the extracted entities.
+
+    search stands in for search_kanoon (batch jobs share their searches).
+    """
+    if not extracted_entities:
+        logger.info("No relevant entities found to search Indian Kanoon")
+        return {"message": "No relevant entities found to search Indian Kanoon."}
+
+    with stage("local_index"):
+        local_results = search_local_index(extracted_entities)
+    if local_results is not None:
+        logger.info(f"Retrieved local index results: {local_results['found']}")
+        return local_results
+
+    # Includes retries and backoff inside IKHttpClient
+    with stage("kanoon"):
+        return await search_kanoon_remote(extracted_entities, search)
+
+async def search_kanoon_remote(extracted_entities, search=None):
+    search = search or search_kanoon
+    if RETRIEVAL_FANOUT:
+        try:
+            indian_kanoon_results = await retrieval.retrieve(
+                search, extracted_entities,
+                max_subqueries=RETRIEVAL_MAX_SUBQUERIES,
+                concurrency=RETRIEVAL_CONCURRENCY,
+                deadline=RETRIEVAL_DEADLINE,
+            )
+            logger.info(f"Retrieved Indian Kanoon results: {indian_kanoon_results.get('found')}")
+        except Exception as e:
+            logger.error(f"Error querying Indian Kanoon API: {str(e)}")
+            indian_kanoon_results = {"error": f"Error querying Indian Kanoon: {str(e)}"}
+        return indian_kanoon_results
+
+    search_query = " ".join(extracted_entities)
+    logger.info(f"Searching Indian Kanoon for: {search_query}")
+    
+    try:
+        results_str = await search(search_query, pagenum=0, maxpages=1)
+        indian_kanoon_results = json.loads(results_str)
+        logger.info("Successfully retrieved Indian Kanoon results")
+    except json.JSONDecodeError as e:
+        logger.error(f"Error decoding Indian Kanoon JSON response: {str(e)}")
+        indian_kanoon_results = {"error": "Failed to decode Indian Kanoon response."}
     except Exception as e:
-        logger.error(f"Error calling Mistral AI API: {str(e)}")
-        return {"response": f"Error generating response: {str(e)}"}
+        logger.error(f"Error querying Indian Kanoon API: {str(e)}")
+        indian_kanoon_results = {"error": f"Error querying Indian Kanoon: {str(e)}"}
+    return indian_kanoon_results
+
+def preferred_model(model_preference):
+    """Provider to try first, or None to let the router pick by observed latency"""
+    return None if model_preference == "auto" else model_preference
+
+NO_AI_SERVICE_MESSAGE = "No AI service is configured. Please set either MISTRAL_API_KEY or GEMINI_API_KEY."
 
 @app.post("/chat")
 @app.post("/chat/")
-@limiter.limit("20/minute")  # Limit to 20 requests per minute per IP
+@limiter.limit(RATE_LIMIT)  # 20 requests per minute per client by default
 async def chat(request: Request, chat_query: ChatQuery):
+    record_validation(request)
     user_query = chat_query.query
-    logger.info(f"User query: {user_query}")
+    logger.debug("User query: %s", user_query)
+    with CHAT_IN_FLIGHT.track_inprogress("chat"):
+        try:
+            return await answer_chat(user_query, await client_model_preference(request))
+        finally:
+            log_stage_timings()
+
+async def generate_answer(user_query, extracted_entities, indian_kanoon_results, model_preference):
+    """Pipeline stage 4: the lawyer response, from the response cache or the LLM router.
+
+    Returns the /chat response body; raises ProviderError if every provider failed.
+    """
+    cached = lookup_cached_response(user_query, extracted_entities, indian_kanoon_results)
+    if cached:
+        lawyer_response, provenance = cached
+        model_used = provenance["model_used"]
+        context_stats = None
+    else:
+        provenance = None
+        enriched_results = await enrich_results(extracted_entities, indian_kanoon_results)
+        context, context_stats = prepare_context(extracted_entities, enriched_results)
+        prompt = build_prompt(user_query, extracted_entities, context)
+        try:
+            async with admitted(llm_gate, "llm_queue"):
+                with stage("llm"):
+                    model_used, lawyer_response = await llm_router.complete(
+                        prompt, preferred_model(model_preference))
+        except NoProviderError:
+            logger.warning("No AI service available")
+            model_used, lawyer_response = "none", NO_AI_SERVICE_MESSAGE
+        store_response(user_query, extracted_entities, indian_kanoon_results, lawyer_response, model_used)
+
+    # Build response with all information
+    return {
+        "user_query": user_query,
+        "extracted_legal_entities": extracted_entities,
+        "indian_kanoon_results": indian_kanoon_results,
+        "lawyer_response": lawyer_response,
+        "model_used": model_used,
+        "cache": provenance,
+        "prompt_context": context_stats
+    }
+
+async def answer_chat(user_query, model_preference=MODEL_PREFERENCE):
+    try:
+        await ensure_loaded()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: models failed to load ({str(e)})")
     
     try:
-        # Extract named entities
-        entities = extract_ner_entities(user_query, model, tokenizer)
-        extracted_entities = [ent[0] for ent in entities if ent[1] != 'O']
-        logger.info(f"Extracted entities: {extracted_entities}")
-        
-        # Search Indian Kanoon if we have entities
-        if extracted_entities:
-            search_query = " ".join(extracted_entities)
-            logger.info(f"Searching Indian Kanoon for: {search_query}")
-            
-            try:
-                results_str = ik_api.search(search_query, pagenum=0, maxpages=1)
-                indian_kanoon_results = json.loads(results_str)
-                logger.info("Successfully retrieved Indian Kanoon results")
-            except json.JSONDecodeError as e:
-                logger.error(f"Error decoding Indian Kanoon JSON response: {str(e)}")
-                indian_kanoon_results = {"error": "Failed to decode Indian Kanoon response."}
-            except Exception as e:
-                logger.error(f"Error querying Indian Kanoon API: {str(e)}")
-                indian_kanoon_results = {"error": f"Error querying Indian Kanoon: {str(e)}"}
-        else:
-            logger.info("No relevant entities found to search Indian Kanoon")
-            indian_kanoon_results = {"message": "No relevant entities found to search Indian Kanoon."}
-        
-        # Use the preferred model (with fallbacks)
-        lawyer_response = None
-        model_used = None
-        
-        if MODEL_PREFERENCE == "mistral" and mistral_client:
-            logger.info("Using Mistral AI for response generation")
-            ai_response = await get_mistral_response(user_query, extracted_entities, indian_kanoon_results)
-            lawyer_response = ai_response["response"]
-            model_used = "mistral"
-        elif MODEL_PREFERENCE == "gemini" and GEMINI_API_KEY:
-            logger.info("Using Google Gemini for response generation")
-            gemini_response = await get_gemini_response(user_query, extracted_entities, indian_kanoon_results)
-            lawyer_response = gemini_response["gemini_response"]
-            model_used = "gemini"
-        # Fallback options if preferred model isn't available
-        elif mistral_client:
-            logger.info("Preferred model not available, falling back to Mistral AI")
-            ai_response = await get_mistral_response(user_query, extracted_entities, indian_kanoon_results)
-            lawyer_response = ai_response["response"]
-            model_used = "mistral"
-        elif GEMINI_API_KEY:
-            logger.info("Preferred model not available, falling back to Google Gemini")
-            gemini_response = await get_gemini_response(user_query, extracted_entities, indian_kanoon_results)
-            lawyer_response = gemini_response["gemini_response"]
-            model_used = "gemini"
-        else:
-            logger.warning("No AI service available")
-            lawyer_response = "No AI service is configured. Please set either MISTRAL_API_KEY or GEMINI_API_KEY."
-            model_used = "none"
-        
-        # Build response with all information
-        overall_message = {
-            "user_query": user_query,
-            "extracted_legal_entities": extracted_entities,
-            "indian_kanoon_results": indian_kanoon_results,
-            "lawyer_response": lawyer_response,
-            "model_used": model_used
-        }
-        
+        if llm_gate:
+            llm_gate.check()  # Shed before NER and retrieval when the LLM queue is full
+        extracted_entities = await extract_legal_entities(user_query)
+        indian_kanoon_results = await retrieve_kanoon_results(extracted_entities)
+        try:
+            overall_message = await generate_answer(user_query, extracted_entities, indian_kanoon_results,
+                                                    model_preference)
+        except ProviderError as e:
+            logger.error(f"All AI providers failed: {str(e)}")
+            raise HTTPException(status_code=502, detail="AI service unavailable: all providers failed")
         return {"response": overall_message}
     
+    except (HTTPException, AdmissionRejected):
+        raise
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def chat_event_stream(user_query, model_preference=MODEL_PREFERENCE):
+    """Server-sent events for each pipeline stage, then the LLM tokens as they arrive"""
+    with CHAT_IN_FLIGHT.track_inprogress("chat_stream"):
+        async for event in chat_events(user_query, model_preference):
+            yield event
+    log_stage_timings()
+
+async def chat_events(user_query, model_preference=MODEL_PREFERENCE):
+    try:
+        await ensure_loaded()
+        if llm_gate:
+            llm_gate.check()
+        extracted_entities = await extract_legal_entities(user_query)
+        yield sse_event("entities", {"extracted_legal_entities": extracted_entities})
+
+        indian_kanoon_results = await retrieve_kanoon_results(extracted_entities)
+        yield sse_event("kanoon", {"indian_kanoon_results": indian_kanoon_results})
+
+        cached = lookup_cached_response(user_query, extracted_entities, indian_kanoon_results)
+        if cached:
+            lawyer_response, provenance = cached
+            yield sse_event("token", {"text": lawyer_response})
+            yield sse_event("done", {"model_used": provenance["model_used"], "cache": provenance})
+            return
+
+        enriched_results = await enrich_results(extracted_entities, indian_kanoon_results)
+        context, _ = prepare_context(extracted_entities, enriched_results)
+        prompt = build_prompt(user_query, extracted_entities, context)
+        # The LLM slot is held until the last token has been sent
+        async with admitted(llm_gate, "llm_queue"):
+            start = time.perf_counter()
+            try:
+                # Hedging and failover cover the wait for the first token
+                model_used, tokens = await llm_router.open_stream(
+                    prompt, preferred_model(model_preference))
+            except NoProviderError:
+                logger.warning("No AI service available")
+                model_used, tokens = "none", None
+                yield sse_event("token", {"text": NO_AI_SERVICE_MESSAGE})
+            except ProviderError as e:
+                logger.error(f"All AI providers failed: {str(e)}")
+                yield sse_event("error", {"detail": "AI service unavailable: all providers failed"})
+                return
+
+            if tokens is not None:
+                record_stage("llm_first_token", time.perf_counter() - start)
+                chunks = []
+                try:
+                    async for text in tokens:
+                        chunks.append(text)
+                        yield sse_event("token", {"text": text})
+                finally:
+                    await tokens.aclose()
+                # Includes the time the client took to read the tokens
+                record_stage("llm", time.perf_counter() - start)
+                store_response(user_query, extracted_entities, indian_kanoon_results, "".join(chunks), model_used)
+        yield sse_event("done", {"model_used": model_used, "cache": None})
+    except AdmissionRejected as e:
+        logger.warning(f"Streaming chat request shed: {str(e)}")
+        yield sse_event("error", {"detail": f"Server busy: {e.reason}, retry in {e.retry_after}s",
+                                  "retry_after": e.retry_after})
+    except Exception as e:
+        logger.error(f"Error processing streaming chat request: {str(e)}")
+        yield sse_event("error", {"detail": f"Internal server error: {str(e)}"})
+
+@app.post("/chat/stream")
+@limiter.limit(RATE_LIMIT)  # 20 requests per minute per client by default
+async def chat_stream(request: Request, chat_query: ChatQuery):
+    """Streaming variant of /chat.
+
+    Sends "entities", "kanoon", one "token" event per LLM chunk and a final
+    "done" (or "error") event as text/event-stream.
+    """
+    record_validation(request)
+    logger.debug("User query (stream): %s", chat_query.query)
+    return StreamingResponse(
+        chat_event_stream(chat_query.query, await client_model_preference(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Batch chat jobs ---
+# A batch of queries runs as a background job in the worker that accepted it:
+# one NER pass over all queries, each distinct Kanoon search and each
+# distinct query answered once, and at most BATCH_LLM_CONCURRENCY LLM calls
+# at a time. Results go to a store shared by the workers, so the job can be
+# polled or streamed (NDJSON) through any of them.
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", "500"))
+BATCH_RATE_LIMIT = os.environ.get("BATCH_RATE_LIMIT", "5/minute")
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "4"))
+BATCH_SEARCH_CONCURRENCY = int(os.environ.get("BATCH_SEARCH_CONCURRENCY", "8"))
+BATCH_NER_SIZE = int(os.environ.get("BATCH_NER_SIZE", "64"))
+# Jobs running at once per process; more are rejected with 503
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "2"))
+BATCH_JOB_STORE = os.environ.get("BATCH_JOB_STORE", os.path.join(STORAGE_DIR, "batch_jobs.sqlite"))
+BATCH_JOB_TTL_HOURS = float(os.environ.get("BATCH_JOB_TTL_HOURS", "24"))
+BATCH_POLL_INTERVAL = 0.5
+
+job_store = JobStore(BATCH_JOB_STORE, BATCH_JOB_TTL_HOURS * 3600)
+batch_gate = ConcurrencyGate("batch", BATCH_MAX_JOBS)
+batch_tasks = {}     # job ID -> task, for the jobs running in this process
+batch_progress = {}  # job ID -> event set (and replaced) whenever a result is stored
+
+class BatchChatQuery(BaseModel):
+    queries: List[str]
+
+    @validator('queries')
+    def validate_queries(cls, v):
+        if not v:
+            raise ValueError('At least one query is required')
+        if len(v) > BATCH_MAX_QUERIES:
+            raise ValueError(f'At most {BATCH_MAX_QUERIES} queries per batch')
+        cleaned = []
+        for i, query in enumerate(v):
+            try:
+                cleaned.append(clean_query(query))
+            except ValueError as e:
+                raise ValueError(f'Query {i}: {e}')
+        return cleaned
+
+def notify_progress(job_id):
+    event = batch_progress.get(job_id)
+    if event is not None:
+        batch_progress[job_id] = asyncio.Event()
+        event.set()
+
+async def answer_batch_item(user_query, extracted_entities, indian_kanoon_results, model_preference):
+    """generate_answer for a batch job, which waits for LLM admission instead of being shed"""
+    while True:
+        try:
+            return await generate_answer(user_query, extracted_entities, indian_kanoon_results, model_preference)
+        except AdmissionRejected as e:
+            await asyncio.sleep(e.retry_after)
+
+async def run_batch_job(job_id, queries, model_preference):
+    searches, retrievals, answers = SingleFlight(), SingleFlight(), SingleFlight()
+    search_slots = asyncio.Semaphore(BATCH_SEARCH_CONCURRENCY)
+    llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def search(query, pagenum=0, maxpages=1):
+        async def call():
+            async with search_slots:
+                return await search_kanoon(query, pagenum, maxpages)
+        return await searches.do((query, pagenum, maxpages), call)
+
+    async def answer(user_query, extracted_entities, indian_kanoon_results):
+        async with llm_slots:
+            return await answer_batch_item(user_query, extracted_entities, indian_kanoon_results, model_preference)
+
+    async def run_item(item, user_query, entities):
+        try:
+            extracted_entities = [ent[0] for ent in entities if ent[1] != 'O']
+            indian_kanoon_results = await retrievals.do(
+                tuple(extracted_entities), lambda: retrieve_kanoon_results(extracted_entities, search))
+            response = await answers.do(
+                (user_query.lower(), tuple(extracted_entities)),
+                lambda: answer(user_query, extracted_entities, indian_kanoon_results))
+            result = {"item": item, "status": "ok", "response": response}
+        except ProviderError as e:
+            logger.error(f"Batch {job_id} item {item}: all AI providers failed: {str(e)}")
+            result = {"item": item, "status": "error", "detail": "AI service unavailable: all providers failed"}
+        except Exception as e:
+            logger.error(f"Batch {job_id} item {item} failed: {str(e)}")
+            result = {"item": item, "status": "error", "detail": f"Internal server error: {str(e)}"}
+        await job_store.aadd_result(job_id, item, result)
+        notify_progress(job_id)
+
+    # Stage timings go to the histograms only, not to the request that started the job
+    stage_spans_var.set(None)
+    status = "failed"
+    start = time.perf_counter()
+    try:
+        with CHAT_IN_FLIGHT.track_inprogress("chat_batch"):
+            await ensure_loaded()
+            with stage("batch_ner"):
+                entity_lists = await run_ner_batch(queries, BATCH_NER_SIZE)
+            await asyncio.gather(*[run_item(item, query, entities)
+                                   for item, (query, entities) in enumerate(zip(queries, entity_lists))])
+        status = "done"
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception as e:
+        logger.error(f"Batch {job_id} failed: {str(e)}")
+    finally:
+        try:
+            await asyncio.shield(job_store.afinish(job_id, status))
+        finally:
+            notify_progress(job_id)
+            batch_progress.pop(job_id, None)
+            batch_tasks.pop(job_id, None)
+            batch_gate.release()
+        logger.info(f"Batch {job_id} {status}: {len(queries)} queries in {time.perf_counter() - start:.2f}s, "
+                    f"{searches.stats.as_dict()['calls']} searches, {answers.stats.as_dict()['calls']} answers")
+
+async def job_lines(job_id, after=0):
+    """NDJSON lines of the job's results after cursor after, until it has finished, then its status"""
+    while True:
+        event = batch_progress.get(job_id)
+        job = await job_store.aget(job_id)  # Read before the results, so none added before it finished are missed
+        if job is None:
+            return
+        rows = await job_store.aresults(job_id, after)
+        for seq, result in rows:
+            after = seq
+            yield json.dumps(dict(json.loads(result), seq=seq)) + "\n"
+        if job["status"] != "running" and not rows:
+            yield json.dumps(dict(job, cursor=after)) + "\n"
+            return
+        if rows:
+            continue
+        if event is None:
+            await asyncio.sleep(BATCH_POLL_INTERVAL)  # Running in another worker
+        else:
+            try:
+                await asyncio.wait_for(event.wait(), BATCH_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+def ndjson_response(lines):
+    return StreamingResponse(lines, media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/chat/batch")
+@limiter.limit(BATCH_RATE_LIMIT)  # 5 batches per minute per client by default
+async def chat_batch(request: Request, batch: BatchChatQuery, stream: bool = False):
+    """Answer a list of queries as a background job.
+
+    Returns 202 with the job ID, to poll with GET /chat/batch/{job_id} or
+    stream with GET /chat/batch/{job_id}/results. With ?stream=true the
+    response is that NDJSON stream, after a first line with the job ID:
+    one line per query as it finishes, in completion order ("item" is its
+    index, "seq" a cursor), then the job status. The job carries on if the
+    client disconnects.
+    """
+    record_validation(request)
+    model = await client_model_preference(request)
+    await batch_gate.acquire()  # Raises AdmissionRejected (503) when BATCH_MAX_JOBS are running
+    try:
+        job_id = await job_store.acreate(len(batch.queries))
+    except Exception:
+        batch_gate.release()
+        raise
+    batch_progress[job_id] = asyncio.Event()
+    batch_tasks[job_id] = asyncio.create_task(
+        run_batch_job(job_id, batch.queries, model))
+    logger.info(f"Batch {job_id} started with {len(batch.queries)} queries")
+    started = {"job_id": job_id, "status": "running", "total": len(batch.queries),
+               "status_url": f"/chat/batch/{job_id}", "results_url": f"/chat/batch/{job_id}/results"}
+    if not stream:
+        return JSONResponse(status_code=202, content=started)
+
+    async def lines():
+        yield json.dumps(started) + "\n"
+        async for line in job_lines(job_id):
+            yield line
+    return ndjson_response(lines())
+
+@app.get("/chat/batch/{job_id}")
+async def chat_batch_status(job_id: str, after: int = 0, limit: int = 100):
+    """Job status and up to limit results after cursor after (pass back "cursor" to continue)"""
+    job = await job_store.aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown batch job")
+    rows = await job_store.aresults(job_id, after, min(max(limit, 1), 1000))
+    results = [dict(json.loads(result), seq=seq) for seq, result in rows]
+    return dict(job, results=results, cursor=rows[-1][0] if rows else after)
+
+@app.get("/chat/batch/{job_id}/results")
+async def chat_batch_results(job_id: str, after: int = 0):
+    """NDJSON stream of the job's results after cursor after, ending with its status once finished"""
+    if await job_store.aget(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown batch job")
+    return ndjson_response(job_lines(job_id, after))
+
 @app.get("/")
 async def root():
     return {"message": "Legal Assistant API is running!"}
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    # Generate request ID
-    request_id = str(uuid.uuid4())
-    
-    # Log request details
-    logger.info(f"Request {request_id}: {request.method} {request.url}")
-    logger.info(f"Client IP: {request.client.host}")
-    logger.info(f"Headers: {dict(request.headers)}")
-    
-    # Time the request
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    
-    # Log response details
-    logger.info(f"Request {request_id} completed in {process_time:.2f}s with status {response.status_code}")
-    
-    return response
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: models are loaded and warmed up"""
+    if is_ready():
+        return {"status": "ready"}
+    if STARTUP_MODE == "lazy" and load_task is None:
+        return {"status": "ready", "lazy": True}  # Models load on the first /chat
+    if load_task is not None and load_task.done() and not load_task.cancelled():
+        status = {"status": "failed", "error": str(load_task.exception())}
+    else:
+        status = {"status": "loading" if load_task is not None else "not_started"}
+    return JSONResponse(status_code=503, content=status)
+
+def collect_stats():
+    return {
+        "kanoon_http": ik_api.http.stats.as_dict(),
+        "kanoon_breaker": ik_api.http.breaker.state,
+        "search_cache": search_cache.as_dict() if search_cache else None,
+        "ner_batcher": ner_batcher.as_dict() if ner_batcher else None,
+        "ner_cache": ner_memo.as_dict() if ner_memo else None,
+        "response_cache": response_cache.as_dict() if response_cache else None,
+        "doc_cache": doc_cache.as_dict() if doc_cache else None,
+        "prompt_context": prompt_stats.as_dict(),
+        "local_index": dict(bm25_index.as_dict(), **local_index_stats.as_dict()) if bm25_index else None,
+        "llm_router": llm_router.as_dict() if llm_router else None,
+        "llm_admission": llm_gate.as_dict() if llm_gate else None,
+        "kanoon_admission": kanoon_gate.as_dict() if kanoon_gate else None,
+        "batch_jobs": batch_gate.as_dict(),
+    }
+
+@app.get("/stats")
+async def stats():
+    """Runtime counters for the upstream clients"""
+    return collect_stats()
+
+def stats_collector():
+    """Expose the numeric /stats counters (cache hits, ratios, pool reuse, ...) on /metrics"""
+    families = []
+    for section, values in collect_stats().items():
+        if isinstance(values, str):
+            families.append((f"legalist_{section}", "gauge", f"{section} state",
+                             [({"state": values}, 1)]))
+            continue
+        for key, value in (values or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                families.append((f"legalist_{section}_{key}", "untyped", f"{section} {key}", [({}, value)]))
+    return families
+
+REGISTRY.add_collector(stats_collector)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the latency histograms, gauges and /stats counters.
+
+    With METRICS_MULTIPROC_DIR set, summed over the container's workers
+    (the /stats families get a pid label, one sample per live worker).
+    """
+    text = await metrics_store.arender() if metrics_store else REGISTRY.render()
+    return PlainTextResponse(text, media_type=CONTENT_TYPE)
+
+class RequestLogMiddleware:
+    """Request ID, timing, metrics and one access log line per request.
+
+    A plain ASGI middleware rather than @app.middleware("http"): the
+    BaseHTTPMiddleware behind that decorator runs every request in an extra
+    task with its own body/response streams, which cost more per request
+    than the logging itself. Timing here also covers the whole body of
+    streamed responses.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Generate request ID
+        request_id = str(uuid.uuid4())
+        start_request(request_id, LOG_SAMPLE_RATE)
+        stage_spans_var.set({})
+        scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        if LOG_HEADERS:
+            logger.debug("Headers: %s", redact_headers(Headers(scope=scope)))
+
+        status = 500
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if TRACE_IDS:
+                    message.setdefault("headers", []).append((b"x-request-id", request_id.encode()))
+            await send(message)
+
+        # Time the request
+        start_time = time.time()
+        try:
+            with HTTP_IN_FLIGHT.track_inprogress():
+                await self.app(scope, receive, send_with_request_id)
+        finally:
+            process_time = time.time() - start_time
+            HTTP_SECONDS.observe(process_time, scope["method"], route_path(scope), status)
+            # One access line per request: server errors always, the rest subject to sampling
+            client = scope.get("client")
+            logger.log(
+                logging.ERROR if status >= 500 else logging.INFO,
+                "%s %s %d in %.3fs", scope["method"], scope["path"], status, process_time,
+                extra={"fields": {"method": scope["method"], "path": scope["path"], "status": status,
+                                  "duration_ms": round(process_time * 1000, 1),
+                                  "client": client[0] if client else None}},
+            )
+
+app.add_middleware(RequestLogMiddleware)
+
+route_paths = {}
+
+def route_path(scope):
+    """Route template for the metrics label (raw paths would explode its cardinality)"""
+    if not route_paths:
+        # /chat and /chat/ share an endpoint; the last-registered (/chat) wins
+        for route in reversed(app.routes):
+            route_paths.setdefault(getattr(route, "endpoint", None), getattr(route, "path", None))
+    return route_paths.get(scope.get("endpoint")) or "unmatched"
 
 if __name__ == "__main__":
     import argparse
     import uvicorn
     parser = get_arg_parser()
     args = parser.parse_args()
-    file_storage = FileStorage(args.datadir)
+    file_storage = make_storage(args.datadir)
     ik_api = IKApi(args, file_storage)
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
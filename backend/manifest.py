@@ -0,0 +1,175 @@
+# manifest.py
+# Index of every doc the downloader has saved: docid -> docsize, content hash,
+# path and fetch time. Lookups are answered from an in-memory dict loaded once
+# from SQLite, so the crawler never stats or globs the data directory.
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger('ikapi.manifest')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    docid INTEGER PRIMARY KEY,
+    docsize INTEGER,
+    sha1 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    origpath TEXT,
+    docsource TEXT,
+    publishdate TEXT,
+    fetched_at REAL NOT NULL
+)
+'''
+
+COLUMNS = ('docid', 'docsize', 'sha1', 'path', 'origpath', 'docsource', 'publishdate', 'fetched_at')
+# <docid>.json, or <docid>_original.<ext> (as '<docid>_original' in a PackedStorage's originals)
+DOC_FILE = re.compile(r'(\d+)(_original\.\w+|_original|\.json)$')
+INSERT = 'INSERT OR REPLACE INTO docs (%s) VALUES (%s)' % (', '.join(COLUMNS), ', '.join('?' * len(COLUMNS)))
+
+class Manifest:
+    """SQLite-backed docid index shared by the downloader's worker processes.
+
+    Each process opens its own connection (WAL mode, so workers can write
+    while others read). The in-memory index is loaded on first use; workers
+    forked afterwards inherit it and keep it current for their own writes.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.pid = None
+        self.conn = None
+        self.index = None
+
+    def connect(self):
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.filepath, timeout=30.0, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute(SCHEMA)
+            self.pid = os.getpid()
+        return self.conn
+
+    def load(self):
+        if self.index is None:
+            rows = self.connect().execute('SELECT %s FROM docs' % ', '.join(COLUMNS))
+            self.index = {row[0]: dict(zip(COLUMNS, row)) for row in rows}
+            logger.info('Loaded manifest with %d docs from %s', len(self.index), self.filepath)
+        return self.index
+
+    def get(self, docid):
+        return self.load().get(docid)
+
+    def __contains__(self, docid):
+        return docid in self.load()
+
+    def __len__(self):
+        return len(self.load())
+
+    def is_current(self, docid, docsize=None):
+        """True if docid is saved and, when docsize is known, has not changed size"""
+        entry = self.get(docid)
+        if entry is None:
+            return False
+        return docsize is None or entry['docsize'] is None or entry['docsize'] == docsize
+
+    def record(self, docid, content, path, docsize=None, docsource=None, publishdate=None):
+        """Record a saved doc; returns True if its content differs from the previous fetch"""
+        entry = {
+            'docid': docid,
+            'docsize': docsize,
+            'sha1': hashlib.sha1(content.encode('utf8')).hexdigest(),
+            'path': path,
+            'origpath': None,
+            'docsource': docsource,
+            'publishdate': publishdate,
+            'fetched_at': time.time(),
+        }
+        previous = self.get(docid)
+        if previous is not None:
+            entry['origpath'] = previous['origpath']
+
+        self.connect().execute(INSERT, [entry[c] for c in COLUMNS])
+        self.index[docid] = entry
+        return previous is None or previous['sha1'] != entry['sha1']
+
+    def record_original(self, docid, origpath):
+        self.connect().execute('UPDATE docs SET origpath = ? WHERE docid = ?', (origpath, docid))
+        if docid in self.load():
+            self.index[docid]['origpath'] = origpath
+
+    def fetched_since(self, timestamp):
+        row = self.connect().execute('SELECT COUNT(*) FROM docs WHERE fetched_at >= ?', (timestamp,)).fetchone()
+        return row[0]
+
+    def rebuild(self, datadir, storage=None):
+        """Index docs already saved under datadir, e.g. by a crawl that predates the manifest.
+
+        This is the one full walk of the tree, or of the index of a
+        PackedStorage passed as storage; later runs only use the manifest.
+        """
+        if storage is not None and hasattr(storage, 'iter_docs'):
+            docs, origs = self.packed_docs(storage)
+        else:
+            docs, origs = self.walk_docs(datadir)
+
+        conn = self.connect()
+        conn.execute('BEGIN')
+        for docid, path, content, mtime in docs:
+            try:
+                docsize = json.loads(content).get('docsize')
+            except ValueError:
+                logger.warning('Skipping unreadable doc %s', path)
+                continue
+            conn.execute(INSERT, (docid, docsize, hashlib.sha1(content.encode('utf8')).hexdigest(), path,
+                 origs.get(docid), None, None, mtime))
+        conn.execute('COMMIT')
+
+        self.index = None
+        logger.warning('Rebuilt manifest: %d docs under %s', len(self.load()), datadir)
+
+    @staticmethod
+    def walk_docs(datadir):
+        """(docid, path, content, mtime) of each doc file under datadir, and docid -> original path"""
+        origs = {}
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(datadir):
+            if dirpath == datadir:
+                dirnames[:] = [name for name in dirnames if name != 'search']
+            for name in filenames:
+                m = DOC_FILE.match(name)
+                if not m:
+                    continue
+                docid = int(m.group(1))
+                path = os.path.join(dirpath, name)
+                if m.group(2) == '.json':
+                    paths.append((docid, path))
+                else:
+                    origs[docid] = os.path.join(dirpath, '%d_original' % docid)
+
+        def docs():
+            for docid, path in paths:
+                with open(path, encoding='utf8') as f:
+                    yield docid, path, f.read(), os.path.getmtime(path)
+        return docs(), origs
+
+    @staticmethod
+    def packed_docs(storage):
+        """walk_docs() for a PackedStorage, from its index instead of the directory tree"""
+        storage.refresh()
+        with storage.lock:
+            originals = list(storage.originals)
+        origs = {}
+        for key in originals:
+            m = DOC_FILE.match(key.rsplit('/', 1)[-1])
+            if m:
+                origs[int(m.group(1))] = os.path.join(storage.datadir, key)
+
+        def docs():
+            for path, mtime in storage.iter_doc_files():
+                m = DOC_FILE.match(os.path.basename(path))
+                if m and m.group(2) == '.json':
+                    yield int(m.group(1)), path, storage.read(path), mtime
+        return docs(), origs
@@ -0,0 +1,286 @@
+# metrics.py
+# Minimal Prometheus-style metrics (counters, gauges, histograms) rendered in
+# the text exposition format, so /metrics needs no client library.
+#
+# Each worker process has its own registry. With several workers a
+# MultiprocessStore has each one write snapshots to a shared directory and
+# renders their sum, so a scrape sees the whole container whichever worker
+# answers it.
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans NER micro-batches up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return '%d' % value
+    return repr(float(value))
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = ('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for k, v in pairs)
+    return '{%s}' % ','.join(escaped)
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}  # label values tuple -> value
+        (registry or REGISTRY).register(self)
+
+    def key(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError('%s expects labels %s' % (self.name, self.labelnames))
+        return tuple(str(v) for v in labelvalues)
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.TYPE)]
+
+    def items(self):
+        """[(label values, value)], copied under the lock"""
+        with self.lock:
+            return list(self.values.items())
+
+    @staticmethod
+    def add(total, value):
+        return value if total is None else total + value
+
+    def render(self, values=None):
+        items = sorted(self.items() if values is None else values.items())
+        return self.header() + ['%s%s %s' % (self.name, format_labels(self.labelnames, k), format_value(v))
+                                for k, v in items]
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        key = self.key(labelvalues)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value, *labelvalues):
+        key = self.key(labelvalues)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, *labelvalues, amount=1):
+        key = self.key(labelvalues)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    @contextmanager
+    def track_inprogress(self, *labelvalues):
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labelvalues):
+        key = self.key(labelvalues)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, sum
+                state = self.values[key] = [[0] * len(self.buckets), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def items(self):
+        with self.lock:
+            return [(k, [list(v[0]), v[1]]) for k, v in self.values.items()]
+
+    @staticmethod
+    def add(total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def render(self, values=None):
+        items = sorted(self.items() if values is None else values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    self.name, format_labels(self.labelnames, key, [('le', format_value(bound))]), cumulative))
+            labels = format_labels(self.labelnames, key)
+            lines.append('%s_sum%s %s' % (self.name, labels, format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collect):
+        """collect() returns [(name, type, documentation, [(labels dict, value)])], read at scrape time"""
+        self.collectors.append(collect)
+
+    def collect(self):
+        return [family for collect in self.collectors for family in collect()]
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        render_families(lines, self.collect())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def render_families(lines, families):
+    for name, kind, documentation, samples in families:
+        lines.append('# HELP %s %s' % (name, documentation))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in samples:
+            lines.append('%s%s %s' % (name, format_labels(labels.keys(), labels.values()),
+                                      format_value(value)))
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MultiprocessStore:
+    """Metrics summed over the worker processes sharing dirpath.
+
+    Each process writes a snapshot of its registry to <dirpath>/<pid>.json
+    every interval seconds (run() is a task in each worker) and when it
+    stops; render() writes a fresh one for the calling process and merges
+    them all. Counters and histograms of exited workers still count,
+    so the totals do not go backwards; gauges and the collectors' samples
+    only come from live workers, the latter labelled with their pid as they
+    are per-process states and ratios that do not add up. dirpath should be
+    emptied when the server starts (gunicorn.conf.py does).
+    """
+    def __init__(self, registry, dirpath, interval=5.0, pid=None):
+        self.registry = registry
+        self.dirpath = dirpath
+        self.interval = interval
+        self.pid = pid
+        os.makedirs(dirpath, exist_ok=True)
+
+    def path(self):
+        return os.path.join(self.dirpath, '%d.json' % (self.pid or os.getpid()))
+
+    def snapshot(self):
+        """This process's values; the collectors may only be safe to call from the event loop"""
+        return {
+            'metrics': {metric.name: [[list(k), v] for k, v in metric.items()] for metric in self.registry.metrics},
+            'collected': self.registry.collect(),
+        }
+
+    def write(self, snapshot):
+        path = self.path()
+        tmppath = path + '.tmp'
+        with open(tmppath, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmppath, path)
+
+    def load(self):
+        """[(pid, alive, snapshot)] of every process's last snapshot"""
+        snapshots = []
+        for name in os.listdir(self.dirpath):
+            if not name.endswith('.json'):
+                continue
+            pid = int(name[:-len('.json')])
+            try:
+                with open(os.path.join(self.dirpath, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning('Skipping metrics snapshot %s: %s', name, e)
+                continue
+            snapshots.append((pid, pid == (self.pid or os.getpid()) or pid_alive(pid), snapshot))
+        return snapshots
+
+    def render(self, snapshot=None):
+        """Write snapshot (default: a fresh one) for this process, then render the merged metrics"""
+        self.write(self.snapshot() if snapshot is None else snapshot)
+        snapshots = self.load()
+        lines = []
+        for metric in self.registry.metrics:
+            merged = {}
+            for pid, alive, snapshot in snapshots:
+                if isinstance(metric, Gauge) and not alive:
+                    continue
+                for key, value in snapshot['metrics'].get(metric.name, []):
+                    key = tuple(key)
+                    merged[key] = metric.add(merged.get(key), value)
+            lines.extend(metric.render(merged))
+
+        families = {}
+        for pid, alive, snapshot in sorted(snapshots, key=lambda item: item[0]):
+            if not alive:
+                continue
+            for name, kind, documentation, samples in snapshot['collected']:
+                family = families.setdefault(name, (name, kind, documentation, []))
+                family[3].extend((dict(labels, pid=str(pid)), value) for labels, value in samples)
+        render_families(lines, families.values())
+        return '\n'.join(lines) + '\n'
+
+    async def arender(self):
+        """render(), with the file work on the default executor"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.render, self.snapshot())
+
+    async def run(self):
+        """Write a snapshot every interval seconds; run as a task in each worker"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.write, self.snapshot())
+            except Exception as e:
+                logger.warning('Could not write metrics snapshot: %s', e)
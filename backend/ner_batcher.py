@@ -0,0 +1,106 @@
+# ner_batcher.py
+# Dynamic micro-batching for NER inference. Concurrent callers submit single
+# texts; a collector task groups them into batches and runs one forward pass
+# per batch on the inference executor.
+import asyncio
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+class NERBatcher:
+    """Collect concurrent NER requests into batches of up to max_batch_size.
+
+    A batch is dispatched as soon as it is full or max_wait_ms after its
+    first request arrived, whichever comes first. Up to max_inflight batches
+    run on the executor at the same time.
+    """
+    def __init__(self, model, tokenizer, executor, max_batch_size=16, max_wait_ms=5.0,
+                 max_inflight=1, infer=None):
+        if infer is None:
+            from legal_ner import extract_ner_entities_batch as infer
+        self.model = model
+        self.tokenizer = tokenizer
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.infer = infer
+        self.max_inflight = max_inflight
+        self.pending = None
+        self.arrived = None
+        self.full = None
+        self.collector = None
+        self.inflight = None
+        self.tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        self.pending = collections.deque()
+        self.arrived = asyncio.Event()
+        self.full = asyncio.Event()
+        self.inflight = asyncio.Semaphore(self.max_inflight)
+        self.collector = asyncio.create_task(self.collect())
+
+    async def stop(self):
+        if self.collector is not None:
+            self.collector.cancel()
+            try:
+                await self.collector
+            except asyncio.CancelledError:
+                pass
+            self.collector = None
+
+    async def submit(self, text):
+        """Queue one text and wait for its entities (None if inference failed)"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((text, future))
+        self.arrived.set()
+        if len(self.pending) >= self.max_batch_size:
+            self.full.set()
+        return await future
+
+    async def collect(self):
+        while True:
+            await self.arrived.wait()
+            if len(self.pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            # Requests keep accumulating while every inference slot is busy
+            await self.inflight.acquire()
+            size = min(len(self.pending), self.max_batch_size)
+            batch = [self.pending.popleft() for _ in range(size)]
+            if not self.pending:
+                self.arrived.clear()
+            if len(self.pending) < self.max_batch_size:
+                self.full.clear()
+            task = asyncio.create_task(self.run_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.infer, texts, self.model, self.tokenizer)
+        except Exception as e:
+            logger.error(f"NER batch of {len(batch)} failed: {str(e)}")
+            results = [None for _ in batch]
+        finally:
+            self.inflight.release()
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), entities in zip(batch, results):
+            if not future.done():
+                future.set_result(entities)
+
+    def as_dict(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": len(self.pending) if self.pending else 0,
+        }
@@ -0,0 +1,333 @@
+# packed_storage.py
+# Drop-in alternative to FileStorage that appends every saved file to large
+# zlib-compressed segment files instead of creating one small file (and up to
+# three directories) per document.
+#
+# Layout under datadir:
+#   segments/00000001.seg   records: header, key, compressed payload
+#   index.tsv               key, segment, offset, length, flags, mtime per record
+#
+# Paths passed to save_json/read/exists are mapped to keys relative to
+# datadir, so callers written against FileStorage's directory layout keep
+# working unchanged.
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from ik_download import NON_DOC_DIRS, get_dateobj, search_dirname
+
+logger = logging.getLogger('ikapi.packed')
+
+# key length, payload length, crc32 of payload, flags
+RECORD = struct.Struct('<IIIB')
+
+FLAG_COMPRESSED = 1
+FLAG_BINARY = 2
+FLAG_DELETED = 4
+
+class PackedStorage:
+    """Append-only segment store with an offset index and mmap reads.
+
+    Safe for concurrent writers in several processes (appends are serialized
+    with flock on a lock file) and threads. Overwriting or removing a key
+    leaves the old record behind until compact() is run, offline, so this is
+    for the write-once doc corpus; the search cache stays on FileStorage.
+    """
+    def __init__(self, datadir, segment_size=256 * 1024 * 1024, compresslevel=3):
+        self.datadir = datadir
+        self.segment_size = segment_size
+        self.compresslevel = compresslevel
+        self.segdir = os.path.join(datadir, 'segments')
+        os.makedirs(self.segdir, exist_ok=True)
+        self.indexpath = os.path.join(datadir, 'index.tsv')
+        self.lockpath = os.path.join(datadir, '.packed.lock')
+
+        self.lock = threading.RLock()
+        self.index = {}       # key -> (segment, offset, length, flags, mtime)
+        self.originals = {}   # '<docpath>/<docid>_original' -> key
+        self.index_pos = 0
+        self.maps = {}        # segment -> mmap
+        self.pid = None
+        self.segment = None
+        self.segment_file = None
+        self.index_file = None
+        self.lock_file = None
+        self.refresh()
+
+    # --- Index ---
+
+    def refresh(self):
+        """Apply index lines appended since the last call, including other processes' writes"""
+        with self.lock:
+            if not os.path.exists(self.indexpath):
+                return
+            with open(self.indexpath, 'rb') as f:
+                f.seek(self.index_pos)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Half-written line; picked up on the next refresh
+                        break
+                    self.index_pos += len(line)
+                    try:
+                        key, segment, offset, length, flags, mtime = line.decode('utf8').rstrip('\n').split('\t')
+                        self.apply(key, int(segment), int(offset), int(length), int(flags), float(mtime))
+                    except ValueError:
+                        logger.warning('Skipping malformed index line in %s', self.indexpath)
+
+    def apply(self, key, segment, offset, length, flags, mtime):
+        if flags & FLAG_DELETED:
+            self.index.pop(key, None)
+        else:
+            self.index[key] = (segment, offset, length, flags, mtime)
+
+        base, sep, ext = key.rpartition('_original.')
+        if sep:
+            if flags & FLAG_DELETED:
+                self.originals.pop(base + '_original', None)
+            else:
+                self.originals[base + '_original'] = key
+
+    def get_key(self, filepath):
+        key = os.path.relpath(filepath, self.datadir)
+        if key.startswith('..'):
+            raise ValueError('%s is outside %s' % (filepath, self.datadir))
+        return key.replace(os.sep, '/')
+
+    def lookup(self, filepath):
+        key = self.get_key(filepath)
+        entry = self.index.get(key)
+        if entry is None:
+            self.refresh()
+            entry = self.index.get(key)
+        return key, entry
+
+    # --- Writes ---
+
+    def segment_path(self, segment):
+        return os.path.join(self.segdir, '%08d.seg' % segment)
+
+    def open_files(self):
+        if self.pid != os.getpid():
+            # Forked workers must not share file offsets with the parent
+            self.segment = None
+            self.segment_file = None
+            self.maps = {}
+            self.index_file = open(self.indexpath, 'ab')
+            self.lock_file = open(self.lockpath, 'a')
+            self.pid = os.getpid()
+
+        if self.segment_file is None or self.segment_file.tell() >= self.segment_size:
+            segments = [int(name[:-4]) for name in os.listdir(self.segdir) if name.endswith('.seg')]
+            segment = max(segments, default=1)
+            if os.path.exists(self.segment_path(segment)) and \
+                    os.path.getsize(self.segment_path(segment)) >= self.segment_size:
+                segment += 1
+            if self.segment_file is not None:
+                self.segment_file.close()
+            self.segment = segment
+            self.segment_file = open(self.segment_path(segment), 'ab')
+
+    def append(self, key, data, flags):
+        payload = data
+        if not flags & FLAG_DELETED:
+            compressed = zlib.compress(data, self.compresslevel)
+            if len(compressed) < len(data):
+                payload = compressed
+                flags |= FLAG_COMPRESSED
+        keyb = key.encode('utf8')
+        record = RECORD.pack(len(keyb), len(payload), zlib.crc32(payload), flags) + keyb + payload
+
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open_files()
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            try:
+                self.open_files()
+                self.segment_file.seek(0, os.SEEK_END)
+                offset = self.segment_file.tell() + RECORD.size + len(keyb)
+                self.segment_file.write(record)
+                self.segment_file.flush()
+                mtime = time.time()
+                self.index_file.write(('%s\t%d\t%d\t%d\t%d\t%f\n' % (
+                    key, self.segment, offset, len(payload), flags, mtime)).encode('utf8'))
+                self.index_file.flush()
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.apply(key, self.segment, offset, len(payload), flags, mtime)
+        return True
+
+    def save_json(self, results, filepath):
+        return self.append(self.get_key(filepath), results.encode('utf8'), 0)
+
+    def save_binary(self, content, filepath):
+        return self.append(self.get_key(filepath), content, FLAG_BINARY)
+
+    def remove(self, filepath):
+        key, entry = self.lookup(filepath)
+        if entry is not None:
+            self.append(key, b'', FLAG_DELETED)
+
+    # --- Reads ---
+
+    def get_map(self, segment, end):
+        with self.lock:
+            mm = self.maps.get(segment)
+            if mm is None or len(mm) < end:
+                # Segment grew since it was mapped (or was never mapped)
+                if mm is not None:
+                    mm.close()
+                with open(self.segment_path(segment), 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment] = mm
+            return mm
+
+    def read_entry(self, entry):
+        segment, offset, length, flags, mtime = entry
+        with self.lock:
+            # Under the lock so a concurrent remap cannot close the map mid-read
+            payload = self.get_map(segment, offset + length)[offset:offset + length]
+        return zlib.decompress(payload) if flags & FLAG_COMPRESSED else payload
+
+    def read_binary(self, filepath):
+        key, entry = self.lookup(filepath)
+        if entry is None:
+            raise FileNotFoundError(filepath)
+        return self.read_entry(entry)
+
+    def read(self, filepath):
+        return self.read_binary(filepath).decode('utf8')
+
+    def exists(self, filepath):
+        return self.lookup(filepath)[1] is not None
+
+    def exists_original(self, origpath):
+        key = self.get_key(origpath)
+        if key not in self.originals:
+            self.refresh()
+        if key in self.originals:
+            return [os.path.join(self.datadir, self.originals[key])]
+        return []
+
+    def listdir(self, dirpath):
+        """[(name, mtime)] of the entries saved directly under dirpath"""
+        self.refresh()
+        prefix = self.get_key(dirpath) + '/'
+        with self.lock:
+            return [(key[len(prefix):], entry[4]) for key, entry in self.index.items()
+                    if key.startswith(prefix) and '/' not in key[len(prefix):]]
+
+    def iter_doc_files(self, since=0.0):
+        """Yield (path, mtime) of saved doc JSON entries written at or after since"""
+        self.refresh()
+        with self.lock:
+            entries = [(key, entry[4]) for key, entry in self.index.items()
+                       if key.endswith('.json') and entry[4] >= since]
+        for key, mtime in entries:
+            name = key.rsplit('/', 1)[-1]
+            if key.split('/', 1)[0] not in NON_DOC_DIRS and not name.startswith('docfragment_'):
+                yield os.path.join(self.datadir, key), mtime
+
+    def iter_records(self, prefix=''):
+        """Stream (key, content bytes) for every live entry, in write order, without the mmap cache"""
+        self.refresh()
+        segments = sorted(int(name[:-4]) for name in os.listdir(self.segdir) if name.endswith('.seg'))
+        for segment in segments:
+            with open(self.segment_path(segment), 'rb') as f:
+                while True:
+                    header = f.read(RECORD.size)
+                    if len(header) < RECORD.size:
+                        break
+                    keylen, length, crc, flags = RECORD.unpack(header)
+                    key = f.read(keylen).decode('utf8')
+                    offset = f.tell()
+                    payload = f.read(length)
+                    if len(payload) < length:
+                        break
+                    entry = self.index.get(key)
+                    # Skip superseded and deleted records
+                    if entry is None or entry[0] != segment or entry[1] != offset:
+                        continue
+                    if prefix and not key.startswith(prefix):
+                        continue
+                    yield key, zlib.decompress(payload) if flags & FLAG_COMPRESSED else payload
+
+    def iter_docs(self, prefix=''):
+        """Stream (key, json text) for every saved JSON entry"""
+        for key, content in self.iter_records(prefix):
+            if key.endswith('.json'):
+                yield key, content.decode('utf8')
+
+    # --- FileStorage layout ---
+    # Same paths as FileStorage, but nothing is created on disk.
+
+    def make_dir(self, dirpath):
+        pass
+
+    def get_docpath(self, docsource, publishdate):
+        d = get_dateobj(publishdate)
+        return os.path.join(self.datadir, docsource, '%d' % d.year, '%s' % d)
+
+    def get_json_orig_path(self, docpath, docid):
+        jsonpath = os.path.join(docpath, '%d.json' % docid)
+        origpath = os.path.join(docpath, '%d_original' % docid)
+        return jsonpath, origpath
+
+    def get_search_path(self, q):
+        return os.path.join(self.datadir, 'search', search_dirname(q))
+
+    # --- Maintenance ---
+
+    def compact(self):
+        """Rewrite live records into fresh segments and drop the garbage.
+
+        Must not run while other processes are writing to this datadir.
+        """
+        with self.lock:
+            self.refresh()
+            tmpdir = os.path.join(self.datadir, '.compact')
+            os.makedirs(tmpdir, exist_ok=True)
+            fresh = PackedStorage(tmpdir, self.segment_size, self.compresslevel)
+            for key, entry in sorted(self.index.items(), key=lambda item: item[1][:2]):
+                fresh.append(key, self.read_entry(entry), entry[3] & FLAG_BINARY)
+            fresh.close()
+            self.close()
+
+            for name in os.listdir(self.segdir):
+                os.remove(os.path.join(self.segdir, name))
+            for name in os.listdir(fresh.segdir):
+                os.replace(os.path.join(fresh.segdir, name), os.path.join(self.segdir, name))
+            os.replace(fresh.indexpath, self.indexpath)
+            os.rmdir(fresh.segdir)
+            for name in os.listdir(tmpdir):
+                os.remove(os.path.join(tmpdir, name))
+            os.rmdir(tmpdir)
+
+            self.index = {}
+            self.originals = {}
+            self.index_pos = 0
+            self.refresh()
+            logger.warning('Compacted %s: %d live entries', self.datadir, len(self.index))
+
+    def disk_usage(self):
+        return sum(os.path.getsize(os.path.join(self.segdir, name)) for name in os.listdir(self.segdir)) + \
+            (os.path.getsize(self.indexpath) if os.path.exists(self.indexpath) else 0)
+
+    def close(self):
+        with self.lock:
+            for mm in self.maps.values():
+                mm.close()
+            self.maps = {}
+            if self.segment_file is not None:
+                self.segment_file.close()
+            if self.index_file is not None:
+                self.index_file.close()
+                self.lock_file.close()
+            self.segment_file = None
+            self.index_file = None
+            self.lock_file = None
+            self.pid = None
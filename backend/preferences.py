@@ -0,0 +1,108 @@
+# preferences.py
+# Per-client settings (currently the preferred LLM provider), kept in a store
+# shared by every API worker process: a SQLite file on the host, or Redis
+# (or anything speaking its protocol) when PREFERENCE_STORE is a redis:// URL.
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "legalist_session"
+SESSION_RE = re.compile(r'^[0-9a-f]{32}$')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS preferences (
+    client TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (client, name)
+)
+'''
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+def client_key(api_key=None, session_id=None):
+    """Store key for a client: its API key (hashed, never stored as is) or its session ID"""
+    if api_key:
+        return 'key:' + hashlib.sha256(api_key.encode('utf8')).hexdigest()[:32]
+    if session_id and SESSION_RE.match(session_id):
+        return 'session:' + session_id
+    return None
+
+class SQLitePreferenceStore:
+    """Preferences in a SQLite file, one connection per process (WAL mode).
+
+    Entries not updated for ttl seconds are ignored and pruned on write.
+    """
+    def __init__(self, filepath, ttl=365 * 86400):
+        self.filepath = filepath
+        self.ttl = ttl
+        self.pid = None
+        self.conn = None
+
+    def connect(self):
+        # Connections must not be shared with a forked parent process
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.filepath, timeout=5.0, isolation_level=None,
+                                        check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute(SCHEMA)
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, client, name):
+        row = self.connect().execute(
+            'SELECT value FROM preferences WHERE client = ? AND name = ? AND updated_at > ?',
+            (client, name, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def set(self, client, name, value):
+        conn = self.connect()
+        conn.execute('INSERT OR REPLACE INTO preferences (client, name, value, updated_at) VALUES (?, ?, ?, ?)',
+                     (client, name, value, time.time()))
+        conn.execute('DELETE FROM preferences WHERE updated_at <= ?', (time.time() - self.ttl,))
+
+    def close(self):
+        if self.conn is not None and self.pid == os.getpid():
+            self.conn.close()
+        self.conn = None
+        self.pid = None
+
+class RedisPreferenceStore:
+    """Preferences as Redis hashes (one per client) that expire ttl seconds after the last write"""
+    def __init__(self, url, ttl=365 * 86400):
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1.0)
+        self.ttl = int(ttl)
+
+    def get(self, client, name):
+        return self.client.hget('legalist:prefs:' + client, name)
+
+    def set(self, client, name, value):
+        key = 'legalist:prefs:' + client
+        with self.client.pipeline() as pipe:
+            pipe.hset(key, name, value)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+
+    def close(self):
+        self.client.close()
+
+def open_store(spec, ttl=365 * 86400):
+    """redis://... or rediss://... URL, otherwise a SQLite file path"""
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        store = RedisPreferenceStore(spec, ttl)
+    else:
+        if os.path.dirname(spec):
+            os.makedirs(os.path.dirname(spec), exist_ok=True)
+        store = SQLitePreferenceStore(spec, ttl)
+    logger.info('Preference store: %s', spec.split('@')[-1])
+    return store
@@ -0,0 +1,150 @@
+# response_cache.py
+# Cache of LLM answers keyed on the normalized query, the extracted entity set
+# and a fingerprint of the Indian Kanoon results the answer was generated from.
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+
+from cache import CacheStats, TTLCache
+
+def normalize_text(text):
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+def fingerprint(obj):
+    """Stable hash of a JSON-serializable object"""
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf8')).hexdigest()
+
+def hashed_ngram_embedding(text, dim=512, n=3):
+    """Cheap local embedding: L2-normalized hashed character n-gram counts"""
+    import numpy as np
+
+    text = ' %s ' % normalize_text(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    for i in range(len(text) - n + 1):
+        vector[zlib.crc32(text[i:i + n].encode('utf8')) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+NEGATION_WORDS = frozenset(('not', 'no', 'nor', 'never', 'without', 'cannot', 'neither', 'none',
+                            'non', 'refused', 'denied', 'rejected', 'dismissed'))
+
+def negations(text):
+    """Negating words of a query; paraphrases must agree on them"""
+    # normalize_text turns "wasn't" into "wasn t"
+    text = re.sub(r'n t\b', ' not', normalize_text(text))
+    return NEGATION_WORDS.intersection(text.split())
+
+class ResponseCache:
+    """LRU/TTL cache of LLM answers.
+
+    An answer is reused only when the entity set and the Kanoon results
+    fingerprint match exactly. Within that context the query must match after
+    normalization, or, when similarity_threshold is set (it is off by
+    default), be a paraphrase whose embedding cosine similarity reaches the
+    threshold and that has the same negating words ("not", "denied", ...).
+    """
+    STATS_FIELDS = ('exact_hits', 'semantic_hits', 'misses', 'writes')
+
+    def __init__(self, maxsize=2048, ttl=86400.0, similarity_threshold=0.0,
+                 embed=hashed_ngram_embedding):
+        self.entries = TTLCache(maxsize, ttl)
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.stats = CacheStats(self.STATS_FIELDS)
+        # context key -> {entry key: query embedding}
+        self.index = {}
+        self.puts_since_prune = 0
+        self.lock = threading.Lock()
+
+    def context_key(self, entities, kanoon_results):
+        entity_set = sorted({normalize_text(e) for e in entities})
+        return fingerprint([entity_set, fingerprint(kanoon_results)])
+
+    def get(self, query, entities, kanoon_results):
+        """Return (answer, provenance) or None"""
+        context = self.context_key(entities, kanoon_results)
+        key = (context, normalize_text(query))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.stats.incr('exact_hits')
+            return entry['answer'], dict(entry['provenance'], match='exact')
+
+        if self.similarity_threshold:
+            match = self.semantic_lookup(context, query)
+            if match is not None:
+                entry, similarity = match
+                self.stats.incr('semantic_hits')
+                return entry['answer'], dict(entry['provenance'], match='semantic',
+                                             similarity=round(similarity, 4))
+
+        self.stats.incr('misses')
+        return None
+
+    def semantic_lookup(self, context, query):
+        with self.lock:
+            candidates = list(self.index.get(context, {}).items())
+        if not candidates:
+            return None
+
+        vector = self.embed(query)
+        negated = negations(query)
+        best_key, best_similarity = None, -1.0
+        for key, candidate in candidates:
+            if negations(key[1]) != negated:
+                continue
+            similarity = float(vector @ candidate)
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        if best_similarity < self.similarity_threshold:
+            return None
+
+        entry = self.entries.get(best_key)
+        if entry is None:
+            # Evicted or expired from the LRU; drop it from the index too
+            with self.lock:
+                self.index.get(context, {}).pop(best_key, None)
+            return None
+        return entry, best_similarity
+
+    def put(self, query, entities, kanoon_results, answer, model_used):
+        context = self.context_key(entities, kanoon_results)
+        key = (context, normalize_text(query))
+        provenance = {
+            'query': query,
+            'model_used': model_used,
+            'created_at': time.time(),
+            'kanoon_fingerprint': fingerprint(kanoon_results),
+        }
+        self.entries.put(key, {'answer': answer, 'provenance': provenance})
+        self.stats.incr('writes')
+
+        if self.similarity_threshold:
+            vector = self.embed(query)
+            with self.lock:
+                self.index.setdefault(context, {})[key] = vector
+                self.puts_since_prune += 1
+                if self.puts_since_prune >= self.entries.maxsize:
+                    self.prune_index()
+                    self.puts_since_prune = 0
+
+    def prune_index(self):
+        """Drop index entries whose answers are no longer cached (lock held)"""
+        live = set(self.entries.data)
+        for context in list(self.index):
+            keys = self.index[context]
+            for key in [k for k in keys if k not in live]:
+                del keys[key]
+            if not keys:
+                del self.index[context]
+
+    def as_dict(self):
+        stats = self.stats.as_dict()
+        lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        stats['evictions'] = self.entries.stats.as_dict()['evictions']
+        stats['entries'] = len(self.entries)
+        return stats
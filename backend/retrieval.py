@@ -0,0 +1,98 @@
+# retrieval.py
+# Multi-query Indian Kanoon retrieval: several sub-queries are searched
+# concurrently and their hits merged by tid with reciprocal rank fusion.
+import asyncio
+import itertools
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def build_subqueries(entities, max_subqueries=6):
+    """Full entity string first, then each entity, then entity pairs"""
+    unique = []
+    seen = set()
+    for entity in entities:
+        if entity.lower() not in seen:
+            seen.add(entity.lower())
+            unique.append(entity)
+
+    candidates = [" ".join(unique)] + unique + [" ".join(pair) for pair in itertools.combinations(unique, 2)]
+    subqueries = []
+    for q in candidates:
+        if q and q not in subqueries:
+            subqueries.append(q)
+    return subqueries[:max_subqueries]
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """Merge {subquery: [doc, ...]} into one list ordered by sum(1 / (k + rank))"""
+    scores = {}
+    merged = {}
+    for subquery, docs in ranked_lists.items():
+        for rank, doc in enumerate(docs):
+            tid = doc.get('tid')
+            if tid is None:
+                continue
+            scores[tid] = scores.get(tid, 0.0) + 1.0 / (k + rank + 1)
+            if tid not in merged:
+                merged[tid] = dict(doc, matched_queries=[])
+            merged[tid]['matched_queries'].append(subquery)
+
+    ordered = sorted(merged, key=lambda tid: scores[tid], reverse=True)
+    return [dict(merged[tid], rrf_score=round(scores[tid], 6)) for tid in ordered]
+
+async def fan_out(search, subqueries, concurrency=6, deadline=8.0):
+    """Run search(q) for every sub-query, at most concurrency at a time.
+
+    Sub-queries still running when the deadline expires are cancelled and
+    left out. Returns {subquery: [doc, ...]} for the ones that succeeded.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(q):
+        async with semaphore:
+            return q, await search(q)
+
+    tasks = [asyncio.create_task(run(q)) for q in subqueries]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"Retrieval deadline hit; dropped {len(pending)} of {len(tasks)} sub-queries")
+
+    results = {}
+    for task in done:
+        if task.exception() is not None:
+            logger.error(f"Sub-query failed: {str(task.exception())}")
+            continue
+        q, results_str = task.result()
+        try:
+            obj = json.loads(results_str)
+        except ValueError:
+            logger.error(f"Error decoding Indian Kanoon JSON response for sub-query {q!r}")
+            continue
+        if 'docs' in obj:
+            results[q] = obj['docs']
+        else:
+            logger.warning(f"Sub-query {q!r} returned no docs: {obj.get('errmsg')}")
+    return results
+
+async def retrieve(search, entities, max_subqueries=6, concurrency=6, deadline=8.0, max_docs=20):
+    """Search several sub-queries concurrently and return a merged, deduplicated result.
+
+    The result looks like a Kanoon search response ({"docs": [...]}) with
+    the sub-queries that were run, or {"error": ...} if none succeeded.
+    """
+    subqueries = build_subqueries(entities, max_subqueries)
+    ranked_lists = await fan_out(search, subqueries, concurrency, deadline)
+    if not ranked_lists:
+        return {"error": "Indian Kanoon search failed for all sub-queries."}
+
+    # Keep the sub-query order stable so fusion does not depend on completion order
+    ordered = {q: ranked_lists[q] for q in subqueries if q in ranked_lists}
+    docs = reciprocal_rank_fusion(ordered)[:max_docs]
+    return {
+        "docs": docs,
+        "subqueries": list(ordered),
+        "found": "%d documents from %d sub-queries" % (len(docs), len(ordered)),
+    }
@@ -0,0 +1,40 @@
+# Tests run from backend/ (python -m pytest tests) against the stub servers
+# in benchmarks/stub_servers.py; nothing here talks to the real upstreams.
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_servers import ServerThread, make_kanoon_app, make_mistral_app  # noqa: E402
+
+ANSWER = " ".join(["The Delhi High Court may grant bail under section 437."] * 4)
+ENTITIES = [("Delhi High Court", "COURT", 8, 24), ("section 437", "PROVISION", 31, 42)]
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    """main.app against stub Kanoon and Mistral servers, with NER answered by a fixed entity list"""
+    with pytest.MonkeyPatch.context() as mp, \
+            ServerThread(make_kanoon_app(latency=0.01)) as kanoon, \
+            ServerThread(make_mistral_app(latency=0.05, answer=ANSWER, token_latency=0.05)) as mistral:
+        mp.chdir(tmp_path_factory.mktemp("backend"))
+        for name, value in {"IK_BASE_URL": kanoon.url, "IK_API_KEY": "stub", "MISTRAL_SERVER_URL": mistral.url,
+                            "MISTRAL_API_KEY": "stub", "GEMINI_API_KEY": "", "STARTUP_MODE": "eager",
+                            "NER_BATCHING": "0", "LOCAL_INDEX_ENABLED": "0", "RESPONSE_CACHE_ENABLED": "0",
+                            "RATE_LIMIT": "1000/minute", "API_KEYS": "issued-key", "LOG_LEVEL": "WARNING"}.items():
+            mp.setenv(name, value)
+        main = importlib.import_module("main")
+
+        async def run_ner(text):
+            return ENTITIES
+
+        async def run_ner_batch(texts, batch_size=64):
+            return [ENTITIES for _ in texts]
+
+        mp.setattr(main, "load_ner", lambda warmup=True: None)
+        mp.setattr(main, "run_ner", run_ner)
+        mp.setattr(main, "run_ner_batch", run_ner_batch)
+        with ServerThread(main.app) as server:
+            yield main, mistral.server.config.app, server.url
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from limits.storage import storage_from_string
+
+from admission import AdmissionRejected, ConcurrencyGate, RateGate, SharedRateGate
+
+def test_concurrency_gate_queues_then_rejects():
+    gate = ConcurrencyGate("llm", limit=1, max_queue=1, max_wait=1.0)
+
+    async def run():
+        assert await gate.acquire() == 0.0
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0.05)
+        assert gate.as_dict()["waiting"] == 1
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await gate.acquire()
+        assert excinfo.value.reason == "queue full"
+        with pytest.raises(AdmissionRejected):
+            gate.check()
+
+        gate.release()  # Handed straight to the waiter
+        assert await waiter > 0
+        assert gate.in_use == 1
+        gate.release()
+        assert gate.in_use == 0
+
+    asyncio.run(run())
+    assert gate.counts["admitted"] == 2 and gate.counts["rejected_queue_full"] == 2
+
+def test_concurrency_gate_wait_times_out_and_cancels_cleanly():
+    gate = ConcurrencyGate("llm", limit=1, max_queue=2, max_wait=0.1)
+
+    async def run():
+        await gate.acquire()
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await gate.acquire()
+        assert excinfo.value.reason == "queue wait timed out"
+
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0.02)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        gate.release()
+
+    asyncio.run(run())
+    # Neither the timed-out nor the cancelled waiter kept a slot or a queue place
+    assert gate.in_use == 0 and not gate.waiters
+
+def test_rate_gate_bursts_then_paces():
+    gate = RateGate("kanoon", rate=10, burst=2, max_wait=1.0)
+
+    async def run():
+        return [await gate.acquire() for _ in range(3)]
+
+    waits = asyncio.run(run())
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.02)
+    assert gate.counts["queued"] == 1
+
+def test_rate_gate_rejects_beyond_max_wait():
+    gate = RateGate("kanoon", rate=1, burst=1, max_wait=0.1)
+
+    async def run():
+        await gate.acquire()
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await gate.acquire()
+        return excinfo.value
+
+    rejected = asyncio.run(run())
+    assert rejected.retry_after == 1
+    assert gate.counts["rejected_rate"] == 1
+    # The rejected caller's token was handed back
+    assert gate.as_dict()["tokens"] > -0.5
+
+def test_shared_rate_gate_quota_is_shared_between_gates():
+    # Two workers' gates on the same storage draw on one window of 2 calls a second
+    storage = storage_from_string("memory://")
+    first = SharedRateGate("kanoon", 2, 2, 0.1, storage)
+    second = SharedRateGate("kanoon", 2, 2, 0.1, storage)
+
+    async def run():
+        assert await first.acquire() == pytest.approx(0, abs=0.05)
+        assert await second.acquire() == pytest.approx(0, abs=0.05)
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await first.acquire()
+        assert excinfo.value.reason == "rate limited"
+
+    asyncio.run(run())
+    assert first.counts["rejected_rate"] == 1 and second.counts["admitted"] == 1
+
+def test_shared_rate_gate_waits_for_the_window():
+    gate = SharedRateGate("kanoon", 2, 2, 2.0, storage_from_string("memory://"))
+
+    async def run():
+        await gate.acquire()
+        await gate.acquire()
+        start = time.monotonic()
+        waited = await gate.acquire()
+        return waited, time.monotonic() - start
+
+    waited, elapsed = asyncio.run(run())
+    assert 0.8 < waited < 1.5 and elapsed == pytest.approx(waited, abs=0.05)
+    assert gate.counts["queued"] == 1 and gate.counts["admitted"] == 3 and gate.waiting == 0
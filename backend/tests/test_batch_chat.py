@@ -0,0 +1,33 @@
+import json
+
+import httpx
+
+from conftest import ANSWER
+
+QUERIES = ["Bail from the Delhi High Court under section 437", "Anticipatory bail under section 438"]
+
+def test_streamed_batch_ndjson(backend):
+    _, _, url = backend
+    with httpx.Client(base_url=url, timeout=30) as client:
+        response = client.post("/chat/batch", params={"stream": "true"}, json={"queries": QUERIES})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        started, results, final = lines[0], lines[1:-1], lines[-1]
+        assert started["status"] == "running" and started["total"] == 2
+        assert sorted(result["item"] for result in results) == [0, 1]
+        assert all(result["status"] == "ok" and result["response"]["lawyer_response"].strip() == ANSWER
+                   for result in results)
+        seqs = [result["seq"] for result in results]
+        assert seqs == sorted(seqs)
+        assert final["status"] == "done" and final["completed"] == 2 and final["cursor"] == seqs[-1]
+
+        # The same job, polled with a cursor
+        job = client.get(f"/chat/batch/{started['job_id']}", params={"after": seqs[0]}).json()
+        assert job["status"] == "done" and [result["seq"] for result in job["results"]] == seqs[1:]
+        assert client.get("/chat/batch/no-such-job").status_code == 404
+
+def test_empty_batch_is_rejected(backend):
+    _, _, url = backend
+    assert httpx.post(url + "/chat/batch", json={"queries": []}).status_code == 422
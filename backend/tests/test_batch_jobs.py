@@ -0,0 +1,61 @@
+import json
+import sqlite3
+
+from batch_jobs import JobStore
+
+def test_completed_is_counted_as_results_are_added(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    job_id = store.create(3)
+    assert store.get(job_id)["completed"] == 0
+    store.add_result(job_id, 1, {"item": 1, "status": "ok"})
+    store.add_result(job_id, 0, {"item": 0, "status": "error"})
+    assert store.get(job_id)["completed"] == 2
+    assert [seq for seq, _ in store.results(job_id)] == [1, 2]
+    store.close()
+
+def test_store_without_completed_column_is_migrated(tmp_path):
+    filepath = str(tmp_path / "jobs.sqlite")
+    conn = sqlite3.connect(filepath)
+    conn.executescript('''
+        CREATE TABLE jobs (id TEXT PRIMARY KEY, total INTEGER NOT NULL, status TEXT NOT NULL,
+                           created_at REAL NOT NULL, finished_at REAL, pid INTEGER NOT NULL);
+        CREATE TABLE results (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL,
+                              item INTEGER NOT NULL, result TEXT NOT NULL);
+        INSERT INTO jobs VALUES ('old', 2, 'done', 1.0, 2.0, 1);
+        INSERT INTO results (job_id, item, result) VALUES ('old', 0, '{}'), ('old', 1, '{}');
+    ''')
+    conn.commit()
+    conn.close()
+
+    store = JobStore(filepath, ttl=10 ** 12)
+    assert store.get("old")["completed"] == 2
+    store.close()
+
+def test_status_transitions(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    done, interrupted = store.create(1), store.create(1)
+    assert store.get(done)["status"] == "running" and store.get(done)["finished_at"] is None
+
+    store.finish(done, "done")
+    assert store.get(done)["status"] == "done" and store.get(done)["finished_at"] is not None
+    # Only a running job can finish, so a late interrupt does not overwrite "done"
+    store.finish(done, "failed")
+    store.interrupt_running()
+    assert store.get(done)["status"] == "done"
+    assert store.get(interrupted)["status"] == "interrupted"
+    assert store.get("no-such-job") is None
+    store.close()
+
+def test_results_cursor_and_expiry(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), ttl=0.0)
+    job_id = store.create(3)
+    for item in range(3):
+        store.add_result(job_id, item, {"item": item})
+    first = store.results(job_id, limit=2)
+    assert [json.loads(result)["item"] for _, result in first] == [0, 1]
+    assert [json.loads(result)["item"] for _, result in store.results(job_id, after=first[-1][0])] == [2]
+
+    # Creating a job prunes the ones older than ttl, with their results
+    store.create(1)
+    assert store.get(job_id) is None and store.results(job_id) == []
+    store.close()
@@ -0,0 +1,80 @@
+import json
+import time
+
+import httpx
+import pytest
+
+from benchmarks.stub_servers import make_stub_provider
+from llm_router import LLMRouter, Provider
+
+from conftest import ANSWER
+
+def parse_events(body):
+    """[(event, data)] of a text/event-stream body, checking each event's framing"""
+    events = []
+    for block in body.split("\n\n"):
+        if not block:
+            continue
+        lines = block.split("\n")
+        assert len(lines) == 2 and lines[0].startswith("event: ") and lines[1].startswith("data: "), block
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+    return events
+
+def stream_chat(url, query="Bail from the Delhi High Court under section 437"):
+    response = httpx.post(url + "/chat/stream", json={"query": query}, timeout=30)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.endswith("\n\n")
+    return parse_events(response.text)
+
+def test_sse_framing_and_event_order(backend):
+    main, _, url = backend
+    events = stream_chat(url)
+    names = [name for name, _ in events]
+    assert names[:2] == ["entities", "kanoon"]
+    assert names[-1] == "done" and set(names[2:-1]) == {"token"}
+    assert events[0][1]["extracted_legal_entities"] == ["Delhi High Court", "section 437"]
+    assert events[1][1]["indian_kanoon_results"]["docs"]
+    assert "".join(data["text"] for name, data in events if name == "token").strip() == ANSWER
+    assert events[-1][1]["model_used"] == "mistral"
+
+def test_first_token_timeout_fails_over(backend, monkeypatch):
+    main, _, url = backend
+    stalled = make_stub_provider("mistral", latency=10.0, timeout=0.3)
+    fallback = Provider("gemini", main.mistral_complete, main.mistral_stream)
+    monkeypatch.setattr(main, "llm_router", LLMRouter([stalled, fallback], hedge=False))
+
+    start = time.perf_counter()
+    events = stream_chat(url)
+    assert time.perf_counter() - start < 5.0
+    assert events[-1] == ("done", {"model_used": "gemini", "cache": None})
+    assert "".join(data["text"] for name, data in events if name == "token").strip() == ANSWER
+    assert stalled.counts["timeouts"] == 1
+    assert main.llm_router.counts["failover_wins"] == 1
+
+def test_first_token_timeout_without_fallback_is_an_error_event(backend, monkeypatch):
+    main, _, url = backend
+    stalled = make_stub_provider("mistral", latency=10.0, timeout=0.3)
+    monkeypatch.setattr(main, "llm_router", LLMRouter([stalled], hedge=False))
+
+    events = stream_chat(url)
+    assert [name for name, _ in events] == ["entities", "kanoon", "error"]
+    assert "all providers failed" in events[-1][1]["detail"]
+
+def test_client_disconnect_closes_the_upstream_stream(backend):
+    main, mistral_app, url = backend
+    with httpx.Client(timeout=30) as client:
+        with client.stream("POST", url + "/chat/stream", json={"query": "Bail in the Delhi High Court"}) as response:
+            for line in response.iter_lines():
+                if line == "event: token":
+                    break
+            assert mistral_app.state.open_streams == 1
+
+    # The answer takes ~2s to stream; dropping the client must stop it well before
+    deadline = time.monotonic() + 1.0
+    while time.monotonic() < deadline:
+        if mistral_app.state.open_streams == 0 and not main.CHAT_IN_FLIGHT.values.get(("chat_stream",)):
+            break
+        time.sleep(0.05)
+    assert mistral_app.state.open_streams == 0
+    assert not main.CHAT_IN_FLIGHT.values.get(("chat_stream",))
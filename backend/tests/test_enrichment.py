@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+
+import httpx
+import pytest
+
+from benchmarks.stub_servers import ServerThread, fake_doc, make_kanoon_app
+from enrichment import DocCache
+from ik_download import FileStorage
+from manifest import Manifest
+
+class LoopCheckedManifest(Manifest):
+    """Fails the test if the manifest is touched from the event loop thread"""
+    loop_thread = None
+
+    def load(self):
+        assert threading.get_ident() != self.loop_thread, "manifest used on the event loop"
+        return super().load()
+
+    def record(self, *args, **kwargs):
+        assert threading.get_ident() != self.loop_thread, "manifest used on the event loop"
+        return super().record(*args, **kwargs)
+
+@pytest.fixture(scope="module")
+def kanoon():
+    app = make_kanoon_app(latency=0.05)
+    with ServerThread(app) as server:
+        yield app, server.url
+
+def load_docs(url, datadir, hit_lists):
+    async def run():
+        LoopCheckedManifest.loop_thread = threading.get_ident()
+        async with httpx.AsyncClient(base_url=url) as client:
+            async def fetch(docid):
+                return (await client.post(f"/doc/{docid}/")).text
+
+            cache = DocCache(FileStorage(datadir), LoopCheckedManifest(os.path.join(datadir, ".manifest.sqlite")), fetch)
+            try:
+                results = await asyncio.gather(*[cache.get_many(hits, concurrency=3, deadline=10)
+                                                 for hits in hit_lists])
+            finally:
+                cache.close()
+            return results, cache.as_dict()
+    return asyncio.run(run())
+
+def test_each_doc_is_fetched_once(kanoon, tmp_path):
+    app, url = kanoon
+    app.state.calls = 0
+    hit_lists = [[fake_doc(1), fake_doc(2)], [fake_doc(2), fake_doc(3)], [fake_doc(1), fake_doc(3)]]
+    results, stats = load_docs(url, str(tmp_path), hit_lists)
+    assert [sorted(docs) for docs in results] == [[1, 2], [2, 3], [1, 3]]
+    assert all("section 437" in docs[2][0] for docs in results[:2])
+    assert app.state.calls == 3
+    assert stats["fetches"] == 3
+
+    # A new process reads the saved docs instead of fetching them
+    app.state.calls = 0
+    results, stats = load_docs(url, str(tmp_path), hit_lists[:1])
+    assert sorted(results[0]) == [1, 2]
+    assert app.state.calls == 0
+    assert stats["storage_hits"] == 2
+
+def test_deadline_leaves_slow_docs_out(tmp_path):
+    app = make_kanoon_app(latency=1.0)
+    with ServerThread(app) as server:
+        async def run():
+            async with httpx.AsyncClient(base_url=server.url) as client:
+                async def fetch(docid):
+                    return (await client.post(f"/doc/{docid}/")).text
+
+                cache = DocCache(FileStorage(str(tmp_path)), Manifest(str(tmp_path / ".manifest.sqlite")), fetch)
+                docs = await cache.get_many([fake_doc(1), fake_doc(2)], deadline=0.2)
+                cache.close()
+                return docs, cache.as_dict()
+
+        docs, stats = asyncio.run(run())
+    assert docs == {}
+    assert stats["timeouts"] == 2
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.stub_servers import ServerThread, make_kanoon_app
+from ik_http import CircuitBreaker, CircuitOpenError, IKHttpClient, UpstreamError
+
+@pytest.fixture(scope="module")
+def slow_kanoon():
+    with ServerThread(make_kanoon_app(latency=2.0)) as server:
+        yield server
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    return breaker
+
+def test_half_open_allows_a_single_probe():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_cancelled_probe_releases_the_breaker(slow_kanoon):
+    breaker = half_open_breaker()
+    client = IKHttpClient(slow_kanoon.url, {}, breaker=breaker)
+
+    async def cancel_probe():
+        task = asyncio.create_task(client.acall("/search/?formInput=bail"))
+        await asyncio.sleep(0.2)
+        assert breaker.probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+
+    asyncio.run(cancel_probe())
+    assert not breaker.probing
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+def test_timed_out_probe_releases_the_breaker(slow_kanoon):
+    breaker = half_open_breaker()
+    client = IKHttpClient(slow_kanoon.url, {}, breaker=breaker)
+
+    async def probe_with_deadline():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.acall("/search/?formInput=bail"), 0.2)
+        await client.aclose()
+
+    asyncio.run(probe_with_deadline())
+    assert breaker.allow()
+
+def test_open_breaker_rejects_without_calling_upstream(slow_kanoon):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+    client = IKHttpClient(slow_kanoon.url, {}, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.acall("/search/?formInput=bail"))
+    assert client.stats.breaker_rejections == 1
+    assert client.stats.requests == 0
+
+def test_deadline_cuts_the_attempt_timeout(slow_kanoon):
+    # A 10s per-request timeout must not let a 2s upstream outlast a 0.5s deadline
+    client = IKHttpClient(slow_kanoon.url, {}, timeout=10.0, deadline=0.5, backoff_base=0.01)
+    start = time.monotonic()
+    with pytest.raises(UpstreamError):
+        client.call("/search/?formInput=bail")
+    assert time.monotonic() - start < 1.0
+    client.close()
+
+def test_async_deadline_cuts_the_attempt_timeout(slow_kanoon):
+    client = IKHttpClient(slow_kanoon.url, {}, timeout=10.0, deadline=0.5, backoff_base=0.01)
+
+    async def call():
+        start = time.monotonic()
+        with pytest.raises(UpstreamError):
+            await client.acall("/search/?formInput=bail")
+        await client.aclose()
+        return time.monotonic() - start
+
+    assert asyncio.run(call()) < 1.0
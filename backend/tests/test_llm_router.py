@@ -0,0 +1,39 @@
+import asyncio
+import itertools
+
+from llm_router import LatencyWindow, LLMRouter, Provider
+
+def test_cancelled_calls_above_the_median_count_as_latencies():
+    window = LatencyWindow()
+    for elapsed in (0.1, 0.1, 0.2):
+        window.record(elapsed, True)
+    window.record_cancelled(0.05)
+    window.record_cancelled(0.8)
+    assert window.samples() == 4
+    assert window.percentile(100) == 0.8
+    assert window.error_rate() == 0.0
+
+def test_hedge_delay_keeps_the_slow_tail():
+    # One call in five to "slow" is slow; those always lose to the hedge
+    pattern = itertools.cycle([0.01, 0.01, 0.01, 0.01, 0.3])
+
+    async def slow(prompt):
+        await asyncio.sleep(next(pattern))
+        return "slow answer"
+
+    async def fast(prompt):
+        await asyncio.sleep(0.005)
+        return "fast answer"
+
+    router = LLMRouter([Provider("slow", slow), Provider("fast", fast)],
+                       hedge_delay=0.05, min_hedge_delay=0.02, min_samples=5)
+
+    async def run():
+        for _ in range(40):
+            await router.complete("prompt", preferred="slow")
+
+    asyncio.run(run())
+    provider = router.providers["slow"]
+    assert provider.counts["cancelled"] >= 7
+    # Successes alone put the p95 at ~10 ms; the lost races show calls take longer
+    assert provider.windows["complete"].percentile(95) >= 0.025
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+import local_index
+from ik_download import FileStorage
+
+def save_doc(storage, tid, text, mtime=None):
+    docpath = storage.get_docpath("Delhi High Court", "2021-01-%02d" % (tid % 28 + 1))
+    path = storage.get_json_orig_path(docpath, tid)[0]
+    storage.save_json(json.dumps({"tid": tid, "title": "State v. Party %d" % tid, "doc": text}), path)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+def tids(index, query):
+    return {meta["tid"] for _, _, meta in index.search(query)}
+
+def test_incremental_build_finds_docs_with_older_mtimes(tmp_path):
+    storage = FileStorage(str(tmp_path))
+    save_doc(storage, 1, "Bail granted under the narcotics act")
+    index = local_index.build(storage, workers=1)
+    assert tids(index, "bail narcotics") == {1}
+
+    # Renamed into place after doc 1 was indexed, keeping its temp file's mtime
+    save_doc(storage, 2, "Bail refused under the narcotics act", mtime=time.time() - 60)
+    index = local_index.build(storage, workers=1, index=index)
+    assert tids(index, "bail narcotics") == {1, 2}
+    assert len(index) == 2
+
+def test_incremental_build_reindexes_changed_docs(tmp_path):
+    storage = FileStorage(str(tmp_path))
+    save_doc(storage, 1, "Bail granted under the narcotics act", mtime=time.time() - 60)
+    index = local_index.build(storage, workers=1)
+    save_doc(storage, 1, "Anticipatory bail in a dowry case")
+    index = local_index.build(storage, workers=1, index=index)
+    assert tids(index, "narcotics") == set()
+    assert tids(index, "dowry") == {1}
+    assert index.as_dict()["docs"] == 1
+
+def test_one_refresher_and_followers_reload_on_change(tmp_path):
+    storage = FileStorage(str(tmp_path))
+    filepath = str(tmp_path / "local_index.pkl")
+    # Two handles on one file stand in for two workers (flock is per open file)
+    refresher = local_index.SharedIndex(filepath)
+    follower = local_index.SharedIndex(filepath)
+    assert refresher.is_refresher()
+    assert not follower.is_refresher()
+    assert follower.reload() is None
+
+    save_doc(storage, 1, "Bail granted under the narcotics act")
+    refresher.update(storage, workers=1)
+    loaded = follower.reload()
+    assert tids(loaded, "bail narcotics") == {1}
+    # Unchanged file: not unpickled again
+    refresher.update(storage, workers=1)
+    assert follower.reload() is loaded
+
+    save_doc(storage, 2, "Bail refused under the narcotics act", mtime=time.time() - 60)
+    refresher.update(storage, workers=1)
+    assert tids(follower.reload(), "bail narcotics") == {1, 2}
+
+    refresher.close()
+    assert follower.is_refresher()
+    follower.close()
@@ -0,0 +1,55 @@
+import contextvars
+import json
+import logging
+import queue
+
+from logging_config import (DeferredQueueHandler, JsonFormatter, RequestContextFilter, redact_headers,
+                            start_request)
+
+def test_credential_headers_are_redacted():
+    headers = {"Authorization": "Bearer secret", "X-API-Key": "issued-key", "Cookie": "legalist_session=abc",
+               "X-Session-ID": "abc", "Content-Type": "application/json"}
+    assert redact_headers(headers) == {"Authorization": "[redacted]", "X-API-Key": "[redacted]",
+                                       "Cookie": "[redacted]", "X-Session-ID": "[redacted]",
+                                       "Content-Type": "application/json"}
+
+def make_logger():
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(RequestContextFilter())
+    logger = logging.Logger("test", logging.DEBUG)
+    logger.addHandler(handler)
+    return logger, records
+
+def drain(records):
+    formatter = JsonFormatter()
+    lines = []
+    while not records.empty():
+        lines.append(json.loads(formatter.format(records.get())))
+    return lines
+
+def test_unsampled_request_keeps_only_warnings():
+    logger, records = make_logger()
+
+    def request(request_id, sample_rate):
+        start_request(request_id, sample_rate)
+        logger.info("stage timings %s", {"ner": 1.0})
+        logger.warning("upstream slow")
+
+    contextvars.copy_context().run(request, "unsampled", 0.0)
+    contextvars.copy_context().run(request, "sampled", 1.0)
+    logger.info("outside any request")
+
+    assert [(line.get("request_id"), line["msg"]) for line in drain(records)] == [
+        ("unsampled", "upstream slow"),
+        ("sampled", "stage timings {'ner': 1.0}"),
+        ("sampled", "upstream slow"),
+        (None, "outside any request"),
+    ]
+
+def test_arguments_are_merged_when_logged():
+    logger, records = make_logger()
+    fields = {"ner": 1.0}
+    logger.info("timings %s", fields)
+    fields["ner"] = 2.0  # A later change must not reach the queued record
+    assert drain(records)[0]["msg"] == "timings {'ner': 1.0}"
@@ -0,0 +1,37 @@
+import json
+import os
+
+from ik_download import FileStorage
+from manifest import Manifest
+from packed_storage import PackedStorage
+
+def save_docs(storage):
+    docpath = storage.get_docpath("Supreme Court of India", "2020-01-15")
+    storage.make_dir(docpath)
+    storage.save_json(json.dumps({"tid": 7, "docsize": 120}), os.path.join(docpath, "7.json"))
+    storage.save_json(json.dumps({"tid": 8, "docsize": 80}), os.path.join(docpath, "8.json"))
+    storage.save_binary(b"%PDF", os.path.join(docpath, "7_original.pdf"))
+    return docpath
+
+def check_rebuilt(manifest, docpath):
+    assert len(manifest) == 2
+    assert manifest.get(7)["docsize"] == 120
+    assert manifest.get(7)["path"] == os.path.join(docpath, "7.json")
+    assert manifest.get(7)["origpath"] == os.path.join(docpath, "7_original")
+    assert manifest.get(8)["origpath"] is None
+
+def test_rebuild_from_files(tmp_path):
+    datadir = str(tmp_path / "data")
+    docpath = save_docs(FileStorage(datadir))
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    manifest.rebuild(datadir)
+    check_rebuilt(manifest, docpath)
+
+def test_rebuild_from_packed_segments(tmp_path):
+    datadir = str(tmp_path / "data")
+    storage = PackedStorage(datadir)
+    docpath = save_docs(storage)
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    manifest.rebuild(datadir, storage)
+    check_rebuilt(manifest, docpath)
+    storage.close()
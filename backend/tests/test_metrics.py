@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from metrics import Counter, Gauge, Histogram, MultiprocessStore, Registry
+
+def worker_registry(requests, in_flight, latency):
+    registry = Registry()
+    Counter("requests_total", "Requests", ("route",), registry=registry).inc("/chat", amount=requests)
+    Gauge("in_flight", "In flight", registry=registry).set(in_flight)
+    Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0), registry=registry).observe(latency)
+    registry.add_collector(lambda: [("cache_hit_ratio", "gauge", "Hit ratio", [({}, 0.5)])])
+    return registry
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_multiprocess_render_sums_the_workers(tmp_path):
+    this = MultiprocessStore(worker_registry(3, 2, 0.05), str(tmp_path))
+    live = MultiprocessStore(worker_registry(4, 1, 0.5), str(tmp_path), pid=1)  # pid 1 is always alive
+    gone = MultiprocessStore(worker_registry(5, 7, 5.0), str(tmp_path), pid=exited_pid())
+    live.write(live.snapshot())
+    gone.write(gone.snapshot())
+
+    lines = this.render().splitlines()
+    # Counters and histograms keep an exited worker's counts; gauges do not
+    assert 'requests_total{route="/chat"} 12' in lines
+    assert 'in_flight 3' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'latency_seconds_count 3' in lines
+    # Collector samples are per live worker
+    ratios = [line for line in lines if line.startswith("cache_hit_ratio{")]
+    assert sorted(ratios) == sorted(['cache_hit_ratio{pid="1"} 0.5', 'cache_hit_ratio{pid="%d"} 0.5' % os.getpid()])
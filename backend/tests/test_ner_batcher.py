@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from ner_batcher import NERBatcher
+
+def run_batcher(infer, texts):
+    async def submit_all():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = NERBatcher(None, None, executor, max_batch_size=4, infer=infer)
+            batcher.start()
+            try:
+                return await asyncio.gather(*[batcher.submit(text) for text in texts])
+            finally:
+                await batcher.stop()
+    return asyncio.run(submit_all())
+
+def test_batches_concurrent_texts():
+    calls = []
+
+    def infer(texts, model, tokenizer):
+        calls.append(len(texts))
+        return [[(text, "COURT", 0, len(text))] for text in texts]
+
+    results = run_batcher(infer, ["a", "b", "c", "d", "e"])
+    assert [entities[0][0] for entities in results] == ["a", "b", "c", "d", "e"]
+    assert sum(calls) == 5 and max(calls) <= 4
+
+def test_failed_batch_is_none_not_empty():
+    def infer(texts, model, tokenizer):
+        raise RuntimeError("executor died")
+
+    assert run_batcher(infer, ["Bail in Delhi High Court", "Tata Sons"]) == [None, None]
@@ -0,0 +1,10 @@
+from cache import NERMemo
+
+def test_memo_is_keyed_on_the_exact_text():
+    # The NER model is cased, so a case variant is a different input
+    memo = NERMemo()
+    entities = [("Delhi High Court", "B-ORG", 8, 24)]
+    memo.put("Bail in Delhi High Court", entities)
+    assert memo.get("Bail in Delhi High Court") == entities
+    assert memo.get("bail in delhi high court") is None
+    assert memo.as_dict()["hits"] == 1
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("torch")
+
+from benchmarks.ner_backends import PARITY_TEXTS
+
+# Dynamic int8 quantization may move a token's label; over the parity texts
+# it must still find nearly the same (entity, label) pairs as fp32
+INT8_MIN_F1 = 0.9
+
+@pytest.fixture(scope="module")
+def fp32_model():
+    """The fp32 torch model (the weights download on first use)"""
+    from legal_ner import load_model
+    return load_model(backend="fp32")
+
+@pytest.fixture(scope="module")
+def onnx_model(tmp_path_factory):
+    """The fp32 model's ONNX export"""
+    pytest.importorskip("onnxruntime")
+    from legal_ner import load_model
+    onnx_path = str(tmp_path_factory.mktemp("onnx") / "bert-base-NER.onnx")
+    return load_model(backend="onnx", onnx_path=onnx_path)
+
+@pytest.fixture(scope="module")
+def int8_model():
+    from legal_ner import load_model
+    return load_model(backend="int8")
+
+def test_onnx_spans_match_torch(fp32_model, onnx_model):
+    from legal_ner import extract_ner_entities_batch
+    (torch_model, tokenizer), (onnx, onnx_tokenizer) = fp32_model, onnx_model
+    expected = extract_ner_entities_batch(PARITY_TEXTS, torch_model, tokenizer)
+    assert all(entities is not None for entities in expected)
+    assert any(expected), "the parity texts should contain entities"
+    for text, want, got in zip(PARITY_TEXTS, expected,
+                               extract_ner_entities_batch(PARITY_TEXTS, onnx, onnx_tokenizer)):
+        assert got == want, text
+
+def test_onnx_spans_match_torch_one_text_at_a_time(fp32_model, onnx_model):
+    from legal_ner import extract_ner_entities
+    (torch_model, tokenizer), (onnx, onnx_tokenizer) = fp32_model, onnx_model
+    for text in PARITY_TEXTS:
+        assert extract_ner_entities(text, onnx, onnx_tokenizer) == \
+            extract_ner_entities(text, torch_model, tokenizer), text
+
+def test_int8_entities_are_close_to_fp32(fp32_model, int8_model):
+    from legal_ner import extract_ner_entities_batch
+    (torch_model, tokenizer), (quantized, int8_tokenizer) = fp32_model, int8_model
+    expected = extract_ner_entities_batch(PARITY_TEXTS, torch_model, tokenizer)
+    got = extract_ner_entities_batch(PARITY_TEXTS, quantized, int8_tokenizer)
+    assert all(entities is not None for entities in got)
+
+    matched = predicted = relevant = 0
+    for text, want, have in zip(PARITY_TEXTS, expected, got):
+        want = {entity[:2] for entity in want}
+        have = {entity[:2] for entity in have}
+        assert have or not want, f"int8 found no entities in {text!r}"
+        matched += len(want & have)
+        predicted += len(have)
+        relevant += len(want)
+    f1 = 2 * matched / (predicted + relevant)
+    assert f1 >= INT8_MIN_F1, f"int8/fp32 entity F1 {f1:.3f}"
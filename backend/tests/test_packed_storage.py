@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+from packed_storage import PackedStorage
+
+def doc(tid, text="Bail granted"):
+    return json.dumps({"tid": tid, "doc": text * 20})
+
+def test_write_read_overwrite_remove(tmp_path):
+    storage = PackedStorage(str(tmp_path))
+    path = os.path.join(str(tmp_path), "court", "2020", "7.json")
+    storage.save_json(doc(7), path)
+    storage.save_binary(b"%PDF-1.4", os.path.join(str(tmp_path), "court", "2020", "7_original.pdf"))
+    assert storage.read(path) == doc(7)
+    assert storage.read_binary(os.path.join(str(tmp_path), "court", "2020", "7_original.pdf")) == b"%PDF-1.4"
+    assert sorted(name for name, _ in storage.listdir(os.path.join(str(tmp_path), "court", "2020"))) == \
+        ["7.json", "7_original.pdf"]
+
+    storage.save_json(doc(7, "Bail refused"), path)
+    assert storage.read(path) == doc(7, "Bail refused")
+
+    storage.remove(path)
+    assert not storage.exists(path)
+    with pytest.raises(FileNotFoundError):
+        storage.read(path)
+    storage.close()
+
+def test_reopen_and_other_writers(tmp_path):
+    datadir = str(tmp_path)
+    first = PackedStorage(datadir)
+    second = PackedStorage(datadir)  # Another worker on the same datadir
+    first.save_json(doc(1), os.path.join(datadir, "a", "1.json"))
+    second.save_json(doc(2), os.path.join(datadir, "a", "2.json"))
+    first.remove(os.path.join(datadir, "a", "2.json"))
+    assert second.read(os.path.join(datadir, "a", "1.json")) == doc(1)
+    first.close()
+    second.close()
+
+    reopened = PackedStorage(datadir)
+    assert reopened.read(os.path.join(datadir, "a", "1.json")) == doc(1)
+    assert not reopened.exists(os.path.join(datadir, "a", "2.json"))
+    assert [path for path, _ in reopened.iter_doc_files()] == [os.path.join(datadir, "a", "1.json")]
+    reopened.close()
+
+def test_compact_drops_dead_records(tmp_path):
+    datadir = str(tmp_path)
+    storage = PackedStorage(datadir)
+    path = os.path.join(datadir, "a", "1.json")
+    for i in range(20):
+        storage.save_json(doc(1, "Revision %d " % i), path)
+    storage.save_json(doc(2), os.path.join(datadir, "a", "2.json"))
+    storage.remove(os.path.join(datadir, "a", "2.json"))
+    before = storage.disk_usage()
+
+    storage.compact()
+    assert storage.disk_usage() < before / 5
+    assert storage.read(path) == doc(1, "Revision 19 ")
+    assert not storage.exists(os.path.join(datadir, "a", "2.json"))
+    storage.close()
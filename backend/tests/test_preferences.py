@@ -0,0 +1,42 @@
+import httpx
+
+import preferences
+
+def test_sqlite_store_persists_and_expires(tmp_path):
+    filepath = str(tmp_path / "preferences.sqlite")
+    store = preferences.open_store(filepath)
+    client = preferences.client_key(session_id=preferences.new_session_id())
+    store.set(client, "model", "gemini")
+    store.close()
+
+    reopened = preferences.open_store(filepath)
+    assert reopened.get(client, "model") == "gemini"
+    assert reopened.get(preferences.client_key(api_key="other"), "model") is None
+    reopened.close()
+
+    expired = preferences.open_store(filepath, ttl=0.0)
+    assert expired.get(client, "model") is None
+    expired.close()
+
+def test_client_keys():
+    assert preferences.client_key(api_key="issued-key").startswith("key:")
+    assert "issued-key" not in preferences.client_key(api_key="issued-key")
+    assert preferences.client_key(session_id="not a session id") is None
+    assert preferences.client_key() is None
+
+def test_session_preference_round_trip(backend):
+    main, _, url = backend
+    with httpx.Client(base_url=url, timeout=10) as client:
+        response = client.post("/set-model-preference", json={"model": "gemini"})
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+        assert client.cookies[preferences.SESSION_COOKIE] == session_id
+        # The session cookie is sent back; another client does not see the choice
+        assert client.get("/get-model-preference").json() == {"model": "gemini"}
+    assert httpx.get(url + "/get-model-preference").json() == {"model": main.MODEL_PREFERENCE}
+    assert httpx.get(url + "/get-model-preference", headers={"X-Session-ID": session_id}).json() == {"model": "gemini"}
+
+def test_invalid_preference_is_rejected(backend):
+    _, _, url = backend
+    response = httpx.post(url + "/set-model-preference", json={"model": "gpt"})
+    assert response.status_code == 400
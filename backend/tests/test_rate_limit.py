@@ -0,0 +1,17 @@
+from starlette.requests import Request
+
+def make_request(api_key=None, host="203.0.113.7"):
+    headers = [(b"x-api-key", api_key.encode())] if api_key else []
+    return Request({"type": "http", "method": "POST", "path": "/chat", "headers": headers, "client": (host, 4242)})
+
+def test_issued_api_key_gets_its_own_limit(backend):
+    main, _, _ = backend
+    key = main.rate_limit_key(make_request("issued-key"))
+    assert key.startswith("key:") and "issued-key" not in key
+    assert main.rate_limit_key(make_request("issued-key", host="198.51.100.1")) == key
+
+def test_unknown_api_keys_are_limited_by_address(backend):
+    main, _, _ = backend
+    keys = {main.rate_limit_key(make_request("random-%d" % i)) for i in range(5)}
+    assert keys == {"203.0.113.7"}
+    assert main.rate_limit_key(make_request()) == "203.0.113.7"
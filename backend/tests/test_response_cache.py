@@ -0,0 +1,23 @@
+from response_cache import ResponseCache, negations
+
+ENTITIES = ["Delhi High Court"]
+RESULTS = {"docs": [{"tid": 1, "title": "State v. Party"}]}
+
+def test_semantic_matching_is_off_by_default():
+    cache = ResponseCache()
+    cache.put("Bail granted by Delhi High Court", ENTITIES, RESULTS, "answer", "mistral")
+    assert cache.get("Bail granted by the Delhi High Court?", ENTITIES, RESULTS) is None
+    assert cache.get("bail granted by Delhi High Court!", ENTITIES, RESULTS)[1]["match"] == "exact"
+
+def test_negated_query_is_not_a_paraphrase():
+    cache = ResponseCache(similarity_threshold=0.9)
+    cache.put("Bail granted by Delhi High Court", ENTITIES, RESULTS, "answer", "mistral")
+    assert cache.get("Bail not granted by Delhi High Court", ENTITIES, RESULTS) is None
+    assert cache.get("Bail wasn't granted by Delhi High Court", ENTITIES, RESULTS) is None
+    answer, provenance = cache.get("Bail granted by the Delhi High Court?", ENTITIES, RESULTS)
+    assert provenance["match"] == "semantic"
+
+def test_negations():
+    assert negations("Bail wasn't granted") == {"not"}
+    assert negations("Bail denied without notice") == {"denied", "without"}
+    assert negations("Bail granted") == set()
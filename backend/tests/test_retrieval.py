@@ -0,0 +1,50 @@
+import asyncio
+import json
+import time
+
+import retrieval
+
+ENTITIES = ["Delhi High Court", "section 437", "bail"]
+
+class FakeSearch:
+    """Kanoon search stand-in that records how many calls overlap"""
+    def __init__(self, latency=0.2):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, q):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            # Longer sub-queries finish first, so completion order is not sub-query order
+            await asyncio.sleep(self.latency * (1 - len(q) / 100))
+        finally:
+            self.in_flight -= 1
+        # Every sub-query hits doc 1; each entity adds a doc of its own
+        docs = [{"tid": 1, "title": "common"}] + [{"tid": 100 + i, "title": e}
+                                                   for i, e in enumerate(ENTITIES) if e in q]
+        return json.dumps({"docs": docs})
+
+def test_subqueries_run_concurrently_and_merge_in_order():
+    search = FakeSearch()
+    subqueries = retrieval.build_subqueries(ENTITIES)
+    assert len(subqueries) == 6
+
+    start = time.perf_counter()
+    result = asyncio.run(retrieval.retrieve(search, ENTITIES, max_subqueries=6, concurrency=6))
+    elapsed = time.perf_counter() - start
+
+    assert search.peak == 6
+    assert elapsed < 2 * search.latency
+    assert result["subqueries"] == subqueries
+    tids = [doc["tid"] for doc in result["docs"]]
+    assert len(tids) == len(set(tids)) == 4
+    assert tids[0] == 1 and result["docs"][0]["matched_queries"] == subqueries
+    scores = [doc["rrf_score"] for doc in result["docs"]]
+    assert scores == sorted(scores, reverse=True)
+
+def test_concurrency_bounds_the_searches_in_flight():
+    search = FakeSearch(latency=0.05)
+    asyncio.run(retrieval.retrieve(search, ENTITIES, max_subqueries=6, concurrency=2))
+    assert search.peak == 2
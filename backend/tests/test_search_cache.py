@@ -0,0 +1,46 @@
+import asyncio
+import json
+import os
+
+from cache import SearchCache
+from ik_download import FileStorage
+
+def results(q):
+    return json.dumps({"found": "1 - 1 of 1", "docs": [{"tid": 1, "title": q}]})
+
+def test_workers_see_each_others_disk_entries(tmp_path):
+    # Two caches on one datadir stand in for two gunicorn workers
+    first = SearchCache(FileStorage(str(tmp_path)))
+    second = SearchCache(FileStorage(str(tmp_path)))
+    first.put("bail in delhi", 0, 1, results("bail"))
+    assert second.get("Bail in Delhi", 0, 1) == results("bail")
+    assert second.as_dict()["disk_hits"] == 1
+    assert second.get("Bail in Delhi", 0, 1) == results("bail")
+    assert second.as_dict()["memory_hits"] == 1
+
+def test_disk_bound_is_shared_between_workers(tmp_path):
+    workers = [SearchCache(FileStorage(str(tmp_path)), max_disk_entries=10) for _ in range(2)]
+    for i in range(40):
+        workers[i % 2].put("query %d" % i, 0, 1, results(str(i)))
+    saved = [name for name in os.listdir(tmp_path / "search_cache") if name.endswith(".json")]
+    assert len(saved) <= 10
+    # The newest entries survive
+    assert workers[0].get("query 39", 0, 1) == results("39")
+    assert workers[1].get("query 0", 0, 1) is None
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = SearchCache(FileStorage(str(tmp_path)), ttl=0.0)
+    cache.put("bail", 0, 1, results("bail"))
+    reader = SearchCache(FileStorage(str(tmp_path)), ttl=0.0)
+    assert reader.get("bail", 0, 1) is None
+    assert reader.as_dict()["expirations"] == 1
+
+def test_async_api(tmp_path):
+    cache = SearchCache(FileStorage(str(tmp_path)))
+
+    async def run():
+        await cache.aput("bail", 0, 1, results("bail"))
+        other = SearchCache(FileStorage(str(tmp_path)))
+        return await cache.aget("bail", 0, 1), await other.aget("bail", 0, 1), await other.aget("dowry", 0, 1)
+
+    assert asyncio.run(run()) == (results("bail"), results("bail"), None)
@@ -7,12 +7,37 @@ const BACKEND_URL = process.env.BACKEND_URL || 'http://localhost:8000';
 
 export const runtime = 'edge';
 
-// Helper function to clean response text
-function formatResponse(text: string): string {
-  // Remove excessive whitespace while preserving paragraph breaks
-  return text
-    .replace(/\n{3,}/g, '\n\n')  // Replace 3+ consecutive newlines with just 2
-    .trim();  // Remove leading/trailing whitespace
+// Convert the backend's server-sent events into a plain text stream of the
+// answer. "token" events carry the LLM output; "error" events are shown as text.
+function sseToText(): TransformStream<Uint8Array, Uint8Array> {
+  const decoder = new TextDecoder();
+  const encoder = new TextEncoder();
+  let buffer = "";
+
+  return new TransformStream({
+    transform(chunk, controller) {
+      buffer += decoder.decode(chunk, { stream: true });
+      const events = buffer.split("\n\n");
+      buffer = events.pop() || "";
+
+      for (const block of events) {
+        let event = "message";
+        let data = "";
+        for (const line of block.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        if (!data) continue;
+
+        const payload = JSON.parse(data);
+        if (event === "token") {
+          controller.enqueue(encoder.encode(payload.text));
+        } else if (event === "error") {
+          controller.enqueue(encoder.encode(`\n\n${payload.detail || "Error processing request"}`));
+        }
+      }
+    },
+  });
 }
 
 export async function POST(req: NextRequest) {
@@ -28,52 +53,30 @@ export async function POST(req: NextRequest) {
     const lastUserMessage = body.messages[body.messages.length - 1];
     const query = lastUserMessage.content;
 
-    // Call backend API
-    const backendResponse = await fetch(`${BACKEND_URL}/chat`, {
+    // Call the streaming backend API
+    // The session cookie selects this client's model preference
+    const headers: Record<string, string> = { "Content-Type": "application/json" };
+    const cookie = req.headers.get("cookie");
+    if (cookie) headers["Cookie"] = cookie;
+    const backendResponse = await fetch(`${BACKEND_URL}/chat/stream`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers,
       body: JSON.stringify({ query }),
     });
 
-    // Get the raw backend data
-    const backendData = await backendResponse.json();
-    
-    // Format response for display
-    let responseText = "";
-    
-    if (backendData.response) {
-      const lawyerResponse = backendData.response.lawyer_response;
-      const modelUsed = backendData.response.model_used || 'unknown';
-      
-      // If we have a lawyer response, use that
-      if (lawyerResponse) {
-        responseText = formatResponse(lawyerResponse);
-      } else {
-        // Fallback to raw data format if no lawyer response
-        const entities = backendData.response.extracted_legal_entities || [];
-        const iKResults = backendData.response.indian_kanoon_results || {};
-        
-        responseText = `Query: ${query}\n\n`;
-        
-        if (entities.length > 0) {
-          responseText += `Entities: ${entities.join(', ')}\n\n`;
-        }
-        
-        responseText += `Results: ${JSON.stringify(iKResults, null, 2)}`;
-      }
-    } else {
-      responseText = JSON.stringify(backendData);
+    if (!backendResponse.ok || !backendResponse.body) {
+      const detail = await backendResponse.text();
+      console.error("Backend error:", backendResponse.status, detail);
+      return new Response("Error processing request", { status: 200 });
     }
-    
-    // Return a correctly formatted response for the frontend
-    const message: Message = {
-      id: Date.now().toString(),
-      role: "assistant",
-      content: responseText,
-      createdAt: new Date()
-    };
 
-    return new Response(JSON.stringify(message));
+    // Pass LLM tokens through as they arrive instead of waiting for the whole answer
+    return new Response(backendResponse.body.pipeThrough(sseToText()), {
+      headers: {
+        "Content-Type": "text/plain; charset=utf-8",
+        "Cache-Control": "no-cache",
+      },
+    });
     
   } catch (error) {
     console.error("Error:", error);
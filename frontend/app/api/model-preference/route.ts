@@ -2,12 +2,27 @@ import { NextRequest } from "next/server";
 
 const BACKEND_URL = process.env.BACKEND_URL || "http://localhost:8000";
 
-export async function GET() {
+// The preference is stored per client by the backend, keyed by its session
+// cookie, so forward the browser's cookie and pass the backend's back.
+function backendHeaders(req: NextRequest): HeadersInit {
+  const headers: Record<string, string> = { "Content-Type": "application/json" };
+  const cookie = req.headers.get("cookie");
+  if (cookie) headers["Cookie"] = cookie;
+  return headers;
+}
+
+function withBackendCookie(data: unknown, response: Response): Response {
+  const setCookie = response.headers.get("set-cookie");
+  return Response.json(data, setCookie ? { headers: { "Set-Cookie": setCookie } } : undefined);
+}
+
+export async function GET(req: NextRequest) {
   try {
-    // Get current model preference from backend
+    // Get this client's model preference from backend
     const response = await fetch(`${BACKEND_URL}/get-model-preference`, {
       method: "GET",
-      headers: { "Content-Type": "application/json" },
+      headers: backendHeaders(req),
+      cache: "no-store",
     });
 
     if (!response.ok) {
@@ -29,17 +44,17 @@ export async function POST(req: NextRequest) {
   try {
     const body = await req.json();
     
-    if (!body.model || !["mistral", "gemini"].includes(body.model)) {
+    if (!body.model || !["mistral", "gemini", "auto"].includes(body.model)) {
       return Response.json(
-        { error: "Invalid model specified. Must be 'mistral' or 'gemini'" },
+        { error: "Invalid model specified. Must be 'mistral', 'gemini' or 'auto'" },
         { status: 400 }
       );
     }
 
-    // Set model preference on backend
+    // Set this client's model preference on backend
     const response = await fetch(`${BACKEND_URL}/set-model-preference`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: backendHeaders(req),
       body: JSON.stringify({ model: body.model }),
     });
 
@@ -48,7 +63,7 @@ export async function POST(req: NextRequest) {
     }
 
     const data = await response.json();
-    return Response.json(data);
+    return withBackendCookie(data, response);
   } catch (error) {
     console.error("Error setting model preference:", error);
     return Response.json(